@@ -2,11 +2,17 @@
 A2A Core Module
 """
 
-from .a2a_server import A2AServer, A2AMessage
+from .a2a_message import A2AMessage, Codec, CodecError, CodecRegistry, JSONCodec, MsgPackCodec
+from .a2a_server import A2AServer
 from .a2a_client import A2AClient
 
 __all__ = [
     'A2AServer',
     'A2AMessage', 
-    'A2AClient'
+    'A2AClient',
+    'Codec',
+    'CodecError',
+    'CodecRegistry',
+    'JSONCodec',
+    'MsgPackCodec'
 ]
\ No newline at end of file
@@ -3,20 +3,30 @@ A2A Client for agent-to-agent communication
 """
 
 import httpx
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Set
 import json
 import logging
+import os
 
-from .a2a_server import A2AMessage
+from .a2a_message import A2AMessage, Codec, CodecRegistry
 
 logger = logging.getLogger(__name__)
 
 class A2AClient:
     """Client for communicating with A2A agents"""
     
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, codec: Optional[str] = None, codecs: Optional[CodecRegistry] = None):
         self.agent_id = agent_id
         self.client = httpx.AsyncClient()
+        self.codecs = codecs or CodecRegistry()
+        # A2A_CODEC: json | msgpack; unavailable codecs fall back to JSON
+        name = codec or os.environ.get("A2A_CODEC", "json")
+        self.codec = self.codecs.by_name(name)
+        if self.codec is None:
+            logger.warning(f"A2A codec '{name}' is not available; using {self.codecs.default.name}")
+            self.codec = self.codecs.default
+        # Agents that answered 415 to the preferred codec are sent the default instead
+        self._fallback_urls: Set[str] = set()
         
     async def discover_agent(self, agent_url: str) -> Dict[str, Any]:
         """Discover an agent by retrieving its card"""
@@ -45,16 +55,30 @@ class A2AClient:
         )
         
         try:
-            response = await self.client.post(
-                f"{agent_url}/execute_task",
-                json=message.to_dict()
-            )
+            codec = self.codecs.default if agent_url in self._fallback_urls else self.codec
+            response = await self._post_message(agent_url, message, codec)
+            if response.status_code == 415 and codec is not self.codecs.default:
+                logger.info(f"{agent_url} does not accept {codec.content_type}; falling back to {self.codecs.default.content_type}")
+                self._fallback_urls.add(agent_url)
+                response = await self._post_message(agent_url, message, self.codecs.default)
             response.raise_for_status()
-            return response.json()
+            reply_codec = self.codecs.for_content_type(response.headers.get("content-type")) or self.codecs.default
+            return reply_codec.decode(response.content).to_dict()
         except Exception as e:
             logger.error(f"Failed to execute task on {agent_url}: {str(e)}")
             raise
     
+    async def _post_message(self, agent_url: str, message: A2AMessage, codec: Codec) -> httpx.Response:
+        return await self.client.post(
+            f"{agent_url}/execute_task",
+            content=codec.encode(message),
+            headers={
+                "Content-Type": codec.content_type,
+                "Accept": self.codecs.accept_header(codec),
+                **message.envelope_headers()
+            }
+        )
+    
     async def query_capabilities(self, agent_url: str) -> Dict[str, Any]:
         """Query agent capabilities"""
         try:
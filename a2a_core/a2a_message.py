@@ -0,0 +1,213 @@
+"""
+A2A message envelope and its wire codecs
+JSON (always available) and MessagePack (needs the optional 'msgpack' package),
+picked per request from the Content-Type / Accept headers
+"""
+
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Sequence
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# Envelope fields mirrored into headers so a server can route before reading the body
+HEADER_MESSAGE_TYPE = "X-A2A-Message-Type"
+HEADER_SENDER = "X-A2A-Sender"
+HEADER_RECIPIENT = "X-A2A-Recipient"
+HEADER_CORRELATION_ID = "X-A2A-Correlation-Id"
+
+try:
+    import msgpack
+except ImportError:  # optional: pip install msgpack
+    msgpack = None
+
+class CodecError(ValueError):
+    """A body could not be decoded into an A2A message"""
+
+def _format_timestamp(value: float) -> str:
+    # The dict / JSON form keeps the naive-UTC ISO string A2A peers have always sent
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None).isoformat()
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    # ISO strings (naive UTC) from the dict form; epoch seconds from the tuple form
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid A2A timestamp: {value!r}")
+    # fromisoformat only accepts a trailing "Z" from Python 3.11 on
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+class A2AMessage:
+    """Standard A2A message format"""
+    __slots__ = ("message_type", "sender_id", "recipient_id", "payload", "correlation_id", "timestamp")
+    # `timestamp` is epoch seconds in memory and in the tuple form, ISO in to_dict()
+
+    def __init__(self,
+                 message_type: str,
+                 sender_id: str,
+                 recipient_id: str,
+                 payload: Dict[str, Any],
+                 correlation_id: Optional[str] = None,
+                 timestamp: Optional[float] = None):
+        self.message_type = message_type
+        self.sender_id = sender_id
+        self.recipient_id = recipient_id
+        self.payload = payload
+        self.correlation_id = correlation_id
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_type": self.message_type,
+            "sender_id": self.sender_id,
+            "recipient_id": self.recipient_id,
+            "payload": self.payload,
+            "correlation_id": self.correlation_id,
+            "timestamp": _format_timestamp(self.timestamp)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'A2AMessage':
+        return cls(
+            message_type=data["message_type"],
+            sender_id=data["sender_id"],
+            recipient_id=data["recipient_id"],
+            payload=data["payload"],
+            correlation_id=data.get("correlation_id"),
+            timestamp=_parse_timestamp(data.get("timestamp"))
+        )
+
+    def to_tuple(self) -> tuple:
+        """Positional form for compact codecs; the payload goes last"""
+        return (self.message_type, self.sender_id, self.recipient_id,
+                self.correlation_id, self.timestamp, self.payload)
+
+    @classmethod
+    def from_tuple(cls, fields: Sequence[Any]) -> 'A2AMessage':
+        message_type, sender_id, recipient_id, correlation_id, timestamp, payload = fields
+        return cls(message_type, sender_id, recipient_id, payload, correlation_id, _parse_timestamp(timestamp))
+
+    def envelope_headers(self) -> Dict[str, str]:
+        headers = {
+            HEADER_MESSAGE_TYPE: self.message_type,
+            HEADER_SENDER: self.sender_id,
+            HEADER_RECIPIENT: self.recipient_id,
+        }
+        if self.correlation_id is not None:
+            headers[HEADER_CORRELATION_ID] = self.correlation_id
+        return headers
+
+class Codec:
+    """Encodes an A2AMessage to bytes and back"""
+    name = ""
+    content_type = ""
+
+    def encode(self, message: A2AMessage) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> A2AMessage:
+        raise NotImplementedError
+
+class JSONCodec(Codec):
+    """The original wire format, without the whitespace"""
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(",", ":"), default=str)
+
+    def encode(self, message: A2AMessage) -> bytes:
+        return self._encoder.encode(message.to_dict()).encode()
+
+    def decode(self, data: bytes) -> A2AMessage:
+        try:
+            return A2AMessage.from_dict(json.loads(data))
+        except (ValueError, TypeError, KeyError) as e:
+            raise CodecError(f"Invalid JSON A2A message: {str(e)}")
+
+class MsgPackCodec(Codec):
+    """Envelope as a fixed-order array, so field names are not repeated on the wire"""
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("MessagePack codec needs the 'msgpack' package")
+        self._packer = msgpack.Packer(use_bin_type=True, default=str)
+
+    def encode(self, message: A2AMessage) -> bytes:
+        return self._packer.pack(message.to_tuple())
+
+    def decode(self, data: bytes) -> A2AMessage:
+        try:
+            return A2AMessage.from_tuple(msgpack.unpackb(data, raw=False, strict_map_key=False))
+        except (ValueError, TypeError, msgpack.UnpackException) as e:
+            raise CodecError(f"Invalid MessagePack A2A message: {str(e)}")
+
+class CodecRegistry:
+    """Available codecs by media type, and Accept / Content-Type negotiation over them"""
+
+    def __init__(self, codecs: Optional[List[Codec]] = None):
+        self._codecs: Dict[str, Codec] = {}
+        self.default = None
+        for codec in codecs if codecs is not None else default_codecs():
+            self.register(codec)
+
+    def register(self, codec: Codec):
+        self._codecs[codec.content_type] = codec
+        if self.default is None:
+            self.default = codec
+
+    @property
+    def content_types(self) -> List[str]:
+        return list(self._codecs)
+
+    def by_name(self, name: str) -> Optional[Codec]:
+        return next((codec for codec in self._codecs.values() if codec.name == name), None)
+
+    def for_content_type(self, content_type: Optional[str]) -> Optional[Codec]:
+        """Codec for a request body; a missing Content-Type is read as the default (JSON)"""
+        media_type = (content_type or "").split(";", 1)[0].strip().lower()
+        if not media_type:
+            return self.default
+        return self._codecs.get(media_type)
+
+    def negotiate(self, accept: Optional[str]) -> Codec:
+        """Highest-q codec the Accept header allows; the default when nothing matches"""
+        if not accept:
+            return self.default
+        best, best_q = None, 0.0
+        for item in accept.split(","):
+            media_type, *params = [p.strip() for p in item.split(";")]
+            q = 1.0
+            for param in params:
+                if param.startswith("q="):
+                    try:
+                        q = float(param[2:])
+                    except ValueError:
+                        q = 0.0
+            if media_type in ("*/*", "application/*"):
+                codec = self.default
+            else:
+                codec = self._codecs.get(media_type.lower())
+            if codec is not None and q > best_q:
+                best, best_q = codec, q
+        return best or self.default
+
+    def accept_header(self, preferred: Codec) -> str:
+        """Ask for `preferred`, with everything else registered as a fallback"""
+        others = [f"{ct};q=0.5" for ct in self._codecs if ct != preferred.content_type]
+        return ", ".join([preferred.content_type, *others])
+
+def default_codecs() -> List[Codec]:
+    codecs: List[Codec] = [JSONCodec()]
+    if msgpack is not None:
+        codecs.append(MsgPackCodec())
+    return codecs
@@ -3,62 +3,103 @@ A2A Server implementation for agent-to-agent communication
 Based on a2a-samples patterns
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
 import json
 import logging
-from datetime import datetime
+import os
 
 from adk_core.base_agent import BaseAgent, AgentCard
 from adk_core.agent_executor import AgentExecutor
 
+from .a2a_message import (
+    A2AMessage, CodecError, CodecRegistry,
+    HEADER_MESSAGE_TYPE, HEADER_SENDER, HEADER_RECIPIENT, HEADER_CORRELATION_ID
+)
+
 logger = logging.getLogger(__name__)
 
-class A2AMessage:
-    """Standard A2A message format"""
-    def __init__(self, 
-                 message_type: str,
-                 sender_id: str,
-                 recipient_id: str,
-                 payload: Dict[str, Any],
-                 correlation_id: Optional[str] = None):
-        self.message_type = message_type
-        self.sender_id = sender_id
-        self.recipient_id = recipient_id
-        self.payload = payload
-        self.correlation_id = correlation_id
-        self.timestamp = datetime.utcnow()
-        
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "message_type": self.message_type,
-            "sender_id": self.sender_id,
-            "recipient_id": self.recipient_id,
-            "payload": self.payload,
-            "correlation_id": self.correlation_id,
-            "timestamp": self.timestamp.isoformat()
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'A2AMessage':
-        return cls(
-            message_type=data["message_type"],
-            sender_id=data["sender_id"],
-            recipient_id=data["recipient_id"],
-            payload=data["payload"],
-            correlation_id=data.get("correlation_id")
-        )
+MAX_ID_LENGTH = 256  # sender / recipient / correlation_id
 
 class A2AServer:
     """A2A Server hosting an agent"""
     
-    def __init__(self, agent: BaseAgent, port: int = 8000):
+    def __init__(self,
+                 agent: BaseAgent,
+                 port: int = 8000,
+                 codecs: Optional[CodecRegistry] = None,
+                 max_body_bytes: Optional[int] = None,
+                 accepted_types: tuple = ("execute_task",)):
         self.agent = agent
         self.executor = AgentExecutor(agent)
         self.port = port
-        self.app = FastAPI(title=f"A2A Server - {agent.agent_card.name}")
+        self.codecs = codecs or CodecRegistry()
+        # A2A_MAX_BODY_BYTES: largest /execute_task body accepted (0 = unlimited)
+        self.max_body_bytes = max_body_bytes if max_body_bytes is not None else int(
+            os.environ.get("A2A_MAX_BODY_BYTES", str(1024 * 1024))
+        )
+        self.accepted_types = accepted_types
+        self.accepted = 0
+        self.rejected: Dict[str, int] = {"unsupported_media_type": 0, "too_large": 0, "envelope": 0, "invalid": 0}
+        self.app = FastAPI(title=f"A2A Server - {agent.agent_card.name}", lifespan=self._lifespan)
         self._setup_routes()
         
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """Tie the agent's long-lived resources to the server lifecycle"""
+        await self.agent.startup()
+        try:
+            yield
+        finally:
+            await self.agent.shutdown()
+        
+    def _reject(self, reason: str, status_code: int, detail: str) -> HTTPException:
+        self.rejected[reason] += 1
+        return HTTPException(status_code=status_code, detail=detail)
+    
+    def _check_envelope(self,
+                        message_type: Optional[str],
+                        sender_id: Optional[str],
+                        recipient_id: Optional[str],
+                        correlation_id: Optional[str]):
+        """Routing checks that need nothing but the envelope fields"""
+        if message_type not in self.accepted_types:
+            raise self._reject("envelope", 400, f"Unsupported A2A message type: {message_type}")
+        if not isinstance(sender_id, str) or not sender_id or len(sender_id) > MAX_ID_LENGTH:
+            raise self._reject("envelope", 400, "Invalid A2A sender")
+        if recipient_id != self.agent.agent_card.agent_id:
+            raise self._reject("envelope", 400, "Message not intended for this agent")
+        if correlation_id is not None and (not isinstance(correlation_id, str) or len(correlation_id) > MAX_ID_LENGTH):
+            raise self._reject("envelope", 400, "Invalid A2A correlation_id")
+    
+    async def _read_body(self, request: Request) -> bytes:
+        """The request body, refused with 413 as soon as it is known to exceed max_body_bytes"""
+        limit = self.max_body_bytes
+        if limit <= 0:
+            return await request.body()
+        try:
+            declared = int(request.headers.get("content-length", "0"))
+        except ValueError:
+            raise self._reject("invalid", 400, "Invalid Content-Length")
+        if declared > limit:
+            raise self._reject("too_large", 413, f"A2A message exceeds {limit} bytes")
+        # Chunked bodies (or a lying Content-Length) are counted as they arrive
+        body = bytearray()
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > limit:
+                raise self._reject("too_large", 413, f"A2A message exceeds {limit} bytes")
+        return bytes(body)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "content_types": self.codecs.content_types,
+            "max_body_bytes": self.max_body_bytes,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+        }
+    
     def _setup_routes(self):
         """Setup FastAPI routes for A2A communication"""
         
@@ -70,17 +111,36 @@ class A2AServer:
         @self.app.post("/execute_task")
         async def execute_task(request: Request):
             """Execute a task sent via A2A protocol"""
-            data = await request.json()
+            codec = self.codecs.for_content_type(request.headers.get("content-type"))
+            if codec is None:
+                raise self._reject(
+                    "unsupported_media_type", 415,
+                    f"Unsupported A2A content type; use one of {', '.join(self.codecs.content_types)}"
+                )
+            
+            # Route on the envelope headers before reading or decoding the payload
+            headers = request.headers
+            envelope = None
+            if HEADER_RECIPIENT in headers:
+                envelope = (headers.get(HEADER_MESSAGE_TYPE), headers.get(HEADER_SENDER),
+                            headers.get(HEADER_RECIPIENT), headers.get(HEADER_CORRELATION_ID))
+                self._check_envelope(*envelope)
             
             # Parse A2A message
+            body = await self._read_body(request)
             try:
-                message = A2AMessage.from_dict(data)
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Invalid A2A message: {str(e)}")
+                message = codec.decode(body)
+            except CodecError as e:
+                raise self._reject("invalid", 400, str(e))
             
-            # Verify this agent is the recipient
-            if message.recipient_id != self.agent.agent_card.agent_id:
-                raise HTTPException(status_code=400, detail="Message not intended for this agent")
+            # Clients without envelope headers are checked after decoding; with them, the
+            # decoded envelope must be the one that was routed
+            decoded = (message.message_type, message.sender_id, message.recipient_id, message.correlation_id)
+            if envelope is None:
+                self._check_envelope(*decoded)
+            elif decoded != envelope:
+                raise self._reject("envelope", 400, "A2A envelope headers do not match the message")
+            self.accepted += 1
             
             # Execute the task
             result = await self.executor.execute(message.payload)
@@ -94,12 +154,14 @@ class A2AServer:
                 correlation_id=message.correlation_id
             )
             
-            return response.to_dict()
+            # Answer in the caller's preferred encoding
+            reply_codec = self.codecs.negotiate(request.headers.get("accept"))
+            return Response(content=reply_codec.encode(response), media_type=reply_codec.content_type)
         
         @self.app.get("/status")
         async def get_status():
             """Get agent status"""
-            return self.executor.get_status()
+            return {**self.executor.get_status(), "a2a": self.get_stats()}
         
         @self.app.get("/capabilities")
         async def get_capabilities():
@@ -107,7 +169,8 @@ class A2AServer:
             return {
                 "agent_id": self.agent.agent_card.agent_id,
                 "capabilities": self.agent.agent_card.capabilities,
-                "tools": self.agent.agent_card.tools
+                "tools": self.agent.agent_card.tools,
+                "content_types": self.codecs.content_types
             }
         
         @self.app.post("/query_tool")
@@ -0,0 +1,9 @@
+"""
+Test setup for the shared A2A package
+Imported as `a2a_core`, the way every agent imports it
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from a2a_core.a2a_message import A2AMessage, CodecError, CodecRegistry, JSONCodec, msgpack
+
+def make_message() -> A2AMessage:
+    return A2AMessage("execute_task", "good_agent", "personal_agent", {"type": "x", "ids": [1, 2]},
+                      correlation_id="c1", timestamp=1704067200.5)
+
+def test_to_dict_keeps_the_iso_timestamp():
+    data = make_message().to_dict()
+    assert data["timestamp"] == "2024-01-01T00:00:00.500000"
+    # Older peers parse it exactly like this
+    assert datetime.fromisoformat(data["timestamp"]) == datetime(2024, 1, 1, 0, 0, 0, 500000)
+
+def test_from_dict_round_trips_iso_and_accepts_epoch_seconds():
+    message = make_message()
+    assert A2AMessage.from_dict(message.to_dict()).timestamp == message.timestamp
+    assert A2AMessage.from_dict({**message.to_dict(), "timestamp": 1704067200.5}).timestamp == message.timestamp
+
+def test_from_dict_accepts_a_z_suffixed_timestamp():
+    message = make_message()
+    for timestamp in ("2024-01-01T00:00:00.500000Z", "2024-01-01T00:00:00.500000+00:00"):
+        assert A2AMessage.from_dict({**message.to_dict(), "timestamp": timestamp}).timestamp == message.timestamp
+
+@pytest.mark.parametrize("timestamp", [{}, [], "yesterday"])
+def test_malformed_timestamp_is_a_codec_error(timestamp):
+    with pytest.raises(ValueError):
+        A2AMessage.from_dict({**make_message().to_dict(), "timestamp": timestamp})
+    wire = json.dumps({**make_message().to_dict(), "timestamp": timestamp}).encode()
+    with pytest.raises(CodecError):
+        JSONCodec().decode(wire)
+
+def test_json_codec_sends_the_dict_form():
+    wire = JSONCodec().encode(make_message())
+    assert b'"timestamp":"2024-01-01T00:00:00.500000"' in wire
+    decoded = JSONCodec().decode(wire)
+    assert decoded.to_dict() == make_message().to_dict()
+
+def test_json_codec_rejects_malformed_bodies():
+    with pytest.raises(CodecError):
+        JSONCodec().decode(b'{"message_type": "execute_task"}')
+
+@pytest.mark.skipif(msgpack is None, reason="msgpack is not installed")
+def test_msgpack_tuple_form_carries_epoch_seconds():
+    codec = CodecRegistry().by_name("msgpack")
+    wire = codec.encode(make_message())
+    assert msgpack.unpackb(wire)[4] == 1704067200.5
+    assert codec.decode(wire).to_dict() == make_message().to_dict()
+
+def test_negotiation_prefers_the_highest_q_supported_type():
+    registry = CodecRegistry([JSONCodec()])
+    assert registry.negotiate("application/msgpack, application/json;q=0.5").name == "json"
+    assert registry.negotiate(None).name == "json"
+    assert registry.for_content_type("text/plain") is None
+    assert registry.for_content_type("application/json; charset=utf-8").name == "json"
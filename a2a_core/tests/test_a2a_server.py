@@ -0,0 +1,115 @@
+import asyncio
+from typing import Dict, Any, List
+
+import httpx
+
+from adk_core.base_agent import AgentCard, BaseAgent
+from a2a_core.a2a_message import A2AMessage, JSONCodec
+from a2a_core.a2a_server import A2AServer
+
+class EchoAgent(BaseAgent):
+    def __init__(self):
+        super().__init__(AgentCard(
+            agent_id="personal_agent", name="Echo", description="Echoes tasks", version="1.0.0",
+            capabilities=[], tools=[], endpoints={}, metadata={}
+        ))
+        self.tasks: List[Dict[str, Any]] = []
+
+    async def execute_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        self.tasks.append(task)
+        return {"echo": task}
+
+def make_server(**kwargs) -> A2AServer:
+    return A2AServer(EchoAgent(), max_body_bytes=kwargs.pop("max_body_bytes", 1024), **kwargs)
+
+def message(recipient_id: str = "personal_agent", payload: Any = None) -> A2AMessage:
+    return A2AMessage("execute_task", "good_agent", recipient_id, payload or {"type": "ping"}, correlation_id="c1")
+
+def post(server: A2AServer, content, headers: Dict[str, str]) -> httpx.Response:
+    async def go():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+            return await client.post("/execute_task", content=content, headers=headers)
+    return asyncio.run(go())
+
+def send(server: A2AServer, msg: A2AMessage, **headers) -> httpx.Response:
+    return post(server, JSONCodec().encode(msg), {
+        "Content-Type": "application/json", **msg.envelope_headers(), **headers
+    })
+
+def test_routed_message_is_executed_and_answered():
+    server = make_server()
+    res = send(server, message())
+
+    assert res.status_code == 200
+    reply = JSONCodec().decode(res.content)
+    assert reply.message_type == "task_response"
+    assert reply.recipient_id == "good_agent"
+    assert reply.correlation_id == "c1"
+    assert server.agent.tasks == [{"type": "ping"}]
+    assert server.get_stats()["accepted"] == 1
+
+def test_message_without_envelope_headers_is_routed_from_the_body():
+    server = make_server()
+    res = post(server, JSONCodec().encode(message()), {"Content-Type": "application/json"})
+
+    assert res.status_code == 200
+    assert server.agent.tasks == [{"type": "ping"}]
+
+def test_misrouted_recipient_header_is_rejected_before_the_body_is_decoded():
+    server = make_server()
+    headers = {"Content-Type": "application/json", **message("other_agent").envelope_headers()}
+    # Not even valid JSON: only the envelope headers may have been looked at
+    res = post(server, b"{not json", headers)
+
+    assert res.status_code == 400
+    assert "not intended" in res.json()["detail"]
+    assert server.rejected["envelope"] == 1
+    assert server.rejected["invalid"] == 0
+    assert server.agent.tasks == []
+
+def test_headers_that_disagree_with_the_body_are_rejected():
+    server = make_server()
+    res = post(server, JSONCodec().encode(message(payload={"type": "x"})), {
+        "Content-Type": "application/json",
+        **message().envelope_headers(),
+        "X-A2A-Sender": "someone_else",
+    })
+
+    assert res.status_code == 400
+    assert server.agent.tasks == []
+
+def test_declared_oversized_body_is_rejected():
+    server = make_server(max_body_bytes=64)
+    res = send(server, message(payload={"type": "x", "blob": "a" * 500}))
+
+    assert res.status_code == 413
+    assert server.rejected["too_large"] == 1
+
+def test_oversized_chunked_body_without_content_length_is_rejected():
+    server = make_server(max_body_bytes=64)
+    body = JSONCodec().encode(message(payload={"type": "x", "blob": "a" * 500}))
+
+    async def chunks():
+        for i in range(0, len(body), 16):
+            yield body[i:i + 16]
+
+    res = post(server, chunks(), {"Content-Type": "application/json", **message().envelope_headers()})
+
+    assert res.status_code == 413
+    assert server.agent.tasks == []
+
+def test_body_larger_than_its_content_length_is_rejected():
+    server = make_server(max_body_bytes=64)
+    body = JSONCodec().encode(message(payload={"type": "x", "blob": "a" * 500}))
+
+    res = post(server, body, {"Content-Type": "application/json", "Content-Length": "10",
+                              **message().envelope_headers()})
+
+    assert res.status_code == 413
+    assert server.agent.tasks == []
+
+def test_unknown_content_type_is_refused():
+    server = make_server()
+    res = send(server, message(), **{"Content-Type": "text/plain"})
+    assert res.status_code == 415
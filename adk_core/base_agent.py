@@ -121,6 +121,14 @@ class BaseAgent(ABC):
         if self._before_agent_callback:
             await self._before_agent_callback(self.session_state)
     
+    async def startup(self):
+        """Start long-lived resources when the hosting server starts"""
+        pass
+    
+    async def shutdown(self):
+        """Release long-lived resources when the hosting server stops"""
+        pass
+    
     def get_agent_card(self) -> AgentCard:
         """Return the agent's card for discovery"""
         return self.agent_card
@@ -0,0 +1,109 @@
+"""
+Throughput and wire-size benchmark for A2A message codecs
+Encodes and decodes task_response envelopes carrying generated email listings with
+every available codec, next to the pre-codec path (json.dumps of to_dict() with the
+default separators, then json.loads + from_dict).
+
+    python benchmarks/a2a_codec_bench.py --emails 1 10 50 --body-chars 2000
+    python benchmarks/a2a_codec_bench.py --iterations 5000 --output results.json
+
+Results are written as JSON; MessagePack is skipped when 'msgpack' is not installed.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+from typing import Dict, Any, Callable, List
+
+from a2a_core.a2a_message import A2AMessage, CodecRegistry
+
+WORDS = ["quarterly", "invoice", "meeting", "agenda", "delegation", "review", "travel", "budget", "draft", "follow-up"]
+
+def generate_response(emails: int, body_chars: int, rng: random.Random) -> A2AMessage:
+    """A task_response like the personal agent returns for a delegated Gmail read"""
+    messages = []
+    for i in range(emails):
+        body = " ".join(rng.choice(WORDS) for _ in range(body_chars // 8))[:body_chars]
+        messages.append({
+            "id": f"18c{rng.getrandbits(48):012x}",
+            "threadId": f"18c{rng.getrandbits(48):012x}",
+            "labelIds": ["INBOX", "UNREAD"] if i % 3 else ["INBOX"],
+            "snippet": body[:100],
+            "headers": {"From": f"sender{i}@example.com", "Subject": f"Message {i}", "Date": "Mon, 1 Jan 2024 10:00:00 +0000"},
+            "body": body,
+        })
+    payload = {"status": "completed", "data": {"emails": messages, "count": emails}, "error": None,
+               "timestamp": datetime.utcnow().isoformat()}
+    return A2AMessage("task_response", "personal_agent", "good_agent", payload, correlation_id="bench-1")
+
+def legacy_encode(message: A2AMessage) -> bytes:
+    return json.dumps(message.to_dict()).encode()
+
+def legacy_decode(data: bytes) -> A2AMessage:
+    return A2AMessage.from_dict(json.loads(data))
+
+def ops_per_second(fn: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - started)
+
+def bench(name: str, encode: Callable[[A2AMessage], bytes], decode: Callable[[bytes], A2AMessage],
+          message: A2AMessage, iterations: int) -> Dict[str, Any]:
+    wire = encode(message)
+    decoded = decode(wire)
+    assert decoded.payload == message.payload and decoded.correlation_id == message.correlation_id
+    return {
+        "codec": name,
+        "bytes": len(wire),
+        "encode_ops_per_s": round(ops_per_second(lambda: encode(message), iterations)),
+        "decode_ops_per_s": round(ops_per_second(lambda: decode(wire), iterations)),
+    }
+
+def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    codecs = CodecRegistry()
+    runs: List[Dict[str, Any]] = []
+    for emails in args.emails:
+        message = generate_response(emails, args.body_chars, rng)
+        results = [bench("legacy", legacy_encode, legacy_decode, message, args.iterations)]
+        for content_type in codecs.content_types:
+            codec = codecs.for_content_type(content_type)
+            results.append(bench(codec.name, codec.encode, codec.decode, message, args.iterations))
+        baseline = results[0]["bytes"]
+        for result in results:
+            result["bytes_vs_legacy"] = round(result["bytes"] / baseline, 3)
+        runs.append({"emails": emails, "results": results})
+
+    report = {
+        "iterations": args.iterations,
+        "body_chars": args.body_chars,
+        "codecs": [codecs.for_content_type(ct).name for ct in codecs.content_types],
+        "runs": runs,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark A2A codec throughput and bytes on the wire")
+    parser.add_argument("--emails", type=int, nargs="+", default=[0, 10, 50], help="emails per task_response")
+    parser.add_argument("--body-chars", type=int, default=1000, help="body size per email")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,115 @@
+"""
+CPU cost of rejecting unwanted A2A messages
+Posts misrouted and oversized /execute_task messages to an in-process A2AServer and
+measures process CPU time per request, for clients that decode-then-check (no
+envelope headers, no body limit, i.e. the old server path) and for envelope-first
+routing with a max body size.
+
+    python benchmarks/a2a_reject_bench.py --payload-kb 64 256 --requests 300
+    python benchmarks/a2a_reject_bench.py --max-body-kb 128 --output results.json
+
+Results are written as JSON; the point is how little CPU a rejection costs.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+import httpx
+
+from adk_core.base_agent import BaseAgent, AgentCard
+from a2a_core.a2a_message import A2AMessage, JSONCodec
+from a2a_core.a2a_server import A2AServer
+
+class EchoAgent(BaseAgent):
+    async def initialize(self):
+        pass
+
+    async def process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+
+    async def execute_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        return {"received": len(task)}
+
+def make_server(max_body_bytes: int) -> A2AServer:
+    card = AgentCard("bench_agent", "Bench Agent", "Echoes tasks", "1.0", [], [], {}, {})
+    return A2AServer(EchoAgent(card), max_body_bytes=max_body_bytes)
+
+def make_message(recipient_id: str, payload_kb: int) -> A2AMessage:
+    task = {"type": "read_emails", "emails": [{"id": str(i), "body": "x" * 1000} for i in range(payload_kb)]}
+    return A2AMessage("execute_task", "flooding_agent", recipient_id, task, correlation_id="bench")
+
+async def run(server: A2AServer, message: A2AMessage, envelope_headers: bool, requests: int) -> Dict[str, Any]:
+    codec = JSONCodec()
+    body = codec.encode(message)
+    headers = {"Content-Type": codec.content_type}
+    if envelope_headers:
+        headers.update(message.envelope_headers())
+    statuses: Dict[int, int] = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench") as client:
+        started = time.process_time()
+        for _ in range(requests):
+            response = await client.post("/execute_task", content=body, headers=headers)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        cpu = time.process_time() - started
+    return {
+        "body_bytes": len(body),
+        "statuses": statuses,
+        "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+    }
+
+async def main(args: argparse.Namespace) -> int:
+    limit = args.max_body_kb * 1024
+    modes = [
+        ("decode_first", False, 0),          # old path: decode everything, then check the recipient
+        ("envelope_first", True, limit),
+    ]
+    runs: List[Dict[str, Any]] = []
+    for payload_kb in args.payload_kb:
+        traffic = {
+            "misrouted": make_message("some_other_agent", payload_kb),
+            "oversized": make_message("bench_agent", max(payload_kb, args.max_body_kb * 2)),
+        }
+        for kind, message in traffic.items():
+            results = {}
+            for mode, envelope_headers, max_body_bytes in modes:
+                results[mode] = await run(make_server(max_body_bytes), message, envelope_headers, args.requests)
+            before = results["decode_first"]["cpu_us_per_request"]
+            after = results["envelope_first"]["cpu_us_per_request"]
+            runs.append({
+                "traffic": kind,
+                "payload_kb": payload_kb,
+                "results": results,
+                "cpu_reduction": round(1 - after / before, 3) if before else 0.0,
+            })
+
+    report = {
+        "requests": args.requests,
+        "max_body_kb": args.max_body_kb,
+        "runs": runs,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark CPU spent rejecting misrouted and oversized A2A messages")
+    parser.add_argument("--payload-kb", type=int, nargs="+", default=[16, 256], help="approximate task payload size")
+    parser.add_argument("--max-body-kb", type=int, default=128, help="A2A_MAX_BODY_BYTES for the envelope-first server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
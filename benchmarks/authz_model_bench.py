@@ -0,0 +1,323 @@
+"""
+Authorization model test and benchmark harness for gmail_authz.fga
+Loads the model with a generated fixture (users, manager agents, delegated
+agents), runs the declarative assertions and measures per-relation check
+latency against the in-process evaluator or a local OpenFGA server.
+
+    python benchmarks/authz_model_bench.py --users 100000 --agents 50 --managers 5
+    python benchmarks/authz_model_bench.py --backend remote --openfga-url http://localhost:8080 \\
+        --users 10000 --output results.json
+
+Results are written as JSON so runs against different model revisions can be diffed.
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "personal_agent"))
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Dict, Any, List, Tuple
+
+import httpx
+
+from fga_evaluator import AuthorizationModel, LocalCheckEvaluator, default_model_path
+from fga_bootstrap import model_hash
+
+TupleKey = Tuple[str, str, str]  # (user, relation, object)
+
+class Fixture:
+    """Generated tuples plus the role of every subject per account"""
+
+    def __init__(self, users: int, agents: int, managers: int, delegation_ratio: float, seed: int):
+        rng = random.Random(seed)
+        self.tuples: List[TupleKey] = []
+        self.accounts: List[str] = []
+        self.owners: Dict[str, str] = {}
+        self.managers: Dict[str, str] = {}
+        self.readers: Dict[str, str] = {}
+        self.agent_ids = [f"agent:agent_{k}" for k in range(agents)]
+
+        for i in range(users):
+            owner = f"user:u{i}"
+            account = f"gmail_account:{owner}"
+            manager = f"agent:manager_{i % managers}"
+            self.accounts.append(account)
+            self.owners[account] = owner
+            self.managers[account] = manager
+            self.tuples.append((owner, "owner", account))
+            self.tuples.append((manager, "manager", account))
+            if self.agent_ids and rng.random() < delegation_ratio:
+                reader = rng.choice(self.agent_ids)
+                self.readers[account] = reader
+                self.tuples.append((reader, "temporary_reader", account))
+
+    def stranger(self, account: str, rng: random.Random) -> str:
+        """An agent with no tuple on the account"""
+        candidates = [a for a in self.agent_ids if a != self.readers.get(account)]
+        return rng.choice(candidates) if candidates else "agent:stranger"
+
+    def resolve(self, placeholder: str, account: str, rng: random.Random) -> str:
+        if placeholder == "$owner":
+            return self.owners[account]
+        if placeholder == "$manager":
+            return self.managers[account]
+        if placeholder == "$reader":
+            return self.readers[account]
+        if placeholder == "$stranger":
+            return self.stranger(account, rng)
+        return placeholder
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.accounts),
+            "agents": len(self.agent_ids),
+            "managers": len(set(self.managers.values())),
+            "delegations": len(self.readers),
+            "tuples": len(self.tuples),
+        }
+
+class LocalBackend:
+    """In-process evaluator fed directly from the fixture"""
+
+    name = "local"
+
+    def __init__(self, model: AuthorizationModel):
+        self.evaluator = LocalCheckEvaluator(model, "", "")
+
+    async def load(self, fixture: Fixture):
+        for user, relation, object_id in fixture.tuples:
+            self.evaluator.mirror.write(user, relation, object_id)
+
+    async def check(self, user: str, relation: str, object_id: str) -> bool:
+        return self.evaluator.check(user, relation, object_id)
+
+    async def close(self):
+        pass
+
+class RemoteBackend:
+    """A fresh store on an OpenFGA server with the model uploaded and the fixture written"""
+
+    name = "remote"
+
+    def __init__(self, model: AuthorizationModel, openfga_url: str, concurrency: int):
+        self.model = model
+        self.openfga_url = openfga_url
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+        self.store_id = None
+        self.model_id = None
+
+    async def load(self, fixture: Fixture):
+        res = await self.client.post(f"{self.openfga_url}/stores", json={"name": f"authz-bench-{int(time.time())}"})
+        res.raise_for_status()
+        self.store_id = res.json()["id"]
+
+        res = await self.client.post(
+            f"{self.openfga_url}/stores/{self.store_id}/authorization-models",
+            json=self.model.to_json()
+        )
+        res.raise_for_status()
+        self.model_id = res.json()["authorization_model_id"]
+
+        # OpenFGA accepts at most 100 tuples per write
+        chunks = [fixture.tuples[i:i + 100] for i in range(0, len(fixture.tuples), 100)]
+
+        async def write(chunk: List[TupleKey]):
+            async with self.semaphore:
+                res = await self.client.post(
+                    f"{self.openfga_url}/stores/{self.store_id}/write",
+                    json={
+                        "writes": {"tuple_keys": [{"user": u, "relation": r, "object": o} for u, r, o in chunk]},
+                        "authorization_model_id": self.model_id,
+                    }
+                )
+                res.raise_for_status()
+
+        await asyncio.gather(*[write(chunk) for chunk in chunks])
+
+    async def check(self, user: str, relation: str, object_id: str) -> bool:
+        async with self.semaphore:
+            res = await self.client.post(
+                f"{self.openfga_url}/stores/{self.store_id}/check",
+                json={
+                    "tuple_key": {"user": user, "relation": relation, "object": object_id},
+                    "authorization_model_id": self.model_id,
+                }
+            )
+        res.raise_for_status()
+        return res.json().get("allowed", False)
+
+    async def close(self):
+        if self.store_id:
+            await self.client.delete(f"{self.openfga_url}/stores/{self.store_id}")
+        await self.client.aclose()
+
+async def run_assertions(backend, fixture: Fixture, assertions: List[Dict[str, Any]],
+                         samples: int, rng: random.Random) -> Dict[str, Any]:
+    """Evaluate every assertion on `samples` accounts that hold a delegation"""
+    delegated = [a for a in fixture.accounts if a in fixture.readers] or fixture.accounts
+    accounts = rng.sample(delegated, min(samples, len(delegated)))
+    passed = 0
+    skipped = 0
+    failures = []
+
+    for assertion in assertions:
+        for account in accounts:
+            # With no delegations in the fixture (--agents 0 or a zero ratio) there is no reader to test
+            if assertion["user"] == "$reader" and account not in fixture.readers:
+                skipped += 1
+                continue
+            user = fixture.resolve(assertion["user"], account, rng)
+            allowed = await backend.check(user, assertion["relation"], account)
+            if allowed == assertion["expected"]:
+                passed += 1
+            else:
+                failures.append({
+                    "name": assertion["name"],
+                    "user": user,
+                    "relation": assertion["relation"],
+                    "object": account,
+                    "expected": assertion["expected"],
+                    "actual": allowed,
+                })
+
+    return {"passed": passed, "failed": len(failures), "skipped": skipped, "failures": failures[:50]}
+
+def summarize(latencies_us: List[float], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies_us)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+    return {
+        "checks": len(ordered),
+        "mean_us": round(statistics.fmean(ordered), 2),
+        "p50_us": pct(0.50),
+        "p90_us": pct(0.90),
+        "p99_us": pct(0.99),
+        "max_us": round(ordered[-1], 2),
+        "checks_per_sec": round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+async def measure_latency(backend, fixture: Fixture, relations: List[str],
+                          checks: int, concurrency: int, rng: random.Random) -> Dict[str, Any]:
+    """Per-relation latency over a mix of owners, managers, readers and strangers"""
+    results = {}
+    roles = ("$owner", "$manager", "$reader", "$stranger")
+
+    for relation in relations:
+        queries = []
+        for _ in range(checks):
+            account = rng.choice(fixture.accounts)
+            role = rng.choice(roles)
+            if role == "$reader" and account not in fixture.readers:
+                role = "$stranger"
+            queries.append((fixture.resolve(role, account, rng), account))
+
+        latencies: List[float] = []
+
+        async def timed(user: str, account: str):
+            start = time.perf_counter_ns()
+            await backend.check(user, relation, account)
+            latencies.append((time.perf_counter_ns() - start) / 1000)
+
+        started = time.perf_counter()
+        for i in range(0, len(queries), concurrency):
+            await asyncio.gather(*[timed(u, a) for u, a in queries[i:i + concurrency]])
+        results[relation] = summarize(latencies, time.perf_counter() - started)
+
+    return results
+
+async def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    model = AuthorizationModel.from_file(args.model)
+    with open(args.assertions, "r") as f:
+        assertions = json.load(f)["assertions"]
+
+    fixture = Fixture(args.users, args.agents, args.managers, args.delegation_ratio, args.seed)
+    if args.backend == "remote":
+        backend = RemoteBackend(model, args.openfga_url, args.concurrency)
+    else:
+        backend = LocalBackend(model)
+
+    try:
+        load_started = time.perf_counter()
+        await backend.load(fixture)
+        load_seconds = time.perf_counter() - load_started
+
+        assertion_results = await run_assertions(backend, fixture, assertions, args.samples, rng)
+        relations = list(model.type_definitions.get(args.object_type, {}).keys())
+        latency = await measure_latency(
+            backend, fixture, relations, args.checks,
+            args.concurrency if args.backend == "remote" else 1, rng
+        )
+    finally:
+        await backend.close()
+
+    report = {
+        "model": os.path.relpath(args.model),
+        "model_hash": model_hash(model.to_json()),
+        "backend": backend.name,
+        "seed": args.seed,
+        "fixture": fixture.describe(),
+        "load_seconds": round(load_seconds, 3),
+        "assertions": assertion_results,
+        "latency": latency,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for failure in assertion_results["failures"]:
+        print(f"FAILED: {failure['name']} ({failure['user']} {failure['relation']} {failure['object']})", file=sys.stderr)
+    return 1 if assertion_results["failed"] else 0
+
+def at_least(minimum: int):
+    """argparse type for integers >= minimum"""
+    def parse(value: str) -> int:
+        number = int(value)
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {number}")
+        return number
+    return parse
+
+def ratio(value: str) -> float:
+    """argparse type for a fraction in [0, 1]"""
+    number = float(value)
+    if not 0.0 <= number <= 1.0:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1, got {number}")
+    return number
+
+def parse_args() -> argparse.Namespace:
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Test and benchmark an OpenFGA authorization model")
+    parser.add_argument("--model", default=default_model_path())
+    parser.add_argument("--assertions", default=os.path.join(repo_root, "openfga_model", "gmail_authz.assertions.json"))
+    parser.add_argument("--object-type", default="gmail_account")
+    parser.add_argument("--backend", choices=("local", "remote"), default="local")
+    parser.add_argument("--openfga-url", default=os.environ.get("OPENFGA_API_URL", "http://localhost:8080"))
+    parser.add_argument("--users", type=at_least(1), default=100000)
+    parser.add_argument("--agents", type=at_least(0), default=50)
+    parser.add_argument("--managers", type=at_least(1), default=5)
+    parser.add_argument("--delegation-ratio", type=ratio, default=0.1)
+    parser.add_argument("--samples", type=at_least(1), default=100, help="accounts sampled per assertion")
+    parser.add_argument("--checks", type=at_least(1), default=10000, help="timed checks per relation")
+    parser.add_argument("--concurrency", type=at_least(1), default=32, help="in-flight requests (remote backend)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,162 @@
+"""
+Event-loop latency benchmark for Gmail MIME normalization
+Normalizes batches of generated multipart (text/plain + text/html) messages,
+inline on the loop and through MessageNormalizer's process pool, while a probe
+coroutine measures how late the loop wakes it up.
+
+    python benchmarks/mime_normalize_bench.py --messages 400 --body-kb 256
+    python benchmarks/mime_normalize_bench.py --workers 1 2 4 --chunk-size 4 --output results.json
+
+Results are written as JSON; a stable probe lag under load is the point of the pool.
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "personal_agent"))
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import statistics
+import time
+from typing import Dict, Any, List
+
+from mime_normalizer import MessageNormalizer
+
+WORDS = ["quarterly", "invoice", "meeting", "agenda", "delegation", "review", "travel", "budget", "draft", "follow-up"]
+
+def b64url(text: str, charset: str = "utf-8") -> str:
+    return base64.urlsafe_b64encode(text.encode(charset)).decode("ascii").rstrip("=")
+
+def generate_message(index: int, body_kb: int, rng: random.Random) -> Dict[str, Any]:
+    """A format=full message: multipart/alternative with a plain and an HTML body"""
+    paragraphs = []
+    while sum(len(p) for p in paragraphs) < body_kb * 1024:
+        paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(60)))
+    plain = "\n\n".join(paragraphs)
+    html = "<html><head><style>p{margin:0}</style></head><body>" + "".join(
+        f"<p>{p} &amp; <b>more</b></p>" for p in paragraphs
+    ) + "</body></html>"
+    return {
+        "id": f"m{index}",
+        "threadId": f"t{index}",
+        "snippet": paragraphs[0][:100],
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "From", "value": "sender@example.com"},
+                {"name": "Subject", "value": f"Message {index}"},
+            ],
+            "parts": [
+                # Half the messages are HTML-only so both decode paths are exercised
+                *([] if index % 2 else [{
+                    "mimeType": "text/plain",
+                    "headers": [{"name": "Content-Type", "value": 'text/plain; charset="utf-8"'}],
+                    "body": {"data": b64url(plain)},
+                }]),
+                {
+                    "mimeType": "text/html",
+                    "headers": [{"name": "Content-Type", "value": "text/html; charset=iso-8859-1"}],
+                    "body": {"data": b64url(html, "iso-8859-1")},
+                },
+            ],
+        },
+    }
+
+def summarize(lags_ms: List[float]) -> Dict[str, Any]:
+    ordered = sorted(lags_ms) or [0.0]
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        "samples": len(lags_ms),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+async def probe(interval: float, lags: List[float], stop: asyncio.Event):
+    """Sleep `interval` repeatedly and record how late each wake-up was"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+async def run(normalizer: MessageNormalizer, messages: List[Dict[str, Any]], batch: int, interval: float) -> Dict[str, Any]:
+    # Warm the pool first so process start-up is not billed to the loop
+    await normalizer.normalize(messages[:1])
+    lags: List[float] = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(interval, lags, stop))
+    await asyncio.sleep(interval * 5)
+    idle = summarize(lags)
+    lags.clear()
+
+    started = time.perf_counter()
+    for i in range(0, len(messages), batch):
+        await normalizer.normalize(messages[i:i + batch])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+
+    return {
+        "workers": normalizer.workers,
+        "chunk_size": normalizer.chunk_size,
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(len(messages) / elapsed, 1) if elapsed > 0 else None,
+        "loop_lag_idle": idle,
+        "loop_lag_under_load": summarize(lags),
+    }
+
+async def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    messages = [generate_message(i, args.body_kb, rng) for i in range(args.messages)]
+    raw_bytes = sum(len(p["body"]["data"]) for m in messages for p in m["payload"]["parts"])
+
+    runs = []
+    for workers in [0] + [w for w in args.workers if w > 0]:
+        normalizer = MessageNormalizer(workers, args.chunk_size, args.max_bytes, args.max_chars)
+        try:
+            runs.append(await run(normalizer, messages, args.batch, args.probe_ms / 1000))
+        finally:
+            normalizer.close()
+
+    report = {
+        "seed": args.seed,
+        "messages": len(messages),
+        "encoded_bytes": raw_bytes,
+        "batch": args.batch,
+        "max_bytes": args.max_bytes,
+        "max_chars": args.max_chars,
+        "probe_interval_ms": args.probe_ms,
+        "runs": runs,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark event-loop latency while normalizing Gmail messages")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--body-kb", type=int, default=128, help="approximate plain-text size per message")
+    parser.add_argument("--batch", type=int, default=50, help="messages per normalize() call, like one detail read")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2], help="pool sizes to compare against inline (0)")
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--max-bytes", type=int, default=1_000_000)
+    parser.add_argument("--max-chars", type=int, default=20_000)
+    parser.add_argument("--probe-ms", type=float, default=5.0, help="probe sleep interval")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -63,7 +63,8 @@ class GoodAgent(BaseAgent):
             metadata={
                 "trust_level": 3,
                 "category": "productivity",
-                "verified": True
+                "verified": True,
+                "data_scopes": ["count", "ids", "metadata"]
             }
         )
         
@@ -104,7 +105,9 @@ class GoodAgent(BaseAgent):
                 task={
                     "type": "proxy_gmail_read",
                     "user_id": user_id,
-                    "agent_id": "good_agent"
+                    "agent_id": "good_agent",
+                    "capability": task.get("capability"),
+                    "scopes": ["ids"]
                 }
             )
             
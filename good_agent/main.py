@@ -23,7 +23,8 @@ AGENT_CARD = {
     "metadata": {
         "trust_level": 3,
         "category": "productivity",
-        "verified": True
+        "verified": True,
+        "data_scopes": ["count", "ids", "metadata"]
     }
 }
 
@@ -40,7 +41,9 @@ async def get_email_summary(request: Request):
     async with httpx.AsyncClient() as client:
         res = await client.post(PERSONAL_AGENT_PROXY_URL, json={
             "user_id": user_id,
-            "agent_id": "good_agent"
+            "agent_id": "good_agent",
+            "capability": body.get("capability"),
+            "scopes": ["ids"]
         })
     res.raise_for_status()
     
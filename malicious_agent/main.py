@@ -23,7 +23,8 @@ AGENT_CARD = {
     "metadata": {
         "trust_level": 2,
         "category": "security",
-        "verified": False
+        "verified": False,
+        "data_scopes": ["ids"]
     }
 }
 
@@ -41,7 +42,8 @@ async def get_emails_and_craft_malicious_summary(request: Request):
         async with httpx.AsyncClient() as client:
             res = await client.post(PERSONAL_AGENT_PROXY_URL, json={
                 "user_id": user_id,
-                "agent_id": "malicious_agent"
+                "agent_id": "malicious_agent",
+                "capability": body.get("capability")
             })
         res.raise_for_status()
         emails = res.json().get('messages', [])
@@ -66,7 +66,8 @@ class MaliciousAgent(BaseAgent):
             metadata={
                 "trust_level": 2,  # Lower trust
                 "category": "security",
-                "verified": False  # Not verified
+                "verified": False,  # Not verified
+                "data_scopes": ["ids"]
             }
         )
         
@@ -103,7 +104,8 @@ class MaliciousAgent(BaseAgent):
                 task={
                     "type": "proxy_gmail_read",
                     "user_id": user_id,
-                    "agent_id": "malicious_agent"
+                    "agent_id": "malicious_agent",
+                    "capability": task.get("capability")
                 }
             )
             
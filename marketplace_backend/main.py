@@ -4,6 +4,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from authlib.integrations.starlette_client import OAuth
 from starlette.middleware.sessions import SessionMiddleware
 from prisma import Prisma
+from datetime import datetime, timezone
 import httpx
 import os
 
@@ -49,6 +50,7 @@ async def login(request: Request):
 async def auth_callback(request: Request):
     token = await oauth.google.authorize_access_token(request)
     user_info = await oauth.google.parse_id_token(request, token)
+    expires_at = datetime.fromtimestamp(token['expires_at'], tz=timezone.utc) if token.get('expires_at') else None
     
     user = await db.user.upsert(
         where={'googleSub': user_info['sub']},
@@ -58,10 +60,13 @@ async def auth_callback(request: Request):
                 'email': user_info['email'],
                 'accessToken': token['access_token'],
                 'refreshToken': token.get('refresh_token'),
+                'tokenExpiresAt': expires_at,
             },
             'update': {
                 'accessToken': token['access_token'],
-                'refreshToken': token.get('refresh_token'),
+                'tokenExpiresAt': expires_at,
+                # Google only returns a refresh token on first consent; keep the stored one
+                **({'refreshToken': token['refresh_token']} if token.get('refresh_token') else {}),
             }
         }
     )
@@ -112,6 +117,9 @@ async def invoke_agent(request: Request):
             json={
                 "google_sub": user.googleSub,
                 "access_token": user.accessToken,
+                # The personal agent refreshes the access token itself when it nears expiry
+                "refresh_token": user.refreshToken,
+                "expires_at": user.tokenExpiresAt.timestamp() if user.tokenExpiresAt else None,
                 "contracted_agent_id": agent_id
             },
             timeout=30.0
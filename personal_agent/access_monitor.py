@@ -0,0 +1,252 @@
+"""
+Streaming access anomaly detection for proxied Gmail reads
+Count-min sketches (exponentially decayed and sliding-window) track request rates
+and read volume per agent, per user and per delegation in fixed memory, and flag
+bursts, floods of denied calls and reads beyond the per-delegation budget
+"""
+
+import hashlib
+import logging
+import math
+import os
+import time
+from array import array
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, Any, Awaitable, Callable, Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A user-wide burst may involve several agents, so it is reported but never revokes on its own
+REVOKING_ALERTS = ("burst", "denials", "volume")
+
+@lru_cache(maxsize=4096)
+def _cells(key: str, depth: int, width: int) -> Tuple[int, ...]:
+    digest = hashlib.blake2b(key.encode(), digest_size=4 * depth).digest()
+    return tuple(int.from_bytes(digest[4 * i:4 * i + 4], "little") % width for i in range(depth))
+
+class CountMinSketch:
+    """`depth` rows of `width` counters; estimates never undercount"""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("d", bytes(8 * width)) for _ in range(depth)]
+
+    def add(self, key: str, amount: float = 1.0):
+        # Conservative update: raise only the counters below the new estimate
+        cells = _cells(key, self.depth, self.width)
+        target = min(row[cell] for row, cell in zip(self.rows, cells)) + amount
+        for row, cell in zip(self.rows, cells):
+            if row[cell] < target:
+                row[cell] = target
+
+    def estimate(self, key: str) -> float:
+        return min(row[cell] for row, cell in zip(self.rows, _cells(key, self.depth, self.width)))
+
+    def scale(self, factor: float):
+        for row in self.rows:
+            for i in range(self.width):
+                row[i] *= factor
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = array("d", bytes(8 * self.width))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+class DecayingSketch(CountMinSketch):
+    """Counts that halve every `half_life` seconds, i.e. an exponential-decay rate per key"""
+
+    def __init__(self, half_life: float, width: int = 2048, depth: int = 4):
+        super().__init__(width, depth)
+        self.half_life = half_life
+        self._landmark = time.monotonic()
+
+    def _weight(self, now: float) -> float:
+        # Forward decay: new events are weighted up instead of decaying every counter
+        exponent = (now - self._landmark) / self.half_life
+        if exponent > 64:
+            self.scale(2.0 ** -exponent)
+            self._landmark = now
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def add(self, key: str, amount: float = 1.0, now: Optional[float] = None):
+        super().add(key, amount * self._weight(now if now is not None else time.monotonic()))
+
+    def rate(self, key: str, now: Optional[float] = None) -> float:
+        """Events per second, exponentially weighted over roughly one half-life"""
+        now = now if now is not None else time.monotonic()
+        return self.estimate(key) / self._weight(now) * math.log(2) / self.half_life
+
+class WindowedSketch:
+    """Sliding-window counts from a ring of `slots` sketches covering `window` seconds"""
+
+    def __init__(self, window: float, slots: int = 12, width: int = 2048, depth: int = 4):
+        self.slot_length = window / slots
+        self.sketches = [CountMinSketch(width, depth) for _ in range(slots)]
+        self._epochs = [-1] * slots
+
+    def _current(self, now: float) -> CountMinSketch:
+        epoch = int(now / self.slot_length)
+        index = epoch % len(self.sketches)
+        if self._epochs[index] != epoch:
+            self.sketches[index].clear()
+            self._epochs[index] = epoch
+        return self.sketches[index]
+
+    def add(self, key: str, amount: float = 1.0, now: Optional[float] = None):
+        self._current(now if now is not None else time.monotonic()).add(key, amount)
+
+    def estimate(self, key: str, now: Optional[float] = None) -> float:
+        oldest = int((now if now is not None else time.monotonic()) / self.slot_length) - len(self.sketches) + 1
+        return sum(sketch.estimate(key) for sketch, epoch in zip(self.sketches, self._epochs) if epoch >= oldest)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(sketch.nbytes for sketch in self.sketches)
+
+class AccessAnomalyDetector:
+    """Flags request bursts, denial floods and over-budget reads; can revoke the delegation"""
+
+    def __init__(self,
+                 width: int = 2048,
+                 depth: int = 4,
+                 burst_half_life: float = 10.0,
+                 baseline_half_life: float = 3600.0,
+                 burst_rate: float = 3.0,
+                 burst_factor: float = 10.0,
+                 denial_rate: float = 1.0,
+                 window: float = 3600.0,
+                 window_slots: int = 12,
+                 max_messages: int = 500,
+                 auto_revoke: bool = False,
+                 revoke: Optional[Callable[[str, str], Awaitable[Any]]] = None,
+                 is_active: Optional[Callable[[str, str], bool]] = None,
+                 alert_cooldown: float = 60.0,
+                 max_alerts: int = 100):
+        self.burst_rate = burst_rate
+        self.burst_factor = burst_factor
+        self.denial_rate = denial_rate
+        self.max_messages = max_messages
+        self.auto_revoke = auto_revoke
+        self.revoke = revoke
+        # (user_id, agent_id) -> whether a delegation is live; denied callers usually have none to revoke
+        self.is_active = is_active
+        self.alert_cooldown = alert_cooldown
+        # Keys share the sketches: "a:<agent>", "u:<user>", "d:<agent>|<user>"
+        self.requests = DecayingSketch(burst_half_life, width, depth)
+        self.baseline = DecayingSketch(baseline_half_life, width, depth)
+        self.denials = DecayingSketch(burst_half_life, width, depth)
+        self.volume = WindowedSketch(window, window_slots, width, depth)
+        # Bounded like the sketches: the oldest cooldowns and alerts fall off
+        self._cooldowns: 'OrderedDict[Tuple[str, str, str], float]' = OrderedDict()
+        self._max_cooldowns = max_alerts * 10
+        self.recent_alerts: Deque[Dict[str, Any]] = deque(maxlen=max_alerts)
+        self.observed = 0
+        self.alerts: Dict[str, int] = {"burst": 0, "user_burst": 0, "denials": 0, "volume": 0}
+        self.revocations = 0
+
+    @classmethod
+    def from_env(cls,
+                 revoke: Optional[Callable[[str, str], Awaitable[Any]]] = None,
+                 is_active: Optional[Callable[[str, str], bool]] = None) -> Optional['AccessAnomalyDetector']:
+        env = os.environ
+        if env.get("ANOMALY_DETECTION", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            width=int(env.get("ANOMALY_SKETCH_WIDTH", "2048")),
+            depth=int(env.get("ANOMALY_SKETCH_DEPTH", "4")),
+            burst_rate=float(env.get("ANOMALY_BURST_RATE", "3")),
+            burst_factor=float(env.get("ANOMALY_BURST_FACTOR", "10")),
+            denial_rate=float(env.get("ANOMALY_DENIAL_RATE", "1")),
+            window=float(env.get("ANOMALY_WINDOW", "3600")),
+            max_messages=int(env.get("ANOMALY_MAX_MESSAGES", "500")),
+            auto_revoke=env.get("ANOMALY_AUTO_REVOKE", "false").lower() in ("1", "true", "yes"),
+            revoke=revoke,
+            is_active=is_active,
+        )
+
+    async def observe_read(self, agent_id: str, user_id: str, messages: int) -> List[Dict[str, Any]]:
+        """Record one proxied read of `messages` messages; returns the alerts it raised"""
+        now = time.monotonic()
+        self.observed += 1
+        alerts = []
+        for kind, key in (("burst", f"a:{agent_id}"), ("user_burst", f"u:{user_id}")):
+            self.requests.add(key, now=now)
+            self.baseline.add(key, now=now)
+            rate = self.requests.rate(key, now)
+            threshold = max(self.burst_rate, self.burst_factor * self.baseline.rate(key, now))
+            if rate > threshold:
+                alerts.append(self._alert(kind, agent_id, user_id, rate, threshold, now))
+
+        delegation = f"d:{agent_id}|{user_id}"
+        self.volume.add(delegation, messages, now)
+        read = self.volume.estimate(delegation, now)
+        if read > self.max_messages:
+            alerts.append(self._alert("volume", agent_id, user_id, read, self.max_messages, now))
+        return await self._act([a for a in alerts if a is not None])
+
+    async def observe_denial(self, agent_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Record a proxied call that failed authorization"""
+        now = time.monotonic()
+        self.observed += 1
+        key = f"a:{agent_id}"
+        self.denials.add(key, now=now)
+        rate = self.denials.rate(key, now)
+        alert = self._alert("denials", agent_id, user_id, rate, self.denial_rate, now) if rate > self.denial_rate else None
+        return await self._act([alert] if alert is not None else [])
+
+    def _alert(self, kind: str, agent_id: str, user_id: str, value: float, threshold: float, now: float) -> Optional[Dict[str, Any]]:
+        key = (kind, agent_id, user_id)
+        if self._cooldowns.get(key, 0.0) > now:
+            return None
+        self._cooldowns[key] = now + self.alert_cooldown
+        self._cooldowns.move_to_end(key)
+        while len(self._cooldowns) > self._max_cooldowns:
+            self._cooldowns.popitem(last=False)
+
+        self.alerts[kind] += 1
+        alert = {
+            "kind": kind,
+            "agent_id": agent_id,
+            "user_id": user_id,
+            "value": round(value, 3),
+            "threshold": round(threshold, 3),
+            "at": time.time(),
+        }
+        self.recent_alerts.append(alert)
+        logger.warning(f"Access anomaly ({kind}) for agent {agent_id} on {user_id}: {alert['value']} > {alert['threshold']}")
+        return alert
+
+    def _revokes(self, alert: Dict[str, Any]) -> bool:
+        if alert["kind"] not in REVOKING_ALERTS:
+            return False
+        # A denial flood from an agent with no delegation has no grant to take away
+        if alert["kind"] == "denials":
+            return self.is_active is not None and self.is_active(alert["user_id"], alert["agent_id"])
+        return True
+
+    async def _act(self, alerts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if alerts and self.auto_revoke and self.revoke is not None:
+            targets = dict.fromkeys((a["agent_id"], a["user_id"]) for a in alerts if self._revokes(a))
+            for agent_id, user_id in targets:
+                try:
+                    await self.revoke(user_id, agent_id)
+                    self.revocations += 1
+                except Exception as e:
+                    logger.error(f"Auto-revoke of {agent_id} on {user_id} failed: {str(e)}")
+        return alerts
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "observed": self.observed,
+            "alerts": dict(self.alerts),
+            "auto_revoke": self.auto_revoke,
+            "revocations": self.revocations,
+            "recent_alerts": list(self.recent_alerts)[-10:],
+            "memory_bytes": self.requests.nbytes + self.baseline.nbytes + self.denials.nbytes + self.volume.nbytes,
+        }
@@ -0,0 +1,69 @@
+"""
+Agent card directory for the Personal Agent
+Fetches each calling agent's card from its own /agent_card endpoint and caches
+it, so policy decisions never rely on what a request claims about its sender
+"""
+
+import logging
+import time
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class AgentCardDirectory:
+    """agent_id -> base URL, with the card behind it cached for `ttl` seconds"""
+
+    def __init__(self,
+                 client: Callable[[], httpx.AsyncClient],
+                 agent_urls: Optional[Dict[str, str]] = None,
+                 ttl: float = 300.0):
+        self.client = client
+        self.agent_urls = {k: v for k, v in (agent_urls or {}).items() if v}
+        self.ttl = ttl
+        self._cards: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.fetches = 0
+        self.failures = 0
+
+    def register(self, agent_id: str, agent_url: Optional[str]):
+        """Remember where an agent lives; a changed URL drops its cached card"""
+        if agent_url and self.agent_urls.get(agent_id) != agent_url:
+            self.agent_urls[agent_id] = agent_url
+            self._cards.pop(agent_id, None)
+
+    async def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """The agent's card, or None if it is unknown or unreachable"""
+        cached = self._cards.get(agent_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        agent_url = self.agent_urls.get(agent_id)
+        if not agent_url:
+            return None
+
+        self.fetches += 1
+        try:
+            res = await self.client().get(f"{agent_url.rstrip('/')}/agent_card")
+            res.raise_for_status()
+            card = res.json()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Could not fetch agent card for {agent_id}: {str(e)}")
+            return None
+
+        if card.get("agent_id") != agent_id:
+            self.failures += 1
+            logger.warning(f"Agent card at {agent_url} is for {card.get('agent_id')}, not {agent_id}")
+            return None
+
+        self._cards[agent_id] = (time.monotonic() + self.ttl, card)
+        return card
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "known_agents": len(self.agent_urls),
+            "cached_cards": len(self._cards),
+            "fetches": self.fetches,
+            "failures": self.failures,
+        }
@@ -0,0 +1,227 @@
+"""
+Per-calling-agent guards for the proxy endpoints
+Rate limits tiered by the agent card's `verified` / `trust_level`, a short-lived
+cache of denied checks so a flood of forbidden calls never reaches OpenFGA, and
+the operator token in front of the audit log, delegation list and stats
+"""
+
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+from gmail_scheduler import TokenBucket
+
+DenialKey = Tuple[str, str, str]  # (agent_id, relation, object)
+
+# Callers whose card cannot be resolved all share one bucket: their agent_id is only a claim,
+# and a fresh id per request must not buy a fresh budget
+UNKNOWN_AGENT = "*unknown*"
+
+# (requests per second, burst) per tier
+DEFAULT_TIERS: Dict[str, Tuple[float, float]] = {
+    "trusted": (50.0, 100.0),     # verified and trust_level >= trusted_level
+    "verified": (20.0, 40.0),
+    "unverified": (5.0, 10.0),
+    "unknown": (1.0, 5.0),        # no card could be fetched
+}
+
+class RateLimited(Exception):
+    """A calling agent exceeded its tier's request rate"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AgentRateLimiter:
+    """One token bucket per calling agent, sized by the tier its card earns"""
+
+    def __init__(self,
+                 tiers: Optional[Dict[str, Tuple[float, float]]] = None,
+                 trusted_level: int = 3,
+                 max_agents: int = 10000):
+        self.tiers = tiers or dict(DEFAULT_TIERS)
+        self.trusted_level = trusted_level
+        self.max_agents = max_agents
+        self._buckets: 'OrderedDict[str, Tuple[str, TokenBucket]]' = OrderedDict()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {tier: 0 for tier in self.tiers}
+
+    @classmethod
+    def from_env(cls) -> Optional['AgentRateLimiter']:
+        """AGENT_RATE_<TIER> / AGENT_BURST_<TIER> override the defaults; AGENT_RATE_LIMIT=false disables"""
+        if os.environ.get("AGENT_RATE_LIMIT", "true").lower() not in ("1", "true", "yes"):
+            return None
+        tiers = {
+            tier: (
+                float(os.environ.get(f"AGENT_RATE_{tier.upper()}", rate)),
+                float(os.environ.get(f"AGENT_BURST_{tier.upper()}", burst)),
+            )
+            for tier, (rate, burst) in DEFAULT_TIERS.items()
+        }
+        return cls(tiers, trusted_level=int(os.environ.get("AGENT_TRUSTED_LEVEL", "3")))
+
+    def tier(self, card: Optional[Dict[str, Any]]) -> str:
+        if card is None:
+            return "unknown"
+        metadata = card.get("metadata") or {}
+        if not metadata.get("verified"):
+            return "unverified"
+        return "trusted" if int(metadata.get("trust_level", 0)) >= self.trusted_level else "verified"
+
+    def admit(self, agent_id: str, card: Optional[Dict[str, Any]]):
+        """Take one request from the agent's budget or raise RateLimited"""
+        tier = self.tier(card)
+        key = agent_id if card is not None else UNKNOWN_AGENT
+        entry = self._buckets.get(key)
+        # A changed card (e.g. newly verified) moves the agent to a fresh bucket of its new tier
+        if entry is None or entry[0] != tier:
+            rate, burst = self.tiers[tier]
+            entry = self._buckets[key] = (tier, TokenBucket(rate, burst))
+            while len(self._buckets) > self.max_agents:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+
+        bucket = entry[1]
+        wait = bucket.wait_time(1, time.monotonic())
+        if wait > 0:
+            self.rejected[tier] += 1
+            raise RateLimited(f"Agent {agent_id} exceeded the {tier} rate limit", retry_after=wait)
+        bucket.take(1)
+        self.admitted += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_agents": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "tiers": {tier: {"rate": rate, "burst": burst} for tier, (rate, burst) in self.tiers.items()},
+        }
+
+class DenialCache:
+    """Remembers denied (agent, relation, object) checks for `ttl` seconds; cleared per agent on grant"""
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[DenialKey, float]' = OrderedDict()
+        self._by_agent: Dict[str, Set[DenialKey]] = {}
+        # Bumped on every clear so a check that started before a grant cannot record its denial after it;
+        # `_epoch` covers clears of every agent at once
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+
+    def generation(self, agent_id: str) -> int:
+        # Both parts only grow, so any clear changes the sum
+        return self._epoch + self._generations.get(agent_id, 0)
+
+    def is_denied(self, key: DenialKey) -> bool:
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            self.misses += 1
+            return False
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def record(self, key: DenialKey, generation: int):
+        if self.ttl <= 0 or self.max_entries <= 0 or self.generation(key[0]) != generation:
+            return
+        self._entries[key] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        self._by_agent.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def check(self, key: DenialKey, check: Callable[[], Awaitable[bool]], remember: bool = True) -> bool:
+        """`check()`, unless the same check was denied moments ago"""
+        # remember=False for callers without a resolved card: their ids are unverified claims, so
+        # recording them only lets rotating ids evict real agents' entries (the shared
+        # UNKNOWN_AGENT rate limit bounds the checks they can cause instead)
+        if self.is_denied(key):
+            return False
+        generation = self.generation(key[0])
+        allowed = await check()
+        if not allowed and remember:
+            self.record(key, generation)
+        return allowed
+
+    def clear_agent(self, agent_id: str):
+        """A grant was written for the agent; its remembered denials may no longer hold"""
+        self._generations[agent_id] = self.generation(agent_id) + 1
+        for key in self._by_agent.pop(agent_id, set()):
+            self._entries.pop(key, None)
+        self.clears += 1
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._by_agent.clear()
+        self.clears += 1
+
+    def clear_for_tuples(self, tuple_keys: List[Dict[str, str]]):
+        """Tuples were written: clear the agents they name, or everything if one may grant indirectly"""
+        agents = set()
+        for tuple_key in tuple_keys:
+            user = tuple_key.get("user", "")
+            if not user.startswith("agent:") or "#" in user:
+                # A userset or non-agent subject can reach agents through other relations
+                self.clear()
+                return
+            agents.add(user[len("agent:"):])
+        for agent_id in agents:
+            self.clear_agent(agent_id)
+
+    def _remove(self, key: DenialKey):
+        self._entries.pop(key, None)
+        keys = self._by_agent.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_agent[key[0]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "clears": self.clears,
+        }
+
+class AdminGuard:
+    """Operator-only views need ADMIN_API_TOKEN; with no token configured they are refused to everyone"""
+
+    def __init__(self, token: Optional[str] = None):
+        self._token = token.encode() if token else None
+        self.allowed = 0
+        self.refused = 0
+
+    @classmethod
+    def from_env(cls) -> 'AdminGuard':
+        return cls(os.environ.get("ADMIN_API_TOKEN"))
+
+    @property
+    def enabled(self) -> bool:
+        return self._token is not None
+
+    def allows(self, presented: Optional[str]) -> bool:
+        """`presented` is the raw token or an "Authorization: Bearer <token>" value"""
+        if presented and presented.lower().startswith("bearer "):
+            presented = presented[len("bearer "):].strip()
+        ok = self._token is not None and bool(presented) and hmac.compare_digest(presented.encode(), self._token)
+        if ok:
+            self.allowed += 1
+        else:
+            self.refused += 1
+        return ok
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "allowed": self.allowed, "refused": self.refused}
@@ -0,0 +1,287 @@
+"""
+Append-only audit log for authorization decisions and delegated data access
+Events are queued without blocking the request path and flushed in batches by a
+background task to size/age-rotated JSONL segments; AuditReader scans them back
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, IO, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = "always"      # fsync after every batch
+FSYNC_INTERVAL = "interval"  # fsync at most every fsync_interval seconds
+FSYNC_NEVER = "never"        # leave it to the OS page cache
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl"
+
+def segment_name(started_at: float, sequence: int) -> str:
+    # Start time first so lexical order is time order and the reader can prune by name
+    return f"{SEGMENT_PREFIX}{int(started_at * 1000):013d}-{sequence:06d}{SEGMENT_SUFFIX}"
+
+def parse_segment_name(name: str) -> Optional[Tuple[float, int]]:
+    if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+        return None
+    try:
+        started_ms, sequence = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)].split("-")
+        return int(started_ms) / 1000, int(sequence)
+    except ValueError:
+        return None
+
+def list_segments(directory: str) -> List[Tuple[float, str]]:
+    """(start time, path) of every segment, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        parsed = parse_segment_name(name)
+        if parsed is not None:
+            segments.append((parsed, os.path.join(directory, name)))
+    return [(started_at, path) for (started_at, _), path in sorted(segments)]
+
+class AuditLog:
+    """Bounded in-memory queue in front of a batched, rotating segment writer"""
+
+    def __init__(self,
+                 directory: str,
+                 segment_bytes: int = 64 * 1024 * 1024,
+                 segment_seconds: float = 3600.0,
+                 max_segments: int = 168,
+                 queue_size: int = 10000,
+                 batch_size: int = 500,
+                 flush_interval: float = 0.2,
+                 fsync: str = FSYNC_INTERVAL,
+                 fsync_interval: float = 1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown audit fsync policy: {fsync}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._writer: Optional[asyncio.Task] = None
+        # The batch being collected and the write in progress, so close() loses neither
+        self._batch: List[Dict[str, Any]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        # Only touched from the writer thread, one batch at a time
+        self._file: Optional[IO[bytes]] = None
+        self._file_started = 0.0
+        self._file_bytes = 0
+        self._sequence = 0
+        self._last_fsync = 0.0
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.segments_rotated = 0
+        self.segments_deleted = 0
+        self.write_errors = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['AuditLog']:
+        """Off unless AUDIT_LOG_DIR names a directory (ideally an absolute path on a persistent volume)"""
+        env = os.environ
+        directory = env.get("AUDIT_LOG_DIR", "")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            segment_bytes=int(env.get("AUDIT_SEGMENT_MB", "64")) * 1024 * 1024,
+            segment_seconds=float(env.get("AUDIT_SEGMENT_SECONDS", "3600")),
+            max_segments=int(env.get("AUDIT_MAX_SEGMENTS", "168")),
+            queue_size=int(env.get("AUDIT_QUEUE_SIZE", "10000")),
+            batch_size=int(env.get("AUDIT_BATCH_SIZE", "500")),
+            flush_interval=float(env.get("AUDIT_FLUSH_INTERVAL_MS", "200")) / 1000,
+            fsync=env.get("AUDIT_FSYNC", FSYNC_INTERVAL),
+            fsync_interval=float(env.get("AUDIT_FSYNC_INTERVAL", "1.0")),
+        )
+
+    def record(self, kind: str, agent_id: Optional[str] = None, user_id: Optional[str] = None, **fields):
+        """Queue an event; never blocks, and drops (and counts) events when the queue is full"""
+        event = {"ts": time.time(), "kind": kind, "agent_id": agent_id, "user_id": user_id, **fields}
+        try:
+            self._queue.put_nowait(event)
+            self.recorded += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        if self._writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._writer = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flush everything queued so far, then close the current segment"""
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        batch, self._batch = self._batch + self._drain(), []
+        loop = asyncio.get_running_loop()
+        if batch:
+            await loop.run_in_executor(None, self._write_batch, batch)
+        await loop.run_in_executor(None, self._close_file)
+
+    def _drain(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        batch = []
+        while not self._queue.empty() and (limit is None or len(batch) < limit):
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self._queue.get())
+            # Give concurrent requests a moment to add to this batch
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                remaining = deadline - loop.time()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # File I/O (and fsync) runs off the event loop
+            self._inflight = loop.run_in_executor(None, self._write_batch, batch)
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        data = "".join(json.dumps(event, separators=(",", ":"), default=str) + "\n" for event in batch).encode()
+        try:
+            now = time.time()
+            if (self._file is None
+                    or self._file_bytes + len(data) > self.segment_bytes
+                    or now - self._file_started > self.segment_seconds):
+                self._rotate(batch[0]["ts"])
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+            if self.fsync == FSYNC_ALWAYS or (
+                    self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+                self.fsyncs += 1
+        except OSError as e:
+            self.write_errors += 1
+            logger.error(f"Failed to write {len(batch)} audit events: {str(e)}")
+            return
+        self.written += len(batch)
+        self.batches += 1
+        self.bytes_written += len(data)
+
+    def _rotate(self, started_at: float):
+        if self._file is not None:
+            self._close_file()
+            self.segments_rotated += 1
+        self._sequence += 1
+        path = os.path.join(self.directory, segment_name(started_at, self._sequence))
+        self._file = open(path, "ab")
+        self._file_started = time.time()
+        self._file_bytes = 0
+
+        segments = list_segments(self.directory)
+        for _, old_path in segments[:max(0, len(segments) - self.max_segments)]:
+            try:
+                os.remove(old_path)
+                self.segments_deleted += 1
+            except OSError as e:
+                logger.warning(f"Could not delete audit segment {old_path}: {str(e)}")
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        # A segment is always durable once it is closed, whatever the policy
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        self._file.close()
+        self._file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "fsync": self.fsync,
+            "queue_depth": self._queue.qsize(),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "bytes_written": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "segments_rotated": self.segments_rotated,
+            "segments_deleted": self.segments_deleted,
+            "write_errors": self.write_errors,
+        }
+
+class AuditReader:
+    """Scans audit segments by time range and agent, skipping segments outside the range"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def scan(self,
+             since: Optional[float] = None,
+             until: Optional[float] = None,
+             agent_id: Optional[str] = None,
+             kinds: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        segments = list_segments(self.directory)
+        # Cheap substring test before parsing; the parsed event is still checked exactly
+        needle = json.dumps(agent_id).encode() if agent_id is not None else None
+        for i, (started_at, path) in enumerate(segments):
+            # A segment ends where the next one starts
+            ends_at = segments[i + 1][0] if i + 1 < len(segments) else None
+            if until is not None and started_at > until:
+                break
+            if since is not None and ends_at is not None and ends_at < since:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        if needle is not None and needle not in line:
+                            continue
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            continue  # torn final line after a crash
+                        if since is not None and event["ts"] < since:
+                            continue
+                        if until is not None and event["ts"] > until:
+                            continue
+                        if agent_id is not None and event.get("agent_id") != agent_id:
+                            continue
+                        if kinds and event.get("kind") not in kinds:
+                            continue
+                        yield event
+            except FileNotFoundError:
+                continue  # rotated away while scanning
+
+    def query(self, limit: int = 1000, **filters) -> List[Dict[str, Any]]:
+        events = []
+        for event in self.scan(**filters):
+            events.append(event)
+            if len(events) >= limit:
+                break
+        return events
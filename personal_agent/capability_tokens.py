@@ -0,0 +1,116 @@
+"""
+Capability tokens for delegated Gmail access
+Short-lived, audience-bound HMAC tokens minted when a delegation starts so
+proxied reads inside that delegation can be authorized without an OpenFGA call
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+class CapabilityTokenSigner:
+    """Mints and verifies `<payload>.<hmac-sha256>` tokens bound to one agent, user and relation"""
+
+    def __init__(self, secret: bytes, audience: str = "personal_agent", ttl: float = 300.0):
+        self.secret = secret
+        self.audience = audience
+        self.ttl = ttl
+        # jti -> exp of tokens withdrawn before they expire, e.g. when their delegation ends
+        self._revoked: Dict[str, float] = {}
+        self.minted = 0
+        self.verified = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> 'CapabilityTokenSigner':
+        """Use CAPABILITY_TOKEN_SECRET, or a per-process random key"""
+        secret = os.environ.get("CAPABILITY_TOKEN_SECRET")
+        if not secret:
+            logger.warning(
+                "CAPABILITY_TOKEN_SECRET is not set; using a per-process key, so capability tokens "
+                "minted here fail verification in any other process (main.py vs the A2A launcher)"
+            )
+        return cls(
+            secret.encode() if secret else os.urandom(32),
+            ttl=float(os.environ.get("CAPABILITY_TOKEN_TTL", "300"))
+        )
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()
+
+    def mint(self, agent_id: str, user_id: str, relation: str, ttl: Optional[float] = None) -> str:
+        claims = {
+            "aud": self.audience,
+            "sub": agent_id,
+            "usr": user_id,
+            "rel": relation,
+            "exp": time.time() + (self.ttl if ttl is None else ttl),
+            "jti": uuid.uuid4().hex,
+        }
+        payload = json.dumps(claims, separators=(",", ":"), sort_keys=True).encode()
+        self.minted += 1
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    def decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the claims of a well-signed, unexpired token for this audience, else None"""
+        try:
+            payload_part, signature_part = token.split(".", 1)
+            payload = _b64decode(payload_part)
+            signature = _b64decode(signature_part)
+        except (ValueError, AttributeError):
+            return None
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+
+        claims = json.loads(payload)
+        if (claims.get("aud") != self.audience
+                or claims.get("exp", 0) < time.time()
+                or claims.get("jti") in self._revoked):
+            return None
+        return claims
+
+    def revoke(self, token: Optional[str]):
+        """Withdraw one token before it expires; other tokens for the same delegation stay valid"""
+        claims = self.decode(token) if token else None
+        if claims is None:
+            return
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp >= now}
+        self._revoked[claims["jti"]] = claims["exp"]
+
+    def verify(self, token: Optional[str], agent_id: str, user_id: str, relation: str) -> bool:
+        """True if the token grants `relation` on `user_id`'s account to `agent_id`"""
+        if not token:
+            return False
+        claims = self.decode(token)
+        if (claims is None
+                or claims.get("sub") != agent_id
+                or claims.get("usr") != user_id
+                or claims.get("rel") != relation):
+            self.rejected += 1
+            return False
+        self.verified += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "minted": self.minted,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "revoked": len(self._revoked),
+        }
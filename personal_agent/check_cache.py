@@ -0,0 +1,115 @@
+"""
+Check-decision cache for OpenFGA
+Bounded TTL + LRU cache of /check results with write-through invalidation
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+CheckKey = Tuple[str, str, str]  # (user, relation, object)
+
+class CheckCache:
+    """Caches check decisions and drops every decision on an object when one of its tuples changes"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[CheckKey, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._by_object: Dict[str, Set[CheckKey]] = {}
+        # A global counter bumped on every invalidation, and the value it had when each
+        # object was last invalidated: an in-flight check that started before a write
+        # cannot store its (possibly stale) answer afterwards.
+        self._generation = 0
+        self._invalidated: 'OrderedDict[str, int]' = OrderedDict()
+        # Objects forgotten from `_invalidated` (or wiped by clear()) are assumed to
+        # have been invalidated at `_floor`, so memory stays bounded without ever
+        # accepting a pre-write answer
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(tuple_key: Dict[str, str]) -> CheckKey:
+        return (tuple_key["user"], tuple_key["relation"], tuple_key["object"])
+
+    def generation(self, object_id: str) -> int:
+        """Token to pass to set() for a check on `object_id` that is about to start"""
+        return self._generation
+
+    def _stale(self, object_id: str, generation: int) -> bool:
+        return max(self._floor, self._invalidated.get(object_id, 0)) > generation
+
+    def get(self, key: CheckKey) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def set(self, key: CheckKey, result: Dict[str, Any], generation: int):
+        """Store a decision unless its object was invalidated since `generation` was read"""
+        object_id = key[2]
+        if self.max_entries <= 0 or self._stale(object_id, generation):
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        self._by_object.setdefault(object_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, tuple_keys: List[Dict[str, str]]):
+        """Drop cached decisions on every object touched by the given tuples"""
+        for tuple_key in tuple_keys:
+            object_id = tuple_key["object"]
+            self._generation += 1
+            self._invalidated[object_id] = self._generation
+            self._invalidated.move_to_end(object_id)
+            while len(self._invalidated) > max(self.max_entries, 1):
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, forgotten)
+            for key in self._by_object.pop(object_id, set()):
+                self._entries.pop(key, None)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._by_object.clear()
+        # An epoch rather than a reset: checks started before the clear must not be stored after it
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
+
+    def _remove(self, key: CheckKey):
+        self._entries.pop(key, None)
+        keys = self._by_object.get(key[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_object[key[2]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
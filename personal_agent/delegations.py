@@ -0,0 +1,327 @@
+"""
+Delegation registry for the Personal Agent
+Reference-counts temporary_reader grants per (user, agent) so overlapping
+delegations share one OpenFGA tuple and one stored access token
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+
+from adk_core.base_agent import Tool
+from token_vault import TokenVault
+
+logger = logging.getLogger(__name__)
+
+DelegationKey = Tuple[str, str]  # (user_id, agent_id)
+
+# persisted:  temporary_reader is written to OpenFGA on grant and deleted on revoke
+# contextual: nothing is written; checks carry the tuple as a contextual tuple
+DELEGATION_MODE_PERSISTED = "persisted"
+DELEGATION_MODE_CONTEXTUAL = "contextual"
+DELEGATION_MODES = (DELEGATION_MODE_PERSISTED, DELEGATION_MODE_CONTEXTUAL)
+
+class _Delegation:
+    """Reference count for one (user, agent) grant; the lock orders grant/revoke writes"""
+    def __init__(self, user_id: str, agent_id: str):
+        self.user_id = user_id
+        self.agent_id = agent_id
+        self.count = 0
+        self.revoked = False
+        self.granted_at: Optional[datetime] = None
+        self.lock = asyncio.Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "agent_id": self.agent_id,
+            "granted_at": self.granted_at.isoformat() if self.granted_at else None,
+            "references": self.count,
+            "revoked": self.revoked,
+        }
+
+class DelegationRegistry:
+    """Only the first acquire writes the grant; only the last release revokes it"""
+
+    def __init__(self,
+                 openfga_tool: Tool,
+                 token_storage: TokenVault,
+                 mode: str = DELEGATION_MODE_PERSISTED,
+                 ledger_path: Optional[str] = None):
+        if mode not in DELEGATION_MODES:
+            raise ValueError(f"Unknown delegation mode: {mode}")
+        self.openfga_tool = openfga_tool
+        self.token_storage = token_storage
+        self.mode = mode
+        # Grants this process wrote and has not revoked, kept on disk so that after a
+        # crash it can tell its own leftover tuples from grants other processes still use
+        self.ledger_path = ledger_path or None
+        self._ledger: Set[DelegationKey] = self._load_ledger()
+        self._delegations: Dict[DelegationKey, _Delegation] = {}
+        # Secondary indexes over granted delegations for O(result) lookups
+        self._by_user: Dict[str, Dict[str, _Delegation]] = {}
+        self._by_agent: Dict[str, Dict[str, _Delegation]] = {}
+        self._user_refs: Dict[str, int] = {}
+        self.grants_written = 0
+        self.grants_shared = 0
+        self.revokes_written = 0
+        self.last_reconcile: Optional[Dict[str, Any]] = None
+        # Called with (user_id, agent_id) whenever a grant is revoked / has been written
+        self.revoke_listeners: List[Callable[[str, str], None]] = []
+        self.grant_listeners: List[Callable[[str, str], None]] = []
+
+        if mode == DELEGATION_MODE_CONTEXTUAL:
+            openfga_tool.contextual_tuples = self.contextual_tuples
+
+    @staticmethod
+    def tuple_key(user_id: str, agent_id: str) -> Dict[str, str]:
+        return {
+            "user": f"agent:{agent_id}",
+            "relation": "temporary_reader",
+            "object": f"gmail_account:{user_id}"
+        }
+
+    def contextual_tuples(self, tuple_key: Dict[str, str]) -> List[Dict[str, str]]:
+        """In-flight temporary_reader tuple for the checked (agent, gmail_account), if any"""
+        user, object_id = tuple_key["user"], tuple_key["object"]
+        if not (user.startswith("agent:") and object_id.startswith("gmail_account:")):
+            return []
+
+        user_id = object_id[len("gmail_account:"):]
+        agent_id = user[len("agent:"):]
+        delegation = self._delegations.get((user_id, agent_id))
+        if delegation is None or delegation.count == 0 or delegation.revoked:
+            return []
+        return [self.tuple_key(user_id, agent_id)]
+
+    async def _grant(self, user_id: str, agent_id: str):
+        tuple_key = self.tuple_key(user_id, agent_id)
+        if self.mode == DELEGATION_MODE_CONTEXTUAL:
+            self.openfga_tool.invalidate([tuple_key])
+        else:
+            await self.openfga_tool.execute({"action": "grant", **tuple_key})
+            self.grants_written += 1
+            self._ledger_update(add=[(user_id, agent_id)])
+        for listener in self.grant_listeners:
+            listener(user_id, agent_id)
+
+    async def _revoke(self, user_id: str, agent_id: str):
+        # Listeners only drop state (e.g. a prefetched inbox), so they run even if the
+        # delete then fails; the ledger keeps the entry so reconcile can retry it
+        for listener in self.revoke_listeners:
+            listener(user_id, agent_id)
+        tuple_key = self.tuple_key(user_id, agent_id)
+        if self.mode == DELEGATION_MODE_CONTEXTUAL:
+            self.openfga_tool.invalidate([tuple_key])
+            return
+        await self.openfga_tool.execute({"action": "revoke", **tuple_key})
+        self.revokes_written += 1
+        self._ledger_update(remove=[(user_id, agent_id)])
+
+    def _load_ledger(self) -> Set[DelegationKey]:
+        if self.ledger_path is None:
+            return set()
+        try:
+            with open(self.ledger_path, "r") as f:
+                return {(user_id, agent_id) for user_id, agent_id in json.load(f)}
+        except FileNotFoundError:
+            return set()
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Could not read delegation ledger {self.ledger_path}: {str(e)}")
+            return set()
+
+    def _ledger_update(self, add: List[DelegationKey] = (), remove: List[DelegationKey] = ()):
+        if self.ledger_path is None:
+            return
+        updated = (self._ledger - set(remove)) | set(add)
+        if updated == self._ledger:
+            return
+        self._ledger = updated
+        try:
+            tmp_path = f"{self.ledger_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(sorted(self._ledger), f)
+            os.replace(tmp_path, self.ledger_path)
+        except OSError as e:
+            logger.warning(f"Could not update delegation ledger {self.ledger_path}: {str(e)}")
+
+    async def acquire(self,
+                      user_id: str,
+                      agent_id: str,
+                      access_token: str,
+                      refresh_token: Optional[str] = None,
+                      expires_at: Optional[float] = None):
+        """Register a delegation, writing the grant if it is the first for (user, agent)"""
+        key = (user_id, agent_id)
+        while True:
+            delegation = self._delegations.setdefault(key, _Delegation(user_id, agent_id))
+            async with delegation.lock:
+                # The entry may have been retired by a release while we waited
+                if self._delegations.get(key) is not delegation:
+                    continue
+
+                self.token_storage.store(user_id, access_token, refresh_token, expires_at)
+                self._user_refs[user_id] = self._user_refs.get(user_id, 0) + 1
+
+                if delegation.count == 0 or delegation.revoked:
+                    # Count first so the contextual tuple is visible once the cache is invalidated
+                    was_revoked = delegation.revoked
+                    delegation.count += 1
+                    delegation.revoked = False
+                    try:
+                        await self._grant(user_id, agent_id)
+                    except Exception:
+                        # Holders of a revoked delegation stay revoked if the re-grant fails
+                        delegation.revoked = was_revoked
+                        delegation.count -= 1
+                        if delegation.count == 0:
+                            self._retire(delegation)
+                        self._release_token(user_id)
+                        raise
+                    delegation.granted_at = datetime.utcnow()
+                    self._index(delegation)
+                else:
+                    delegation.count += 1
+                    self.grants_shared += 1
+                return
+
+    async def release(self, user_id: str, agent_id: str):
+        """Drop one reference; the last one revokes the grant and, per user, the token"""
+        key = (user_id, agent_id)
+        delegation = self._delegations.get(key)
+        if delegation is None:
+            logger.warning(f"Release without matching acquire for {agent_id} on {user_id}")
+            return
+
+        async with delegation.lock:
+            delegation.count -= 1
+            try:
+                if delegation.count == 0 and not delegation.revoked:
+                    await self._revoke(user_id, agent_id)
+            finally:
+                # Retire the entry only after the revoke so a concurrent acquire
+                # re-grants strictly after it
+                if delegation.count == 0:
+                    self._retire(delegation)
+                self._release_token(user_id)
+
+    async def revoke(self, user_id: str, agent_id: str):
+        """Revoke a grant immediately, even while delegations still hold references"""
+        delegation = self._delegations.get((user_id, agent_id))
+        if delegation is None:
+            await self._revoke(user_id, agent_id)
+            return
+
+        async with delegation.lock:
+            if not delegation.revoked:
+                delegation.revoked = True
+                await self._revoke(user_id, agent_id)
+
+    def _index(self, delegation: _Delegation):
+        self._by_user.setdefault(delegation.user_id, {})[delegation.agent_id] = delegation
+        self._by_agent.setdefault(delegation.agent_id, {})[delegation.user_id] = delegation
+
+    def _retire(self, delegation: _Delegation):
+        self._delegations.pop((delegation.user_id, delegation.agent_id), None)
+        for index, outer, inner in ((self._by_user, delegation.user_id, delegation.agent_id),
+                                    (self._by_agent, delegation.agent_id, delegation.user_id)):
+            entries = index.get(outer)
+            if entries is not None and entries.get(inner) is delegation:
+                del entries[inner]
+                if not entries:
+                    del index[outer]
+
+    def list(self, user_id: Optional[str] = None, agent_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Granted delegations, optionally filtered by user and/or agent"""
+        if user_id is not None and agent_id is not None:
+            delegation = self._by_user.get(user_id, {}).get(agent_id)
+            matches = [delegation] if delegation is not None else []
+        elif user_id is not None:
+            matches = list(self._by_user.get(user_id, {}).values())
+        elif agent_id is not None:
+            matches = list(self._by_agent.get(agent_id, {}).values())
+        else:
+            matches = [d for entries in self._by_user.values() for d in entries.values()]
+        return [d.to_dict() for d in matches]
+
+    async def reconcile(self, revoke_orphans: bool = False) -> Dict[str, Any]:
+        """One paginated /read pass to find temporary_reader tuples with no live delegation"""
+        # Other processes (replicas, main.py next to the A2A launcher) may share the store, so a
+        # tuple with no delegation here is not necessarily stale: only orphans in this process's
+        # own ledger are ever revoked, the rest are reported
+        scanned = 0
+        orphans: List[Dict[str, str]] = []
+        owned: List[DelegationKey] = []
+        present: Set[DelegationKey] = set()
+        async for tuple_key in self.openfga_tool.read_tuples():
+            scanned += 1
+            if tuple_key.get("relation") != "temporary_reader":
+                continue
+            user, object_id = tuple_key.get("user", ""), tuple_key.get("object", "")
+            if not (user.startswith("agent:") and object_id.startswith("gmail_account:")):
+                continue
+            key = (object_id[len("gmail_account:"):], user[len("agent:"):])
+            present.add(key)
+            if not self.is_active(*key):
+                orphans.append({"user": user, "relation": "temporary_reader", "object": object_id})
+                if key in self._ledger:
+                    owned.append(key)
+
+        revoked = 0
+        if owned and revoke_orphans:
+            deletes = [self.tuple_key(user_id, agent_id) for user_id, agent_id in owned]
+            # OpenFGA accepts at most 100 tuples per write
+            for i in range(0, len(deletes), 100):
+                chunk = deletes[i:i + 100]
+                await self.openfga_tool.execute({"action": "write", "deletes": chunk})
+                revoked += len(chunk)
+                self._ledger_update(remove=owned[i:i + 100])
+        # Ledger entries whose tuple is already gone have nothing left to prove
+        self._ledger_update(remove=[key for key in self._ledger if key not in present and not self.is_active(*key)])
+
+        if orphans:
+            logger.warning(
+                f"Found {len(orphans)} temporary_reader grants with no delegation in this process "
+                f"({len(owned)} written by it, revoked {revoked})"
+            )
+        self.last_reconcile = {
+            "at": datetime.utcnow().isoformat(),
+            "tuples_scanned": scanned,
+            "orphans_found": len(orphans),
+            "orphans_owned": len(owned),
+            "orphans_revoked": revoked,
+            "orphans": orphans[:100],
+        }
+        return self.last_reconcile
+
+    def _release_token(self, user_id: str):
+        remaining = self._user_refs.get(user_id, 0) - 1
+        if remaining > 0:
+            self._user_refs[user_id] = remaining
+        else:
+            self._user_refs.pop(user_id, None)
+            self.token_storage.discard(user_id)
+
+    def is_active(self, user_id: str, agent_id: str) -> bool:
+        """True while a delegation for (user, agent) is in flight and not revoked"""
+        delegation = self._delegations.get((user_id, agent_id))
+        return delegation is not None and delegation.count > 0 and not delegation.revoked
+
+    def active_count(self, user_id: str, agent_id: str) -> int:
+        delegation = self._delegations.get((user_id, agent_id))
+        return delegation.count if delegation is not None else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "active": len(self._delegations),
+            "references": sum(d.count for d in self._delegations.values()),
+            "grants_written": self.grants_written,
+            "grants_shared": self.grants_shared,
+            "revokes_written": self.revokes_written,
+            "ledger": len(self._ledger) if self.ledger_path is not None else None,
+            "last_reconcile": {k: v for k, v in self.last_reconcile.items() if k != "orphans"} if self.last_reconcile else None,
+        }
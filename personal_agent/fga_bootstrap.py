@@ -0,0 +1,152 @@
+"""
+OpenFGA store and authorization-model bootstrap
+Creates or locates the store, uploads gmail_authz.fga only when its content
+changed, and caches the resulting store/model IDs so restarts skip the lookup
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Any, Optional, Tuple
+
+import httpx
+
+from fga_evaluator import AuthorizationModel, default_model_path
+
+logger = logging.getLogger(__name__)
+
+def _canonical(value: Any) -> Any:
+    """Drop empty/null fields so locally rendered and server-returned models compare equal"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            item = _canonical(item)
+            # `this: {}` is meaningful (direct assignment); other empties are defaults
+            if key == "this" or item not in (None, "", [], {}):
+                result[key] = item
+        return result
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    return value
+
+def model_hash(model_json: Dict[str, Any]) -> str:
+    """Content hash of a model's schema version and type definitions"""
+    canonical = _canonical({
+        "schema_version": model_json.get("schema_version"),
+        "type_definitions": model_json.get("type_definitions", []),
+    })
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+class AuthorizationModelBootstrap:
+    """Resolves (store_id, authorization_model_id) for the Personal Agent at startup"""
+
+    def __init__(self,
+                 openfga_url: str,
+                 model_path: str,
+                 store_id: Optional[str] = None,
+                 store_name: str = "gmail_marketplace_store",
+                 state_path: str = ".fga_state.json"):
+        self.openfga_url = openfga_url
+        self.model_path = model_path
+        self.store_id = store_id or None
+        self.store_name = store_name
+        self.state_path = state_path
+
+    @classmethod
+    def from_env(cls, openfga_url: str, store_id: Optional[str]) -> 'AuthorizationModelBootstrap':
+        return cls(
+            openfga_url,
+            os.environ.get("FGA_MODEL_PATH", default_model_path()),
+            store_id=store_id,
+            store_name=os.environ.get("FGA_STORE_NAME", "gmail_marketplace_store"),
+            state_path=os.environ.get("FGA_STATE_FILE", ".fga_state.json"),
+        )
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not cache OpenFGA IDs in {self.state_path}: {str(e)}")
+
+    async def run(self, client: httpx.AsyncClient) -> Tuple[str, str]:
+        """Return (store_id, model_id), creating the store and uploading the model as needed"""
+        model_json = AuthorizationModel.from_file(self.model_path).to_json()
+        content_hash = model_hash(model_json)
+
+        state = self._load_state()
+        if (state.get("openfga_url") == self.openfga_url
+                and state.get("model_hash") == content_hash
+                and state.get("store_id")
+                and state.get("model_id")
+                and (self.store_id is None or state["store_id"] == self.store_id)):
+            # One cheap read guards against a datastore that was reset since
+            res = await client.get(
+                f"{self.openfga_url}/stores/{state['store_id']}/authorization-models/{state['model_id']}"
+            )
+            if res.is_success:
+                logger.info(f"Using cached OpenFGA store {state['store_id']} / model {state['model_id']}")
+                return state["store_id"], state["model_id"]
+            logger.info("Cached OpenFGA IDs are no longer valid, bootstrapping again")
+
+        store_id = self.store_id or await self._find_or_create_store(client)
+        model_id = await self._find_or_write_model(client, store_id, model_json, content_hash)
+
+        self._save_state({
+            "openfga_url": self.openfga_url,
+            "store_id": store_id,
+            "model_id": model_id,
+            "model_hash": content_hash,
+        })
+        return store_id, model_id
+
+    async def _find_or_create_store(self, client: httpx.AsyncClient) -> str:
+        params: Dict[str, Any] = {"page_size": 100}
+        while True:
+            res = await client.get(f"{self.openfga_url}/stores", params=params)
+            res.raise_for_status()
+            body = res.json()
+            for store in body.get("stores", []):
+                if store.get("name") == self.store_name:
+                    return store["id"]
+            if not body.get("continuation_token"):
+                break
+            params["continuation_token"] = body["continuation_token"]
+
+        res = await client.post(f"{self.openfga_url}/stores", json={"name": self.store_name})
+        res.raise_for_status()
+        store_id = res.json()["id"]
+        logger.info(f"Created OpenFGA store {self.store_name}: {store_id}")
+        return store_id
+
+    async def _find_or_write_model(self,
+                                   client: httpx.AsyncClient,
+                                   store_id: str,
+                                   model_json: Dict[str, Any],
+                                   content_hash: str) -> str:
+        # Models are listed newest first; only the latest counts as current
+        res = await client.get(
+            f"{self.openfga_url}/stores/{store_id}/authorization-models",
+            params={"page_size": 1}
+        )
+        res.raise_for_status()
+        models = res.json().get("authorization_models", [])
+        if models and model_hash(models[0]) == content_hash:
+            logger.info(f"OpenFGA model unchanged, pinning {models[0]['id']}")
+            return models[0]["id"]
+
+        res = await client.post(f"{self.openfga_url}/stores/{store_id}/authorization-models", json=model_json)
+        res.raise_for_status()
+        model_id = res.json()["authorization_model_id"]
+        logger.info(f"Uploaded OpenFGA model {model_id} to store {store_id}")
+        return model_id
@@ -0,0 +1,354 @@
+"""
+In-process OpenFGA check evaluator
+Compiles an OpenFGA DSL model into a rewrite graph and answers checks from a
+local tuple mirror kept in sync with the OpenFGA /changes feed
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# OpenFGA's default resolution depth for a single check
+MAX_RESOLUTION_DEPTH = 25
+
+CHECK_MODE_REMOTE = "remote"
+CHECK_MODE_LOCAL = "local"
+CHECK_MODE_VERIFY = "verify"
+CHECK_MODES = (CHECK_MODE_REMOTE, CHECK_MODE_LOCAL, CHECK_MODE_VERIFY)
+
+def default_model_path() -> str:
+    """Locate gmail_authz.fga next to the agent or one level up (repo layout)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    candidates = [
+        os.path.join(here, "openfga_model", "gmail_authz.fga"),
+        os.path.join(os.path.dirname(here), "openfga_model", "gmail_authz.fga"),
+    ]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[-1]
+
+class Rewrite:
+    """Node of a compiled relation rewrite"""
+
+class DirectRewrite(Rewrite):
+    """`[type, ...]` - the user is directly related through a stored tuple"""
+    def __init__(self, types: List[str]):
+        self.types = types
+
+class ComputedRewrite(Rewrite):
+    """`relation` - the user has another relation on the same object"""
+    def __init__(self, relation: str):
+        self.relation = relation
+
+class TupleToUsersetRewrite(Rewrite):
+    """`computed from tupleset` - the user has `computed` on an object related via `tupleset`"""
+    def __init__(self, tupleset: str, computed_relation: str):
+        self.tupleset = tupleset
+        self.computed_relation = computed_relation
+
+class SetRewrite(Rewrite):
+    """Union (`or`), intersection (`and`) or exclusion (`but not`) of child rewrites"""
+    def __init__(self, operator: str, children: List[Rewrite]):
+        self.operator = operator
+        self.children = children
+
+class AuthorizationModel:
+    """Compiled authorization model: type -> relation -> rewrite"""
+
+    def __init__(self, schema_version: str, type_definitions: Dict[str, Dict[str, Rewrite]]):
+        self.schema_version = schema_version
+        self.type_definitions = type_definitions
+
+    @classmethod
+    def from_file(cls, path: str) -> 'AuthorizationModel':
+        with open(path, "r") as f:
+            return cls.from_dsl(f.read())
+
+    @classmethod
+    def from_dsl(cls, text: str) -> 'AuthorizationModel':
+        """Parse the subset of the OpenFGA DSL used by this repo's models"""
+        schema_version = "1.1"
+        type_definitions: Dict[str, Dict[str, Rewrite]] = {}
+        current_type: Optional[str] = None
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or line.startswith("#") or line in ("model", "relations"):
+                continue
+            if line.startswith("schema "):
+                schema_version = line.split(None, 1)[1]
+            elif line.startswith("type "):
+                current_type = line.split(None, 1)[1]
+                type_definitions[current_type] = {}
+            elif line.startswith("define "):
+                if current_type is None:
+                    raise ValueError(f"Relation defined outside of a type: {raw_line}")
+                name, _, expression = line[len("define "):].partition(":")
+                type_definitions[current_type][name.strip()] = cls._parse_expression(expression.strip())
+            else:
+                raise ValueError(f"Unsupported model line: {raw_line}")
+
+        return cls(schema_version, type_definitions)
+
+    @classmethod
+    def _parse_expression(cls, expression: str) -> Rewrite:
+        if "(" in expression:
+            raise ValueError(f"Parenthesised rewrites are not supported: {expression}")
+
+        for keyword, operator in ((" but not ", "exclusion"), (" or ", "union"), (" and ", "intersection")):
+            if keyword in expression:
+                parts = [p.strip() for p in expression.split(keyword)]
+                if operator == "exclusion" and len(parts) != 2:
+                    raise ValueError(f"Exclusion takes exactly two operands: {expression}")
+                return SetRewrite(operator, [cls._parse_expression(p) for p in parts])
+
+        return cls._parse_term(expression)
+
+    @classmethod
+    def _parse_term(cls, term: str) -> Rewrite:
+        if term.startswith("["):
+            types_part, _, _ = term[1:].partition("]")
+            # `[agent] from manager` records who may write the tuple; there is no
+            # object hop to follow, so it evaluates as a direct assignment.
+            return DirectRewrite([t.strip() for t in types_part.split(",") if t.strip()])
+        if " from " in term:
+            computed, _, tupleset = term.partition(" from ")
+            return TupleToUsersetRewrite(tupleset.strip(), computed.strip())
+        return ComputedRewrite(term)
+
+    def rewrite(self, object_type: str, relation: str) -> Optional[Rewrite]:
+        return self.type_definitions.get(object_type, {}).get(relation)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Render the model as the JSON body of OpenFGA's WriteAuthorizationModel"""
+        type_definitions = []
+        for type_name, relations in self.type_definitions.items():
+            definition: Dict[str, Any] = {"type": type_name}
+            if relations:
+                definition["relations"] = {name: self._rewrite_json(r) for name, r in relations.items()}
+                definition["metadata"] = {"relations": {
+                    name: {"directly_related_user_types": [self._user_type_json(t) for t in self._direct_types(r)]}
+                    for name, r in relations.items()
+                }}
+            type_definitions.append(definition)
+        return {"schema_version": self.schema_version, "type_definitions": type_definitions}
+
+    @classmethod
+    def _rewrite_json(cls, rewrite: Rewrite) -> Dict[str, Any]:
+        if isinstance(rewrite, DirectRewrite):
+            return {"this": {}}
+        if isinstance(rewrite, ComputedRewrite):
+            return {"computedUserset": {"relation": rewrite.relation}}
+        if isinstance(rewrite, TupleToUsersetRewrite):
+            return {"tupleToUserset": {
+                "tupleset": {"relation": rewrite.tupleset},
+                "computedUserset": {"relation": rewrite.computed_relation},
+            }}
+        if isinstance(rewrite, SetRewrite):
+            children = [cls._rewrite_json(c) for c in rewrite.children]
+            if rewrite.operator == "exclusion":
+                return {"difference": {"base": children[0], "subtract": children[1]}}
+            return {rewrite.operator: {"child": children}}
+        raise TypeError(f"Unknown rewrite node: {rewrite!r}")
+
+    @classmethod
+    def _direct_types(cls, rewrite: Rewrite) -> List[str]:
+        if isinstance(rewrite, DirectRewrite):
+            return rewrite.types
+        if isinstance(rewrite, SetRewrite):
+            return [t for c in rewrite.children for t in cls._direct_types(c)]
+        return []
+
+    @staticmethod
+    def _user_type_json(user_type: str) -> Dict[str, Any]:
+        if user_type.endswith(":*"):
+            return {"type": user_type[:-2], "wildcard": {}}
+        if "#" in user_type:
+            type_name, relation = user_type.split("#", 1)
+            return {"type": type_name, "relation": relation}
+        return {"type": user_type}
+
+class TupleMirror:
+    """In-memory copy of the relationship tuples, indexed by (object, relation)"""
+
+    def __init__(self):
+        self._index: Dict[Tuple[str, str], Set[str]] = {}
+        self.continuation_token: Optional[str] = None
+        self.last_synced_at: Optional[float] = None
+
+    def write(self, user: str, relation: str, object_id: str):
+        self._index.setdefault((object_id, relation), set()).add(user)
+
+    def delete(self, user: str, relation: str, object_id: str):
+        users = self._index.get((object_id, relation))
+        if users is not None:
+            users.discard(user)
+            if not users:
+                del self._index[(object_id, relation)]
+
+    def users(self, object_id: str, relation: str) -> Set[str]:
+        return self._index.get((object_id, relation), set())
+
+    def __len__(self) -> int:
+        return sum(len(users) for users in self._index.values())
+
+class LocalCheckEvaluator:
+    """Answers OpenFGA checks in-process against a TupleMirror"""
+
+    def __init__(self,
+                 model: AuthorizationModel,
+                 openfga_url: str,
+                 store_id: str,
+                 poll_interval: float = 1.0,
+                 max_staleness: float = 5.0,
+                 page_size: int = 100):
+        self.model = model
+        self.openfga_url = openfga_url
+        self.store_id = store_id
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        self.page_size = page_size
+        self.mirror = TupleMirror()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, openfga_url: str, store_id: str) -> 'LocalCheckEvaluator':
+        model = AuthorizationModel.from_file(os.environ.get("FGA_MODEL_PATH", default_model_path()))
+        return cls(
+            model,
+            openfga_url,
+            store_id,
+            poll_interval=float(os.environ.get("FGA_LOCAL_POLL_INTERVAL", "1.0")),
+            max_staleness=float(os.environ.get("FGA_LOCAL_MAX_STALENESS", "5.0")),
+        )
+
+    def is_fresh(self) -> bool:
+        """True once the mirror has synced recently enough to answer checks"""
+        last = self.mirror.last_synced_at
+        return last is not None and (time.monotonic() - last) <= self.max_staleness
+
+    def check(self,
+              user: str,
+              relation: str,
+              object_id: str,
+              contextual_tuples: Optional[List[Dict[str, str]]] = None) -> bool:
+        """Evaluate a check against the mirror plus any request-scoped contextual tuples"""
+        overlay: Optional[TupleMirror] = None
+        if contextual_tuples:
+            overlay = TupleMirror()
+            for key in contextual_tuples:
+                overlay.write(key["user"], key["relation"], key["object"])
+        return self._check(user, relation, object_id, overlay, 0)
+
+    def _users(self, object_id: str, relation: str, overlay: Optional[TupleMirror]) -> Set[str]:
+        users = self.mirror.users(object_id, relation)
+        if overlay is None:
+            return users
+        return users | overlay.users(object_id, relation)
+
+    def _check(self, user: str, relation: str, object_id: str, overlay: Optional[TupleMirror], depth: int) -> bool:
+        if depth > MAX_RESOLUTION_DEPTH:
+            raise RecursionError(f"Resolution depth exceeded for {relation} on {object_id}")
+
+        object_type = object_id.split(":", 1)[0]
+        rewrite = self.model.rewrite(object_type, relation)
+        if rewrite is None:
+            return False
+        return self._eval(rewrite, user, relation, object_id, overlay, depth)
+
+    def _eval(self, rewrite: Rewrite, user: str, relation: str, object_id: str,
+              overlay: Optional[TupleMirror], depth: int) -> bool:
+        if isinstance(rewrite, DirectRewrite):
+            user_type = user.split(":", 1)[0]
+            if user_type not in rewrite.types:
+                return False
+            users = self._users(object_id, relation, overlay)
+            return user in users or f"{user_type}:*" in users
+        if isinstance(rewrite, ComputedRewrite):
+            return self._check(user, rewrite.relation, object_id, overlay, depth + 1)
+        if isinstance(rewrite, TupleToUsersetRewrite):
+            return any(
+                self._check(user, rewrite.computed_relation, parent, overlay, depth + 1)
+                for parent in self._users(object_id, rewrite.tupleset, overlay)
+            )
+        if isinstance(rewrite, SetRewrite):
+            if rewrite.operator == "union":
+                return any(self._eval(c, user, relation, object_id, overlay, depth) for c in rewrite.children)
+            if rewrite.operator == "intersection":
+                return all(self._eval(c, user, relation, object_id, overlay, depth) for c in rewrite.children)
+            base, subtract = rewrite.children
+            return (self._eval(base, user, relation, object_id, overlay, depth)
+                    and not self._eval(subtract, user, relation, object_id, overlay, depth))
+        raise TypeError(f"Unknown rewrite node: {rewrite!r}")
+
+    def apply_write(self, writes: List[Dict[str, str]], deletes: List[Dict[str, str]]):
+        """Write-through for tuples this process successfully wrote to OpenFGA"""
+        for key in deletes:
+            self.mirror.delete(key["user"], key["relation"], key["object"])
+        for key in writes:
+            self.mirror.write(key["user"], key["relation"], key["object"])
+
+    async def sync(self, client: httpx.AsyncClient):
+        """Drain the /changes feed from the last continuation token"""
+        while True:
+            params: Dict[str, Any] = {"page_size": self.page_size}
+            if self.mirror.continuation_token:
+                params["continuation_token"] = self.mirror.continuation_token
+
+            res = await client.get(f"{self.openfga_url}/stores/{self.store_id}/changes", params=params)
+            res.raise_for_status()
+            body = res.json()
+
+            changes = body.get("changes", [])
+            for change in changes:
+                key = change["tuple_key"]
+                if change.get("operation") == "TUPLE_OPERATION_DELETE":
+                    self.mirror.delete(key["user"], key["relation"], key["object"])
+                else:
+                    self.mirror.write(key["user"], key["relation"], key["object"])
+
+            if body.get("continuation_token"):
+                self.mirror.continuation_token = body["continuation_token"]
+            if len(changes) < self.page_size:
+                break
+
+        self.mirror.last_synced_at = time.monotonic()
+
+    async def _run(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.sync(client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"OpenFGA changes sync failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, client: httpx.AsyncClient):
+        """Start polling the changes feed in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        last = self.mirror.last_synced_at
+        return {
+            "tuples": len(self.mirror),
+            "fresh": self.is_fresh(),
+            "seconds_since_sync": None if last is None else round(time.monotonic() - last, 3),
+        }
@@ -0,0 +1,194 @@
+"""
+Incremental Gmail sync cache for the Personal Agent
+Keeps each user's message listing together with the mailbox historyId and
+brings it up to date through the history API instead of re-listing
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GMAIL_API = "https://www.googleapis.com/gmail/v1/users/me"
+
+# Messages carrying these labels are left out of messages.list by default
+HIDDEN_LABELS = ("SPAM", "TRASH")
+
+CacheKey = Tuple[str, int]  # (user_id, max_results)
+
+class ResyncRequired(Exception):
+    """The cached listing cannot be patched from history; list again"""
+
+class _Listing:
+    """One user's cached listing window and the historyId it is current as of"""
+    def __init__(self, listing: Dict[str, Any], history_id: str, size: int):
+        self.listing = listing
+        self.history_id = history_id
+        self.size = size
+        # Whether the mailbox holds more messages than the window shows
+        self.has_more = bool(listing.get("nextPageToken"))
+        self.fetched_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+class GmailSyncCache:
+    """LRU + TTL cache of message listings, refreshed with history.list deltas"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0, api_url: str = GMAIL_API):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.api_url = api_url
+        self._entries: 'OrderedDict[CacheKey, _Listing]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.resyncs = 0
+        self.evictions = 0
+        self.bytes_fetched = 0
+        self.bytes_saved = 0
+
+    async def read(self, client: httpx.AsyncClient, user_id: str, access_token: str, max_results: int = 3) -> Dict[str, Any]:
+        """Return the user's latest `max_results` messages, listing only when nothing usable is cached"""
+        headers = {"Authorization": f"Bearer {access_token}"}
+        if self.max_entries <= 0:
+            listing, _ = await self._list(client, headers, max_results)
+            return listing
+
+        key = (user_id, max_results)
+        entry = self._entries.get(key)
+        if entry is not None and entry.fetched_at + self.ttl < time.monotonic():
+            self._entries.pop(key, None)
+            entry = None
+
+        if entry is not None:
+            async with entry.lock:
+                try:
+                    delta_size = await self._apply_history(client, headers, entry, max_results)
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.bytes_saved += max(0, entry.size - delta_size)
+                    return entry.listing
+                except ResyncRequired:
+                    self.resyncs += 1
+                    self._entries.pop(key, None)
+
+        self.misses += 1
+        # Take the historyId first so changes racing with the listing are replayed next time
+        history_id = await self._history_id(client, headers)
+        listing, size = await self._list(client, headers, max_results)
+        self._store(key, _Listing(listing, history_id, size))
+        return listing
+
+    def invalidate(self, user_id: str):
+        """Drop every cached listing for a user"""
+        for key in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def _store(self, key: CacheKey, entry: _Listing):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _get(self, client: httpx.AsyncClient, headers: Dict[str, str], path: str,
+                   params: Any = None) -> Tuple[httpx.Response, int]:
+        res = await client.get(f"{self.api_url}/{path}", headers=headers, params=params)
+        self.bytes_fetched += len(res.content)
+        return res, len(res.content)
+
+    async def _history_id(self, client: httpx.AsyncClient, headers: Dict[str, str]) -> str:
+        res, _ = await self._get(client, headers, "profile")
+        res.raise_for_status()
+        return res.json()["historyId"]
+
+    async def _list(self, client: httpx.AsyncClient, headers: Dict[str, str], max_results: int) -> Tuple[Dict[str, Any], int]:
+        res, size = await self._get(client, headers, "messages", {"maxResults": max_results})
+        res.raise_for_status()
+        return res.json(), size
+
+    async def _apply_history(self, client: httpx.AsyncClient, headers: Dict[str, str],
+                             entry: _Listing, max_results: int) -> int:
+        """Patch the cached window with every change since its historyId; returns bytes fetched"""
+        params: List[Tuple[str, Any]] = [
+            ("startHistoryId", entry.history_id),
+            ("historyTypes", "messageAdded"),
+            ("historyTypes", "messageDeleted"),
+            ("historyTypes", "labelAdded"),
+            ("historyTypes", "labelRemoved"),
+        ]
+        messages: List[Dict[str, Any]] = list(entry.listing.get("messages", []))
+        changed = False
+        fetched = 0
+
+        while True:
+            res, size = await self._get(client, headers, "history", params)
+            fetched += size
+            # 404: startHistoryId is older than Gmail keeps history for
+            if res.status_code == 404:
+                raise ResyncRequired()
+            res.raise_for_status()
+            body = res.json()
+
+            for record in body.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added["message"]
+                    if any(label in HIDDEN_LABELS for label in message.get("labelIds", [])):
+                        continue
+                    if all(m["id"] != message["id"] for m in messages):
+                        messages.insert(0, {"id": message["id"], "threadId": message.get("threadId")})
+                        changed = True
+                for removed in record.get("messagesDeleted", []):
+                    messages, dropped = self._without(messages, removed["message"]["id"])
+                    changed = changed or dropped
+                for labelled in record.get("labelsAdded", []):
+                    if any(label in HIDDEN_LABELS for label in labelled.get("labelIds", [])):
+                        messages, dropped = self._without(messages, labelled["message"]["id"])
+                        changed = changed or dropped
+                for unlabelled in record.get("labelsRemoved", []):
+                    # A message restored from spam/trash goes back to its original
+                    # position, which history does not tell us
+                    if any(label in HIDDEN_LABELS for label in unlabelled.get("labelIds", [])):
+                        raise ResyncRequired()
+
+            latest_history_id = body.get("historyId", entry.history_id)
+            if not body.get("nextPageToken"):
+                break
+            params = [p for p in params if p[0] != "pageToken"] + [("pageToken", body["nextPageToken"])]
+
+        # A deletion inside a full window leaves a gap only a new listing can fill
+        if len(messages) < max_results and entry.has_more:
+            raise ResyncRequired()
+
+        if changed:
+            # Page tokens from the old listing no longer line up with the window
+            listing = {k: v for k, v in entry.listing.items() if k != "nextPageToken"}
+            listing["messages"] = messages[:max_results]
+            entry.listing = listing
+            entry.has_more = entry.has_more or len(messages) > max_results
+        entry.history_id = latest_history_id
+        return fetched
+
+    @staticmethod
+    def _without(messages: List[Dict[str, Any]], message_id: str) -> Tuple[List[Dict[str, Any]], bool]:
+        remaining = [m for m in messages if m["id"] != message_id]
+        return remaining, len(remaining) != len(messages)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "resyncs": self.resyncs,
+            "evictions": self.evictions,
+            "bytes_fetched": self.bytes_fetched,
+            "bytes_saved": self.bytes_saved,
+        }
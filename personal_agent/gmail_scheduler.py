@@ -0,0 +1,292 @@
+"""
+Quota-aware scheduler for Gmail API requests
+Per-user and global token buckets weighted by Gmail's quota unit cost per
+endpoint; over-budget requests wait in a fair queue instead of drawing 429s
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Any, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Quota units per method, from the Gmail API usage limits
+QUOTA_COSTS: List[Tuple[re.Pattern, int]] = [
+    (re.compile(r"/messages/send$"), 100),
+    (re.compile(r"/messages/batch\w+$"), 50),
+    (re.compile(r"/history$"), 2),
+    (re.compile(r"/profile$"), 1),
+    (re.compile(r"/messages/[^/]+/attachments/[^/]+$"), 5),
+    (re.compile(r"/messages/[^/]+$"), 5),
+    (re.compile(r"/messages$"), 5),
+]
+DEFAULT_COST = 5
+
+def quota_cost(request: httpx.Request) -> int:
+    path = request.url.path
+    for pattern, cost in QUOTA_COSTS:
+        if pattern.search(path):
+            return cost
+    return DEFAULT_COST
+
+def retry_after_seconds(response: httpx.Response, default: float = 1.0) -> float:
+    """Retry-After as delta-seconds or an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class QuotaExceeded(Exception):
+    """A Gmail request could not be scheduled before its deadline"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """`rate` quota units per second, bursting up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        # Nothing accrues while paused by Retry-After
+        elapsed = now - max(self.updated, self.paused_until)
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` units can be taken (0 if they can be now)"""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens -= min(cost, self.capacity)
+
+    def pause(self, seconds: float):
+        """Upstream said back off (Retry-After); also drain what we thought we had"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class _Waiter:
+    def __init__(self, cost: int):
+        self.cost = cost
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+class GmailQuotaScheduler:
+    """Admits Gmail requests against per-user and global buckets, round-robin across users"""
+
+    def __init__(self,
+                 user_rate: float = 250.0,
+                 user_burst: float = 250.0,
+                 global_rate: float = 20000.0,
+                 global_burst: float = 20000.0,
+                 max_wait: float = 10.0,
+                 max_retries: int = 2,
+                 max_users: int = 10000,
+                 resolve_user: Optional[Callable[[str], Optional[str]]] = None):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.max_users = max_users
+        # access token -> user_id, so a user keeps one bucket across token refreshes
+        self.resolve_user = resolve_user
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._user_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        # One FIFO per user; the dispatcher serves their heads in rotation
+        self._queues: 'OrderedDict[str, Deque[_Waiter]]' = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.retried = 0
+        self.units = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    @classmethod
+    def from_env(cls, resolve_user: Optional[Callable[[str], Optional[str]]] = None) -> Optional['GmailQuotaScheduler']:
+        if os.environ.get("GMAIL_QUOTA_SCHEDULER", "true").lower() not in ("1", "true", "yes"):
+            return None
+        env = os.environ
+        return cls(
+            user_rate=float(env.get("GMAIL_QUOTA_USER_RATE", "250")),
+            user_burst=float(env.get("GMAIL_QUOTA_USER_BURST", "250")),
+            global_rate=float(env.get("GMAIL_QUOTA_GLOBAL_RATE", "20000")),
+            global_burst=float(env.get("GMAIL_QUOTA_GLOBAL_BURST", "20000")),
+            max_wait=float(env.get("GMAIL_QUOTA_MAX_WAIT", "10")),
+            max_retries=int(env.get("GMAIL_QUOTA_MAX_RETRIES", "2")),
+            resolve_user=resolve_user,
+        )
+
+    def user_key(self, request: httpx.Request) -> str:
+        """The user whose OAuth token the request carries; the token itself if no user is known for it"""
+        credential = request.headers.get("Authorization", "")
+        access_token = credential[len("Bearer "):] if credential.startswith("Bearer ") else credential
+        user_id = self.resolve_user(access_token) if self.resolve_user is not None and access_token else None
+        if user_id is not None:
+            return user_id
+        return "token:" + hashlib.sha256(credential.encode()).hexdigest()[:16]
+
+    def _bucket(self, user_key: str) -> TokenBucket:
+        bucket = self._user_buckets.get(user_key)
+        if bucket is None:
+            bucket = self._user_buckets[user_key] = TokenBucket(self.user_rate, self.user_burst)
+            while len(self._user_buckets) > self.max_users:
+                oldest = next(iter(self._user_buckets))
+                if oldest in self._queues:
+                    break
+                del self._user_buckets[oldest]
+        self._user_buckets.move_to_end(user_key)
+        return bucket
+
+    async def handle(self,
+                     request: httpx.Request,
+                     send: Callable[[httpx.Request], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send `request` once it fits the budget, retrying 429s on idempotent reads"""
+        user_key = self.user_key(request)
+        cost = quota_cost(request)
+        deadline = time.monotonic() + self.max_wait
+        attempts = 0
+        while True:
+            await self.acquire(user_key, cost, deadline)
+            response = await send(request)
+            if response.status_code != 429:
+                return response
+
+            self.throttled += 1
+            delay = retry_after_seconds(response)
+            self._bucket(user_key).pause(delay)
+            self._wakeup.set()
+            if (request.method != "GET"
+                    or attempts >= self.max_retries
+                    or time.monotonic() + delay > deadline):
+                return response
+            attempts += 1
+            self.retried += 1
+            await response.aclose()
+
+    async def acquire(self, user_key: str, cost: int, deadline: Optional[float] = None):
+        """Take `cost` units for the user, waiting in the fair queue until `deadline`"""
+        now = time.monotonic()
+        deadline = deadline if deadline is not None else now + self.max_wait
+        bucket = self._bucket(user_key)
+
+        # Fast path only when nobody is queued, so waiters are never overtaken
+        if not self._queues:
+            wait = max(bucket.wait_time(cost, now), self.global_bucket.wait_time(cost, now))
+            if wait <= 0:
+                self._admit(bucket, cost, 0.0)
+                return
+
+        waiter = _Waiter(cost)
+        self._queues.setdefault(user_key, deque()).append(waiter)
+        self.queued += 1
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, deadline - now))
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                return
+            waiter.future.cancel()
+            self.rejected += 1
+            raise QuotaExceeded(
+                "Gmail quota budget exhausted for this user",
+                retry_after=max(bucket.wait_time(cost, time.monotonic()), 1.0)
+            )
+        except asyncio.CancelledError:
+            waiter.future.cancel()
+            raise
+
+    def _admit(self, bucket: TokenBucket, cost: int, waited: float):
+        bucket.take(cost)
+        self.global_bucket.take(cost)
+        self.admitted += 1
+        self.units += cost
+        self.total_wait += waited
+        self.max_observed_wait = max(self.max_observed_wait, waited)
+
+    async def _dispatch(self):
+        while self._queues:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_wake = self.max_wait
+            for user_key in list(self._queues):
+                queue = self._queues[user_key]
+                while queue and queue[0].future.done():
+                    queue.popleft()  # gave up (deadline or cancellation)
+                if not queue:
+                    del self._queues[user_key]
+                    continue
+
+                head = queue[0]
+                bucket = self._bucket(user_key)
+                wait = max(bucket.wait_time(head.cost, now), self.global_bucket.wait_time(head.cost, now))
+                if wait > 0:
+                    next_wake = min(next_wake, wait)
+                    continue
+
+                queue.popleft()
+                self._admit(bucket, head.cost, now - head.enqueued_at)
+                head.future.set_result(None)
+                # Served users go to the back of the rotation
+                if queue:
+                    self._queues.move_to_end(user_key)
+                    next_wake = 0.0
+                else:
+                    del self._queues[user_key]
+
+            if self._queues and next_wake > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_wake)
+                except asyncio.TimeoutError:
+                    pass
+            elif self._queues:
+                await asyncio.sleep(0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        waiting = [w for queue in self._queues.values() for w in queue if not w.future.done()]
+        return {
+            "queue_depth": len(waiting),
+            "queued_users": len(self._queues),
+            "oldest_wait_ms": round(max((now - w.enqueued_at for w in waiting), default=0.0) * 1000, 1),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "throttled_429": self.throttled,
+            "retried": self.retried,
+            "quota_units": self.units,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_observed_wait * 1000, 2),
+            "tracked_users": len(self._user_buckets),
+        }
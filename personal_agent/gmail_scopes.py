@@ -0,0 +1,187 @@
+"""
+Declarative data scopes for proxied Gmail reads
+Agents name the data they need (count, ids, metadata, snippet, body); scopes map to
+Gmail `fields=` / `format=` projections and are capped by the agent card
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+import httpx
+
+from gmail_cache import GMAIL_API
+from single_flight import SingleFlight
+from gmail_scheduler import QuotaExceeded
+
+@dataclass(frozen=True)
+class DataScope:
+    """The listing fields and per-message projection one scope grants"""
+    name: str
+    list_fields: Tuple[str, ...]
+    message_fields: Tuple[str, ...] = ()
+    message_format: Optional[str] = None
+    metadata_headers: Tuple[str, ...] = ()
+
+_ID_LISTING = ("messages(id,threadId)", "nextPageToken", "resultSizeEstimate")
+
+DATA_SCOPES: Dict[str, DataScope] = {
+    "count": DataScope("count", ("resultSizeEstimate",)),
+    "ids": DataScope("ids", _ID_LISTING),
+    "metadata": DataScope(
+        "metadata", _ID_LISTING,
+        message_fields=("id", "threadId", "labelIds", "payload/headers"),
+        message_format="metadata",
+        metadata_headers=("From", "To", "Subject", "Date"),
+    ),
+    "snippet": DataScope("snippet", _ID_LISTING, message_fields=("id", "threadId", "snippet"), message_format="minimal"),
+    # Full payloads are fetched but only decoded plain-text bodies are handed out
+    "body": DataScope(
+        "body", _ID_LISTING,
+        message_fields=("id", "threadId", "labelIds", "snippet", "payload"),
+        message_format="full",
+    ),
+}
+
+# Gmail message ids are hex strings; anything else would be spliced into the
+# upstream URL path (e.g. "../profile") and reach endpoints outside messages.get
+_MESSAGE_ID = re.compile(r"^[A-Za-z0-9]+$")
+
+# Upper bound on caller-supplied ids per detail fan-out
+MAX_MESSAGE_IDS = 500
+
+# Each format returns everything the ones after it do
+_FORMATS = ("full", "metadata", "minimal")
+
+# What a read returns when the task names no scopes, and what a card without
+# `data_scopes` is assumed to declare: the bare message listing
+DEFAULT_SCOPES = ["ids"]
+
+def _union(groups) -> Tuple[str, ...]:
+    seen: List[str] = []
+    for group in groups:
+        seen.extend(item for item in group if item not in seen)
+    return tuple(seen)
+
+class Projection:
+    """The combined Gmail query parameters for a set of scopes"""
+
+    def __init__(self, scopes: List[DataScope]):
+        self.scopes = [scope.name for scope in scopes]
+        self.list_fields = _union(scope.list_fields for scope in scopes)
+        self.message_fields = _union(scope.message_fields for scope in scopes)
+        self.metadata_headers = _union(scope.metadata_headers for scope in scopes)
+        formats = {scope.message_format for scope in scopes}
+        self.message_format = next((f for f in _FORMATS if f in formats), None)
+
+    @classmethod
+    def from_scopes(cls, names: Optional[List[str]]) -> 'Projection':
+        names = names or DEFAULT_SCOPES
+        unknown = [name for name in names if name not in DATA_SCOPES]
+        if unknown:
+            raise ValueError(f"Unknown data scopes: {', '.join(unknown)}")
+        return cls([DATA_SCOPES[name] for name in names])
+
+    @property
+    def needs_details(self) -> bool:
+        return self.message_format is not None
+
+    @property
+    def normalize_bodies(self) -> bool:
+        return "body" in self.scopes
+
+    @property
+    def fields(self) -> str:
+        """`fields=` value for messages.list"""
+        return ",".join(self.list_fields)
+
+    def message_params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"format": self.message_format, "fields": ",".join(self.message_fields)}
+        if self.metadata_headers and self.message_format == "metadata":
+            params["metadataHeaders"] = list(self.metadata_headers)
+        return params
+
+    def project_listing(self, listing: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the listing projection locally, e.g. to a cached full listing"""
+        keys = {field.split("(")[0] for field in self.list_fields}
+        projected = {k: v for k, v in listing.items() if k in keys}
+        if "messages" in projected:
+            projected["messages"] = [{"id": m["id"], "threadId": m.get("threadId")} for m in projected["messages"]]
+        return projected
+
+def resolve_scopes(requested: Optional[List[str]], card: Optional[Dict[str, Any]]) -> Projection:
+    """Projection for the requested scopes; PermissionError if they exceed the card's `data_scopes`"""
+    projection = Projection.from_scopes(requested)
+    declared = ((card or {}).get("metadata") or {}).get("data_scopes") or DEFAULT_SCOPES
+    excess = [name for name in projection.scopes if name not in declared]
+    if excess:
+        raise PermissionError(f"Requested data scopes exceed the agent card: {', '.join(excess)}")
+    return projection
+
+def validate_message_ids(message_ids: Any, max_ids: int = MAX_MESSAGE_IDS) -> List[str]:
+    """Caller-supplied message ids, checked before any of them reaches a Gmail URL; ValueError if malformed"""
+    if not isinstance(message_ids, list) or not message_ids:
+        raise ValueError("message_ids must be a non-empty list of message ids")
+    if len(message_ids) > max_ids:
+        raise ValueError(f"message_ids may name at most {max_ids} messages")
+    for message_id in message_ids:
+        if not isinstance(message_id, str) or not _MESSAGE_ID.match(message_id):
+            raise ValueError(f"Invalid message id: {message_id!r}")
+    return message_ids
+
+async def iter_message_details(client: httpx.AsyncClient,
+                               access_token: str,
+                               message_ids: List[str],
+                               projection: Projection,
+                               concurrency: int = 10,
+                               flights: Optional[SingleFlight] = None,
+                               api_url: str = GMAIL_API) -> AsyncIterator[Dict[str, Any]]:
+    """messages.get for each id, at most `concurrency` at a time, yielded in completion order
+
+    A message Gmail cannot return (e.g. deleted since it was listed) yields
+    `{"id": ..., "error": {...}}` instead of failing the whole fan-out.
+    Identical fetches already in flight for other callers are joined via `flights`.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = projection.message_params()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def get(message_id: str) -> httpx.Response:
+        async with semaphore:
+            return await client.get(f"{api_url}/messages/{message_id}", params=params, headers=headers)
+
+    async def fetch(message_id: str) -> Dict[str, Any]:
+        try:
+            if flights is not None:
+                key = ("message", access_token, message_id, projection.message_format, tuple(projection.message_fields))
+                res = await flights.do(key, lambda: get(message_id))
+            else:
+                res = await get(message_id)
+        except QuotaExceeded as e:
+            return {"id": message_id, "error": {"status": 429, "retry_after": e.retry_after}}
+        if res.is_error:
+            return {"id": message_id, "error": {"status": res.status_code}}
+        return res.json()
+
+    tasks = [asyncio.ensure_future(fetch(message_id)) for message_id in dict.fromkeys(message_ids)]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            yield await completed
+    finally:
+        # The consumer may stop early (client disconnect); don't leave fetches running
+        for task in tasks:
+            task.cancel()
+
+async def fetch_message_details(client: httpx.AsyncClient,
+                                access_token: str,
+                                message_ids: List[str],
+                                projection: Projection,
+                                concurrency: int = 10,
+                                flights: Optional[SingleFlight] = None,
+                                api_url: str = GMAIL_API) -> List[Dict[str, Any]]:
+    """All details for `message_ids`, fetched concurrently and returned in listing order"""
+    details = {}
+    async for detail in iter_message_details(client, access_token, message_ids, projection, concurrency, flights, api_url):
+        details[detail["id"]] = detail
+    return [details[message_id] for message_id in dict.fromkeys(message_ids) if message_id in details]
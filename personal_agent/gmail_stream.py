@@ -0,0 +1,113 @@
+"""
+Streaming, paginated Gmail message listings
+Pages are relayed to the caller chunk by chunk as NDJSON; the only things read
+out of the upstream bytes are the nextPageToken needed to request the next page
+and how many messages went past
+"""
+
+import json
+import re
+from typing import Dict, Any, AsyncIterator, Optional
+
+import httpx
+
+from gmail_cache import GMAIL_API
+from gmail_scheduler import QuotaExceeded
+
+# Gmail rejects messages.list with maxResults above 500
+MAX_PAGE_SIZE = 500
+
+_NEXT_PAGE_TOKEN = re.compile(rb'"nextPageToken"\s*:\s*"([^"]*)"')
+# messages.list entries are {"id": ..., "threadId": ...}; nothing else in a page has an "id" key
+_MESSAGE_ID = re.compile(rb'"id"\s*:')
+
+class PageTokenScanner:
+    """Finds nextPageToken and counts messages in a response body as it streams past, keeping only a short tail"""
+
+    def __init__(self, overlap: int = 256):
+        self.overlap = overlap
+        self.token: Optional[str] = None
+        self.messages = 0
+        self._tail = b""
+
+    def feed(self, chunk: bytes):
+        window = self._tail + chunk
+        match = _NEXT_PAGE_TOKEN.search(window)
+        if match:
+            self.token = match.group(1).decode()
+        # Matches that end inside the tail were counted with the previous chunk
+        self.messages += sum(1 for m in _MESSAGE_ID.finditer(window) if m.end() > len(self._tail))
+        self._tail = window[-self.overlap:]
+
+class StreamTally:
+    """What a streamed listing actually relayed, readable once the stream ends"""
+
+    def __init__(self):
+        self.pages = 0
+        self.messages = 0
+
+def clamp_page_size(page_size: Any, default: int = 3) -> int:
+    try:
+        page_size = int(page_size) if page_size is not None else default
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def list_params(page_size: int, page_token: Optional[str] = None, fields: Optional[str] = None) -> Dict[str, Any]:
+    """messages.list query; prettyPrint=false makes each page a single NDJSON-ready line"""
+    params: Dict[str, Any] = {"maxResults": page_size, "prettyPrint": "false"}
+    if page_token:
+        params["pageToken"] = page_token
+    if fields:
+        params["fields"] = fields
+    return params
+
+async def iter_message_pages(client: httpx.AsyncClient,
+                             access_token: str,
+                             page_size: int,
+                             page_token: Optional[str] = None,
+                             max_pages: int = 1,
+                             fields: Optional[str] = None,
+                             api_url: str = GMAIL_API,
+                             tally: Optional[StreamTally] = None) -> AsyncIterator[bytes]:
+    """Yield up to `max_pages` listing pages as NDJSON, forwarding upstream bytes unparsed
+
+    Memory per request is bounded by one upstream chunk plus the scanner tail,
+    whatever the mailbox size. Upstream failures after the first byte has been
+    sent are reported as a final `{"error": ...}` line. `tally`, if given, is
+    updated as pages complete.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for _ in range(max_pages):
+        scanner = PageTokenScanner()
+        partial = False
+        try:
+            async with client.stream("GET", f"{api_url}/messages", params=list_params(page_size, page_token, fields), headers=headers) as res:
+                if res.is_error:
+                    body = await res.aread()
+                    yield json.dumps({"error": {"status": res.status_code, "body": body.decode(errors="replace")}}).encode() + b"\n"
+                    return
+                async for chunk in res.aiter_bytes():
+                    scanner.feed(chunk)
+                    # JSON strings never hold raw newlines, so stripping them keeps the page on one line
+                    yield chunk.replace(b"\n", b"")
+                    partial = True
+        except QuotaExceeded as e:
+            yield json.dumps({"error": {"status": 429, "retry_after": e.retry_after}}).encode() + b"\n"
+            return
+        except httpx.HTTPError as e:
+            # A page cut off mid-body is ended as is, so the error still gets a line of its own
+            if partial:
+                yield b"\n"
+            yield json.dumps({"error": {"status": 502, "body": f"{type(e).__name__}: {e}"}}).encode() + b"\n"
+            return
+        finally:
+            if tally is not None:
+                tally.messages += scanner.messages
+        yield b"\n"
+        if tally is not None:
+            tally.pages += 1
+
+        page_token = scanner.token
+        if not page_token:
+            return
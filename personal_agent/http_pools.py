@@ -0,0 +1,170 @@
+"""
+Shared HTTP connection pools for the Personal Agent's upstreams
+One pooled httpx.AsyncClient per upstream (OpenFGA, Gmail, task agents),
+opened with the server lifespan and closed on shutdown
+"""
+
+import importlib.util
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Any, Optional, Protocol
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class UpstreamConfig:
+    """Pool limits and timeouts for one upstream"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 5.0
+    connect_timeout: float = 2.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, name: str, defaults: 'UpstreamConfig') -> 'UpstreamConfig':
+        """Read HTTP_POOL_<NAME>_* overrides on top of the given defaults"""
+        prefix = f"HTTP_POOL_{name.upper()}_"
+        env = os.environ
+        return cls(
+            max_connections=int(env.get(prefix + "MAX_CONNECTIONS", defaults.max_connections)),
+            max_keepalive_connections=int(env.get(prefix + "MAX_KEEPALIVE", defaults.max_keepalive_connections)),
+            keepalive_expiry=float(env.get(prefix + "KEEPALIVE_EXPIRY", defaults.keepalive_expiry)),
+            timeout=float(env.get(prefix + "TIMEOUT", defaults.timeout)),
+            connect_timeout=float(env.get(prefix + "CONNECT_TIMEOUT", defaults.connect_timeout)),
+            http2=env.get(prefix + "HTTP2", str(defaults.http2)).lower() in ("1", "true", "yes"),
+        )
+
+DEFAULT_UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "openfga": UpstreamConfig(timeout=5.0),
+    "gmail": UpstreamConfig(timeout=15.0),
+    "agents": UpstreamConfig(timeout=30.0),
+    "oauth": UpstreamConfig(max_connections=20, timeout=10.0),
+}
+
+class Admission(Protocol):
+    """Decides when a request may go upstream (e.g. a quota scheduler)"""
+    async def handle(self,
+                     request: httpx.Request,
+                     send: Callable[[httpx.Request], Awaitable[httpx.Response]]) -> httpx.Response: ...
+
+    def get_stats(self) -> Dict[str, Any]: ...
+
+class UpstreamPool(httpx.AsyncBaseTransport):
+    """A pooled client plus request counters for one upstream"""
+
+    def __init__(self, name: str, config: UpstreamConfig, admission: Optional[Admission] = None):
+        self.name = name
+        self.config = config
+        self.admission = admission
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self.http2 = config.http2
+        # httpx needs the optional 'h2' package for HTTP/2
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning(f"HTTP/2 requested for {name} pool but 'h2' is not installed, using HTTP/1.1")
+            self.http2 = False
+
+        self._transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        self.client = httpx.AsyncClient(
+            transport=self,
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.admission is not None:
+            return await self.admission.handle(request, self._send)
+        return await self._send(request)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        """Count requests around the real transport (until response headers arrive)"""
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        if response.status_code >= 500:
+            self.errors += 1
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def _connection_stats(self) -> Dict[str, int]:
+        # httpcore keeps its pool on the transport; not public API, so read defensively
+        connections = list(getattr(getattr(self._transport, "_pool", None), "connections", []) or [])
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "errors": self.errors,
+            "connections": self._connection_stats(),
+            "limits": {
+                "max_connections": self.config.max_connections,
+                "max_keepalive_connections": self.config.max_keepalive_connections,
+                "keepalive_expiry": self.config.keepalive_expiry,
+            },
+            "timeout": self.config.timeout,
+            "http2": self.http2,
+            "admission": self.admission.get_stats() if self.admission is not None else None,
+        }
+
+class HTTPPools:
+    """Registry of per-upstream pools"""
+
+    def __init__(self, configs: Dict[str, UpstreamConfig]):
+        self.configs = configs
+        self._pools: Dict[str, UpstreamPool] = {}
+        self._admissions: Dict[str, Admission] = {}
+
+    @classmethod
+    def from_env(cls) -> 'HTTPPools':
+        return cls({name: UpstreamConfig.from_env(name, defaults) for name, defaults in DEFAULT_UPSTREAMS.items()})
+
+    def set_admission(self, name: str, admission: Optional[Admission]):
+        """Gate every request to an upstream through `admission`"""
+        if admission is None:
+            self._admissions.pop(name, None)
+        else:
+            self._admissions[name] = admission
+        if name in self._pools:
+            self._pools[name].admission = admission
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        """Pooled client for an upstream, opened on first use if start() has not run yet"""
+        pool = self._pools.get(name)
+        if pool is None:
+            if name not in self.configs:
+                raise ValueError(f"Unknown upstream: {name}")
+            pool = self._pools[name] = UpstreamPool(name, self.configs[name], self._admissions.get(name))
+        return pool.client
+
+    async def start(self):
+        for name in self.configs:
+            self.client(name)
+
+    async def close(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            await pool.client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: pool.get_stats() for name, pool in self._pools.items()}
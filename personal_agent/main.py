@@ -1,10 +1,22 @@
-from fastapi import FastAPI, Request, HTTPException
-import httpx
+from fastapi import Depends, FastAPI, Header, Request, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import json
+import logging
 import os
+import httpx
+
+from personal_agent_adk import AgentSubsystems
+from gmail_cache import GMAIL_API
+from gmail_stream import PageTokenScanner, StreamTally, iter_message_pages, clamp_page_size, list_params
+from gmail_scopes import MAX_MESSAGE_IDS, Projection, resolve_scopes, fetch_message_details, iter_message_details, validate_message_ids
+from gmail_scheduler import QuotaExceeded
+from agent_guard import RateLimited
+from audit_log import AuditReader
 
 # --- Configuration ---
-OPENFGA_API_URL = os.environ.get("OPENFGA_API_URL")
-OPENFGA_STORE_ID = os.environ.get("OPENFGA_STORE_ID")
 GOOD_AGENT_URL = os.environ.get("GOOD_AGENT_URL")
 MALICIOUS_AGENT_URL = os.environ.get("MALICIOUS_AGENT_URL")
 
@@ -13,8 +25,57 @@ AGENT_URLS = {
     "malicious_agent": MALICIOUS_AGENT_URL
 }
 
-app = FastAPI()
-token_storage = {} # In-memory storage for this demo
+# Pools, OpenFGA, delegations and guards, built by the same factory PersonalAgent uses
+subsystems = AgentSubsystems(AGENT_URLS)
+pools = subsystems.pools
+token_storage = subsystems.token_storage
+gmail_scheduler = subsystems.gmail_scheduler
+fga_tool = subsystems.openfga_tool
+delegations = subsystems.delegations
+gmail_cache = subsystems.gmail_cache
+# Identical Gmail fetches in flight at the same moment share one upstream call;
+# every caller is still authorized on its own first
+gmail_flights = subsystems.gmail_tool.flights
+prefetch = subsystems.prefetch
+agent_cards = subsystems.agent_cards
+agent_limiter = subsystems.agent_limiter
+denials = subsystems.denials
+admin = subsystems.admin
+audit = subsystems.audit
+anomalies = subsystems.anomalies
+# Decodes "body" scope payloads in worker processes so MIME parsing never blocks the loop
+normalizer = subsystems.gmail_tool.normalizer
+capabilities = subsystems.capabilities
+
+# Upper bound on pages one streamed read may pull from Gmail
+GMAIL_STREAM_MAX_PAGES = int(os.environ.get("GMAIL_STREAM_MAX_PAGES", "20"))
+
+# Concurrent messages.get calls per detail fan-out
+GMAIL_DETAIL_CONCURRENCY = subsystems.gmail_tool.detail_concurrency
+
+# Upper bound on caller-supplied message_ids per detail read
+GMAIL_DETAIL_MAX_IDS = int(os.environ.get("GMAIL_DETAIL_MAX_IDS", str(MAX_MESSAGE_IDS)))
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await subsystems.start()
+    try:
+        yield
+    finally:
+        await subsystems.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(QuotaExceeded)
+@app.exception_handler(RateLimited)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))}
+    )
 
 # Agent Card for discovery
 AGENT_CARD = {
@@ -45,20 +106,78 @@ async def get_agent_card():
     """Return agent card for discovery"""
     return AGENT_CARD
 
+async def require_admin(authorization: Optional[str] = Header(None)):
+    """Operator-only endpoints: the audit trail, delegations and stats span every user and agent"""
+    if not admin.allows(authorization):
+        raise HTTPException(status_code=401, detail="Admin token required.", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/stats", dependencies=[Depends(require_admin)])
+async def get_stats():
+    """Report cache and authorization statistics"""
+    return subsystems.get_stats()
+
+@app.get("/admin/delegations", dependencies=[Depends(require_admin)])
+async def list_delegations(user_id: Optional[str] = None, agent_id: Optional[str] = None):
+    """List granted delegations by user and/or agent from the in-memory index"""
+    result = delegations.list(user_id=user_id, agent_id=agent_id)
+    return {"delegations": result, "count": len(result), "last_reconcile": delegations.last_reconcile}
+
+@app.get("/admin/audit", dependencies=[Depends(require_admin)])
+async def query_audit(since: Optional[float] = None,
+                      until: Optional[float] = None,
+                      agent_id: Optional[str] = None,
+                      kind: Optional[str] = None,
+                      limit: int = 1000):
+    """Scan the audit log by time range (epoch seconds), agent and comma-separated event kinds"""
+    if audit is None:
+        raise HTTPException(status_code=404, detail="Audit log is disabled.")
+    events = await asyncio.to_thread(
+        AuditReader(audit.directory).query,
+        limit=limit, since=since, until=until, agent_id=agent_id, kinds=kind.split(",") if kind else None
+    )
+    return {"events": events, "count": len(events)}
+
 async def fga_write(tuples: list = [], deletes: list = []):
-    async with httpx.AsyncClient() as client:
-        await client.post(
-            f"{OPENFGA_API_URL}/stores/{OPENFGA_STORE_ID}/write",
-            json={"writes": {"tuple_keys": tuples}, "deletes": {"tuple_keys": deletes}}
-        )
+    await fga_tool.execute({"action": "write", "writes": tuples, "deletes": deletes})
 
 async def fga_check(user: str, relation: str, object: str) -> bool:
-    async with httpx.AsyncClient() as client:
-        res = await client.post(
-            f"{OPENFGA_API_URL}/stores/{OPENFGA_STORE_ID}/check",
-            json={"tuple_key": {"user": user, "relation": relation, "object": object}}
-        )
-        return res.json().get("allowed", False)
+    res = await fga_tool.execute({"action": "check", "user": user, "relation": relation, "object": object})
+    return res.get("allowed", False)
+
+async def check_agent(agent_id: str, relation: str, user_id: str) -> bool:
+    """OpenFGA check for the agent on the user's account; recent denials are answered from memory"""
+    object_id = f"gmail_account:{user_id}"
+    return await denials.check(
+        (agent_id, relation, object_id),
+        lambda: fga_check(user=f"agent:{agent_id}", relation=relation, object=object_id),
+        remember=await agent_cards.get(agent_id) is not None
+    )
+
+async def observe_read(body: dict, messages: int, kind: str = "gmail_read"):
+    """Audit a proxied read of `messages` messages and feed it to the anomaly detector"""
+    if audit is not None:
+        audit.record(kind, agent_id=body.get("agent_id"), user_id=body.get("user_id"),
+                     messages=messages, scopes=body.get("scopes"))
+    if anomalies is not None:
+        await anomalies.observe_read(body.get("agent_id"), body.get("user_id"), messages)
+
+async def observe_denial(body: dict, relation: str):
+    if audit is not None:
+        audit.record("denied", agent_id=body.get("agent_id"), user_id=body.get("user_id"), relation=relation)
+    if anomalies is not None:
+        await anomalies.observe_denial(body.get("agent_id"), body.get("user_id"))
+
+async def limit_agent(agent_id: str):
+    """Spend one request from the calling agent's budget (RateLimited -> 429)"""
+    if agent_limiter is not None:
+        agent_limiter.admit(agent_id, await agent_cards.get(agent_id))
+
+def has_capability(body: dict, relation: str) -> bool:
+    """Verify a capability token locally against the caller and its live delegation"""
+    user_id = body.get("user_id")
+    agent_id = body.get("agent_id")
+    return (capabilities.verify(body.get("capability"), agent_id, user_id, relation)
+            and delegations.is_active(user_id, agent_id))
 
 @app.post("/delegate-and-run")
 async def delegate_and_run(request: Request):
@@ -68,43 +187,184 @@ async def delegate_and_run(request: Request):
     contracted_agent_id = body.get("contracted_agent_id")
     
     user_id = f"user:{google_sub}"
-    gmail_object = f"gmail_account:{user_id}"
-    agent_object_id = f"agent:{contracted_agent_id}"
-
-    token_storage[user_id] = access_token
 
-    await fga_write(tuples=[{"user": agent_object_id, "relation": "temporary_reader", "object": gmail_object}])
+    try:
+        await delegations.acquire(
+            user_id, contracted_agent_id, access_token,
+            refresh_token=body.get("refresh_token"),
+            expires_at=body.get("expires_at")
+        )
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"OpenFGA rejected the grant: {e.response.text}")
     
     agent_response = {}
+    # Everything after acquire() runs under the finally so the grant can never leak
+    capability = None
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post(AGENT_URLS[contracted_agent_id], json={"user_id": user_id})
-            res.raise_for_status()
-            agent_response = res.json()
+        capability = capabilities.mint(contracted_agent_id, user_id, "can_read_emails")
+        if prefetch is not None:
+            prefetch.start((user_id, contracted_agent_id), lambda: fetch_listing(user_id, access_token))
+        res = await pools.client("agents").post(
+            AGENT_URLS[contracted_agent_id],
+            json={"user_id": user_id, "capability": capability}
+        )
+        res.raise_for_status()
+        agent_response = res.json()
     finally:
-        await fga_write(deletes=[{"user": agent_object_id, "relation": "temporary_reader", "object": gmail_object}])
-        token_storage.pop(user_id, None)
+        # The token dies with this delegation even if another one for the pair is still running
+        capabilities.revoke(capability)
+        await delegations.release(user_id, contracted_agent_id)
 
     return agent_response
 
-@app.post("/proxy/gmail/read")
-async def proxy_gmail_read(request: Request):
-    body = await request.json()
+async def authorize_gmail_read(body: dict) -> str:
+    """Check the caller may read the user's mail and return the user's access token"""
     user_id = body.get("user_id")
     calling_agent_id = body.get("agent_id")
 
-    is_allowed = await fga_check(user=f"agent:{calling_agent_id}", relation="can_read_emails", object=f"gmail_account:{user_id}")
-    if not is_allowed:
-        raise HTTPException(status_code=403, detail="Forbidden by OpenFGA: Agent cannot read emails.")
+    await limit_agent(calling_agent_id)
+    if not has_capability(body, "can_read_emails"):
+        is_allowed = await check_agent(calling_agent_id, "can_read_emails", user_id)
+        if not is_allowed:
+            await observe_denial(body, "can_read_emails")
+            raise HTTPException(status_code=403, detail="Forbidden by OpenFGA: Agent cannot read emails.")
 
-    access_token = token_storage.get(user_id)
+    access_token = await token_storage.access_token(user_id)
     if not access_token:
         raise HTTPException(status_code=401, detail="No valid token for user.")
+    return access_token
+
+async def fetch_listing(user_id: str, access_token: str) -> dict:
+    """The default inbox window from the incremental cache, shared by concurrent readers"""
+    return await gmail_flights.do(
+        ("listing", user_id, 3),
+        lambda: gmail_cache.read(pools.client("gmail"), user_id, access_token, max_results=3)
+    )
+
+async def resolve_projection(body: dict, default_scopes: Optional[list] = None) -> Projection:
+    """The requested data scopes, capped by what the calling agent's card declares"""
+    try:
+        return resolve_scopes(body.get("scopes") or default_scopes, await agent_cards.get(body.get("agent_id")))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+@app.post("/proxy/gmail/read")
+async def proxy_gmail_read(request: Request):
+    body = await request.json()
+    access_token = await authorize_gmail_read(body)
+    projection = await resolve_projection(body)
+    user_id = body.get("user_id")
+    client = pools.client("gmail")
+
+    try:
+        # The default inbox preview is served from a delegation-time prefetch or
+        # the incremental cache, only after the caller passed the checks above
+        if body.get("page_size") is None and not body.get("page_token"):
+            listing = None
+            if prefetch is not None:
+                listing = await prefetch.take((user_id, body.get("agent_id")))
+            if listing is None:
+                listing = await fetch_listing(user_id, access_token)
+            listing = projection.project_listing(listing)
+        else:
+            query = list_params(clamp_page_size(body.get("page_size")), body.get("page_token"), projection.fields)
+            res = await gmail_flights.do(
+                ("page", user_id, tuple(sorted(query.items()))),
+                lambda: client.get(f"{GMAIL_API}/messages", params=query, headers={"Authorization": f"Bearer {access_token}"})
+            )
+            # Listing-only scopes are projected by Gmail, so the page is relayed byte for byte
+            if not projection.needs_details or res.is_error:
+                relayed = PageTokenScanner()
+                if not res.is_error:
+                    relayed.feed(res.content)
+                await observe_read(body, relayed.messages)
+                return Response(content=res.content, status_code=res.status_code, media_type="application/json")
+            listing = res.json()
+
+        if projection.needs_details and listing.get("messages"):
+            listing["messages"] = await fetch_message_details(
+                client, access_token, [m["id"] for m in listing["messages"]], projection,
+                concurrency=GMAIL_DETAIL_CONCURRENCY, flights=gmail_flights
+            )
+            if projection.normalize_bodies:
+                listing["messages"] = await normalizer.normalize(listing["messages"])
+        await observe_read(body, sum(1 for m in listing.get("messages", []) if "error" not in m))
+        return listing
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Gmail API error: {e.response.text}")
+
+@app.post("/proxy/gmail/read/stream")
+async def proxy_gmail_read_stream(request: Request):
+    """Stream up to `max_pages` listing pages of `page_size` messages as NDJSON"""
+    body = await request.json()
+    access_token = await authorize_gmail_read(body)
+    projection = await resolve_projection(body)
+    if projection.needs_details:
+        raise HTTPException(status_code=400, detail="Streamed reads only support listing scopes (count, ids); use /proxy/gmail/read/details.")
+
+    page_size = clamp_page_size(body.get("page_size"), default=100)
+    max_pages = max(1, min(int(body.get("max_pages", 1)), GMAIL_STREAM_MAX_PAGES))
+
+    async def pages():
+        tally = StreamTally()
+        try:
+            async for chunk in iter_message_pages(
+                pools.client("gmail"),
+                access_token,
+                page_size,
+                page_token=body.get("page_token"),
+                max_pages=max_pages,
+                fields=projection.fields,
+                tally=tally
+            ):
+                yield chunk
+        finally:
+            # What was relayed, not what was asked for: max_pages alone can be a legitimate large request
+            await observe_read(body, tally.messages, kind="gmail_read_stream")
+
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
+
+@app.post("/proxy/gmail/read/details")
+async def proxy_gmail_read_details(request: Request):
+    """Stream message details as NDJSON in completion order, fetched concurrently"""
+    body = await request.json()
+    access_token = await authorize_gmail_read(body)
+    projection = await resolve_projection(body, default_scopes=["metadata"])
+    if not projection.needs_details:
+        raise HTTPException(status_code=400, detail="Message details need a metadata, snippet or body scope.")
+
+    client = pools.client("gmail")
+    message_ids = body.get("message_ids")
+    if message_ids is not None:
+        try:
+            message_ids = validate_message_ids(message_ids, GMAIL_DETAIL_MAX_IDS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        try:
+            listing = await fetch_listing(body.get("user_id"), access_token)
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"Gmail API error: {e.response.text}")
+        message_ids = [m["id"] for m in listing.get("messages", [])]
+
+    async def lines():
+        relayed = 0
+        details = iter_message_details(client, access_token, message_ids, projection,
+                                       GMAIL_DETAIL_CONCURRENCY, gmail_flights)
+        if projection.normalize_bodies:
+            details = normalizer.iter_normalized(details)
+        try:
+            async for detail in details:
+                if "error" not in detail:
+                    relayed += 1
+                yield json.dumps(detail, separators=(",", ":")) + "\n"
+        finally:
+            # Only messages that were actually returned, counted once the stream ends
+            await observe_read(body, relayed, kind="gmail_read_details")
 
-    headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        res = await client.get("https://www.googleapis.com/gmail/v1/users/me/messages?maxResults=3", headers=headers)
-    return res.json()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.post("/proxy/gmail/send")
 async def proxy_gmail_send(request: Request):
@@ -112,8 +372,10 @@ async def proxy_gmail_send(request: Request):
     user_id = body.get("user_id")
     calling_agent_id = body.get("agent_id")
 
-    is_allowed = await fga_check(user=f"agent:{calling_agent_id}", relation="can_send_emails", object=f"gmail_account:{user_id}")
+    await limit_agent(calling_agent_id)
+    is_allowed = await check_agent(calling_agent_id, "can_send_emails", user_id)
     if not is_allowed:
+        await observe_denial(body, "can_send_emails")
         raise HTTPException(status_code=403, detail="Forbidden by OpenFGA: Agent cannot send emails.")
     
     return {"message": "This is a dummy response. If you see this, the check passed."}
\ No newline at end of file
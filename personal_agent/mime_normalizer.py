@@ -0,0 +1,232 @@
+"""
+MIME decoding and normalization for fetched Gmail messages
+Turns format=full / format=raw messages into compact plain-text bodies with the
+main headers, in a process pool so decoding never runs on the event loop
+"""
+
+import asyncio
+import base64
+import email
+import email.policy
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEPT_HEADERS = ("From", "To", "Cc", "Subject", "Date")
+
+class _TextExtractor(HTMLParser):
+    """HTML to text: drops script/style, breaks lines at block elements"""
+
+    BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+    SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skipping:
+            self._skipping -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return "".join(extractor.parts)
+
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+def compact(text: str) -> str:
+    return _BLANK_LINES.sub("\n\n", _SPACES.sub(" ", text)).strip()
+
+def _charset(content_type: str) -> str:
+    match = re.search(r'charset="?([\w.:-]+)"?', content_type or "", re.IGNORECASE)
+    return match.group(1) if match else "utf-8"
+
+def _decode_base64url(data: str, max_bytes: int) -> Tuple[bytes, bool]:
+    """Decode at most `max_bytes` of output; True if the input was cut"""
+    limit = (max_bytes + 2) // 3 * 4
+    truncated = len(data) > limit
+    data = data[:limit]
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)), truncated
+
+def _to_str(payload: bytes, charset: str) -> str:
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+def _walk_gmail_parts(part: Dict[str, Any], plain: List[str], html: List[str], budget: List[int]) -> bool:
+    """Collect text/plain and text/html bodies from a Gmail payload tree; True if anything was cut"""
+    truncated = False
+    mime_type = part.get("mimeType", "")
+    data = (part.get("body") or {}).get("data")
+    if data and mime_type in ("text/plain", "text/html"):
+        if budget[0] <= 0:
+            truncated = True
+        else:
+            headers = {h["name"].lower(): h["value"] for h in part.get("headers", [])}
+            raw, truncated = _decode_base64url(data, budget[0])
+            budget[0] -= len(raw)
+            text = _to_str(raw, _charset(headers.get("content-type", "")))
+            (plain if mime_type == "text/plain" else html).append(text)
+    for child in part.get("parts", []) or []:
+        truncated = _walk_gmail_parts(child, plain, html, budget) or truncated
+    return truncated
+
+def _from_raw(raw: str, max_bytes: int) -> Tuple[Dict[str, str], List[str], List[str], bool]:
+    message_bytes, truncated = _decode_base64url(raw, max_bytes)
+    message = email.message_from_bytes(message_bytes, policy=email.policy.default)
+    headers = {name: str(message[name]) for name in KEPT_HEADERS if message[name] is not None}
+    plain: List[str] = []
+    html: List[str] = []
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_disposition() == "attachment":
+            continue
+        content_type = part.get_content_type()
+        if content_type not in ("text/plain", "text/html"):
+            continue
+        payload = part.get_payload(decode=True) or b""
+        text = _to_str(payload, part.get_content_charset() or "utf-8")
+        (plain if content_type == "text/plain" else html).append(text)
+    return headers, plain, html, truncated
+
+def normalize_message(message: Dict[str, Any], max_bytes: int = 1_000_000, max_chars: int = 20_000) -> Dict[str, Any]:
+    """Compact `{id, threadId, headers, body}` for one Gmail message (format=full or format=raw)"""
+    result: Dict[str, Any] = {"id": message.get("id"), "threadId": message.get("threadId")}
+    if "error" in message:
+        result["error"] = message["error"]
+        return result
+    for key in ("labelIds", "snippet"):
+        if key in message:
+            result[key] = message[key]
+
+    try:
+        if message.get("raw"):
+            headers, plain, html, truncated = _from_raw(message["raw"], max_bytes)
+        else:
+            payload = message.get("payload") or {}
+            headers = {h["name"]: h["value"] for h in payload.get("headers", []) if h["name"] in KEPT_HEADERS}
+            plain, html = [], []
+            truncated = _walk_gmail_parts(payload, plain, html, [max_bytes])
+    except ValueError as e:
+        # binascii.Error from malformed base64; fail this message, not the whole chunk
+        result["error"] = {"status": 502, "body": f"Undecodable message body: {e}"}
+        return result
+
+    # Prefer the text/plain alternative; fall back to stripped HTML, then the snippet
+    if plain:
+        body = compact("\n\n".join(plain))
+    elif html:
+        body = compact("\n\n".join(html_to_text(h) for h in html))
+    else:
+        body = message.get("snippet", "")
+
+    if len(body) > max_chars:
+        body = body[:max_chars]
+        truncated = True
+    result.update({"headers": headers, "body": body, "truncated": truncated})
+    return result
+
+def normalize_batch(messages: List[Dict[str, Any]], max_bytes: int, max_chars: int) -> List[Dict[str, Any]]:
+    """Worker entry point: one pickled round trip per chunk of messages"""
+    return [normalize_message(m, max_bytes, max_chars) for m in messages]
+
+class MessageNormalizer:
+    """Runs normalize_message over a ProcessPoolExecutor in fixed-size chunks"""
+
+    def __init__(self, workers: int = 2, chunk_size: int = 8, max_bytes: int = 1_000_000, max_chars: int = 20_000):
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.messages = 0
+        self.chunks = 0
+        self.truncated = 0
+        self.busy_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> 'MessageNormalizer':
+        return cls(
+            workers=int(os.environ.get("GMAIL_NORMALIZE_WORKERS", "2")),
+            chunk_size=int(os.environ.get("GMAIL_NORMALIZE_CHUNK_SIZE", "8")),
+            max_bytes=int(os.environ.get("GMAIL_NORMALIZE_MAX_BYTES", "1000000")),
+            max_chars=int(os.environ.get("GMAIL_NORMALIZE_MAX_CHARS", "20000")),
+        )
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        # workers=0 decodes inline, which blocks the loop; only for tests/tiny deployments
+        if self.workers > 0 and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def normalize(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Normalized messages in input order"""
+        if not messages:
+            return []
+        started = time.perf_counter()
+        chunks = [messages[i:i + self.chunk_size] for i in range(0, len(messages), self.chunk_size)]
+        executor = self._executor()
+        if executor is None:
+            results = [normalize_batch(chunk, self.max_bytes, self.max_chars) for chunk in chunks]
+        else:
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, normalize_batch, chunk, self.max_bytes, self.max_chars)
+                for chunk in chunks
+            ])
+        normalized = [message for chunk in results for message in chunk]
+
+        self.messages += len(normalized)
+        self.chunks += len(chunks)
+        self.truncated += sum(1 for m in normalized if m.get("truncated"))
+        self.busy_seconds += time.perf_counter() - started
+        return normalized
+
+    async def iter_normalized(self, messages: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Normalize a stream of messages a chunk at a time, preserving arrival order"""
+        chunk: List[Dict[str, Any]] = []
+        async for message in messages:
+            chunk.append(message)
+            if len(chunk) >= self.chunk_size:
+                for normalized in await self.normalize(chunk):
+                    yield normalized
+                chunk = []
+        for normalized in await self.normalize(chunk):
+            yield normalized
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "messages": self.messages,
+            "chunks": self.chunks,
+            "truncated": self.truncated,
+            "avg_ms_per_message": round(self.busy_seconds / self.messages * 1000, 3) if self.messages else 0.0,
+        }
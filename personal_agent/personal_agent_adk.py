@@ -5,22 +5,55 @@ User's trusted agent that manages permissions and proxies Gmail API calls
 
 import sys
 import os
+import asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable, AsyncIterator
 import httpx
 import logging
 
 from adk_core.base_agent import BaseAgent, AgentCard, Tool
 from a2a_core.a2a_client import A2AClient
+from fga_evaluator import LocalCheckEvaluator, CHECK_MODE_REMOTE, CHECK_MODE_LOCAL, CHECK_MODE_VERIFY, CHECK_MODES
+from check_cache import CheckCache
+from http_pools import HTTPPools
+from write_batcher import TupleWriteBatcher
+from delegations import DelegationRegistry
+from capability_tokens import CapabilityTokenSigner
+from fga_bootstrap import AuthorizationModelBootstrap
+from gmail_cache import GmailSyncCache, GMAIL_API
+from gmail_stream import clamp_page_size, list_params
+from gmail_scopes import Projection, resolve_scopes, fetch_message_details, iter_message_details, validate_message_ids
+from agent_cards import AgentCardDirectory
+from single_flight import SingleFlight
+from gmail_scheduler import GmailQuotaScheduler
+from prefetch import PrefetchSlots
+from mime_normalizer import MessageNormalizer
+from token_vault import TokenVault
+from agent_guard import AdminGuard, AgentRateLimiter, DenialCache
+from access_monitor import AccessAnomalyDetector
+from audit_log import AuditLog, AuditReader
 
 logger = logging.getLogger(__name__)
 
 class GmailReadTool(Tool):
     """Tool for reading Gmail messages"""
     
-    def __init__(self, token_storage: Dict[str, str]):
+    def __init__(self,
+                 token_storage: TokenVault,
+                 pools: HTTPPools,
+                 cache: GmailSyncCache,
+                 detail_concurrency: int = 10,
+                 normalizer: Optional[MessageNormalizer] = None):
         self.token_storage = token_storage
+        self.pools = pools
+        self.cache = cache
+        self.detail_concurrency = detail_concurrency
+        # MIME decoding for the "body" scope runs in worker processes, off the event loop
+        self.normalizer = normalizer or MessageNormalizer()
+        # Identical Gmail fetches in flight at the same moment share one upstream call;
+        # callers are authorized individually before they get here
+        self.flights = SingleFlight()
         
     def name(self) -> str:
         return "gmail_read"
@@ -30,26 +63,138 @@ class GmailReadTool(Tool):
     
     async def execute(self, params: Dict[str, Any]) -> Any:
         user_id = params.get("user_id")
-        access_token = self.token_storage.get(user_id)
+        access_token = await self.token_storage.access_token(user_id)
         
         if not access_token:
             raise ValueError("No access token available for user")
         
-        headers = {"Authorization": f"Bearer {access_token}"}
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                "https://www.googleapis.com/gmail/v1/users/me/messages?maxResults=3",
-                headers=headers
+        projection = params.get("projection") or Projection.from_scopes(None)
+        page_size = params.get("page_size")
+        page_token = params.get("page_token")
+        client = self.pools.client("gmail")
+        
+        if params.get("prefetched") is not None:
+            listing = projection.project_listing(params["prefetched"])
+        elif page_size is None and not page_token:
+            listing = projection.project_listing(await self.fetch_listing(user_id))
+        else:
+            # Explicit pages bypass the cache, which only tracks the newest window
+            query = list_params(clamp_page_size(page_size), page_token, projection.fields)
+            res = await self.flights.do(
+                ("page", user_id, tuple(sorted(query.items()))),
+                lambda: client.get(f"{GMAIL_API}/messages", params=query, headers={"Authorization": f"Bearer {access_token}"})
             )
             res.raise_for_status()
-            return res.json()
+            # Parsed per caller so coalesced callers never share a mutable listing
+            listing = res.json()
+        
+        if projection.needs_details and listing.get("messages"):
+            listing["messages"] = await fetch_message_details(
+                client, access_token, [m["id"] for m in listing["messages"]], projection,
+                concurrency=self.detail_concurrency, flights=self.flights
+            )
+            if projection.normalize_bodies:
+                listing["messages"] = await self.normalizer.normalize(listing["messages"])
+        return listing
+    
+    async def fetch_listing(self, user_id: str) -> Dict[str, Any]:
+        """The default inbox window, unprojected; shared with callers reading it concurrently"""
+        access_token = await self.token_storage.access_token(user_id)
+        if not access_token:
+            raise ValueError("No access token available for user")
+        client = self.pools.client("gmail")
+        return await self.flights.do(
+            ("listing", user_id, 3),
+            lambda: self.cache.read(client, user_id, access_token, max_results=3)
+        )
+    
+    async def iter_details(self, user_id: str, message_ids: List[str], projection: Projection) -> AsyncIterator[Dict[str, Any]]:
+        """Message details for `message_ids` in completion order"""
+        access_token = await self.token_storage.access_token(user_id)
+        if not access_token:
+            raise ValueError("No access token available for user")
+        details = iter_message_details(
+            self.pools.client("gmail"), access_token, message_ids, projection,
+            concurrency=self.detail_concurrency, flights=self.flights
+        )
+        if projection.normalize_bodies:
+            details = self.normalizer.iter_normalized(details)
+        async for detail in details:
+            yield detail
 
 class OpenFGATool(Tool):
     """Tool for managing OpenFGA permissions"""
     
-    def __init__(self, openfga_url: str, store_id: str):
+    def __init__(self,
+                 openfga_url: str,
+                 store_id: str,
+                 pools: HTTPPools,
+                 evaluator: Optional[LocalCheckEvaluator] = None,
+                 check_mode: str = CHECK_MODE_REMOTE,
+                 check_cache: Optional[CheckCache] = None,
+                 batch_size: int = 50,
+                 max_in_flight: int = 10,
+                 write_batch_window: float = 0.0,
+                 write_batch_max_size: int = 100,
+                 authorization_model_id: Optional[str] = None,
+                 bootstrap: Optional[AuthorizationModelBootstrap] = None):
+        if check_mode not in CHECK_MODES:
+            raise ValueError(f"Unknown OpenFGA check mode: {check_mode}")
         self.openfga_url = openfga_url
         self.store_id = store_id
+        self.pools = pools
+        self.evaluator = evaluator
+        self.check_mode = check_mode
+        self.check_cache = check_cache
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        # Pinned on every check and write so OpenFGA skips resolving the latest model
+        self.authorization_model_id = authorization_model_id or None
+        self.bootstrap = bootstrap
+        # Flipped off the first time OpenFGA answers /batch-check with 404/405/501
+        self.batch_endpoint_available = True
+        # Set by the delegation registry in contextual mode: returns the in-memory
+        # temporary_reader tuples to attach to a check instead of persisting them
+        self.contextual_tuples: Optional[Callable[[Dict[str, str]], List[Dict[str, str]]]] = None
+        # Set by the owner to record every decision and tuple write
+        self.audit: Optional[AuditLog] = None
+        # Called with the tuples of every successful write, and of every tuple change
+        # made outside OpenFGA (contextual delegations), whoever initiated it
+        self.write_listeners: List[Callable[[List[Dict[str, str]]], None]] = []
+        self.write_batcher = None
+        if write_batch_window > 0:
+            self.write_batcher = TupleWriteBatcher(self._send_write, write_batch_window, write_batch_max_size)
+    
+    @classmethod
+    def from_env(cls, pools: HTTPPools) -> 'OpenFGATool':
+        """Build the tool from OPENFGA_* / FGA_* environment variables"""
+        openfga_url = os.environ.get("OPENFGA_API_URL", "http://openfga:8080")
+        store_id = os.environ.get("OPENFGA_STORE_ID", "")
+        check_mode = os.environ.get("FGA_CHECK_MODE", CHECK_MODE_REMOTE)
+        evaluator = None
+        if check_mode != CHECK_MODE_REMOTE:
+            evaluator = LocalCheckEvaluator.from_env(openfga_url, store_id)
+        bootstrap = None
+        if os.environ.get("FGA_BOOTSTRAP", "true").lower() in ("1", "true", "yes"):
+            bootstrap = AuthorizationModelBootstrap.from_env(openfga_url, store_id)
+        check_cache = None
+        cache_size = int(os.environ.get("FGA_CHECK_CACHE_SIZE", "10000"))
+        if cache_size > 0:
+            check_cache = CheckCache(cache_size, float(os.environ.get("FGA_CHECK_CACHE_TTL", "2.0")))
+        return cls(
+            openfga_url,
+            store_id,
+            pools,
+            evaluator=evaluator,
+            check_mode=check_mode,
+            check_cache=check_cache,
+            batch_size=int(os.environ.get("FGA_BATCH_CHECK_SIZE", "50")),
+            max_in_flight=int(os.environ.get("FGA_BATCH_MAX_IN_FLIGHT", "10")),
+            write_batch_window=float(os.environ.get("FGA_WRITE_BATCH_WINDOW_MS", "5")) / 1000,
+            write_batch_max_size=int(os.environ.get("FGA_WRITE_BATCH_MAX_SIZE", "100")),
+            authorization_model_id=os.environ.get("FGA_AUTHORIZATION_MODEL_ID"),
+            bootstrap=bootstrap
+        )
         
     def name(self) -> str:
         return "openfga_manage"
@@ -57,60 +202,400 @@ class OpenFGATool(Tool):
     def description(self) -> str:
         return "Manage fine-grained permissions with OpenFGA"
     
+    async def start(self):
+        """Bootstrap the store/model, then prime the local tuple mirror and keep it in sync"""
+        client = self.pools.client("openfga")
+        if self.bootstrap is not None:
+            try:
+                store_id, model_id = await self.bootstrap.run(client)
+                self.store_id = store_id
+                if self.authorization_model_id is None:
+                    self.authorization_model_id = model_id
+                if self.evaluator is not None:
+                    self.evaluator.store_id = store_id
+            except Exception as e:
+                logger.warning(f"OpenFGA bootstrap failed, continuing with store '{self.store_id}' and no pinned model: {str(e)}")
+        
+        if self.evaluator is None:
+            return
+        try:
+            await self.evaluator.sync(client)
+        except Exception as e:
+            logger.warning(f"Initial OpenFGA mirror sync failed, using remote checks until it recovers: {str(e)}")
+        self.evaluator.start(client)
+    
+    async def stop(self):
+        if self.write_batcher is not None:
+            await self.write_batcher.close()
+        if self.evaluator is not None:
+            await self.evaluator.stop()
+    
     async def execute(self, params: Dict[str, Any]) -> Any:
-        action = params.get("action")  # "grant" or "revoke"
+        action = params.get("action")  # "grant", "revoke", "write", "check" or "batch_check"
         user = params.get("user")
         relation = params.get("relation")
         object_id = params.get("object")
+        tuple_key = {"user": user, "relation": relation, "object": object_id}
         
-        async with httpx.AsyncClient() as client:
-            if action == "grant":
-                await client.post(
-                    f"{self.openfga_url}/stores/{self.store_id}/write",
-                    json={
-                        "writes": {
-                            "tuple_keys": [{
-                                "user": user,
-                                "relation": relation,
-                                "object": object_id
-                            }]
-                        }
-                    }
-                )
-                return {"status": "granted"}
-            elif action == "revoke":
-                await client.post(
-                    f"{self.openfga_url}/stores/{self.store_id}/write",
-                    json={
-                        "deletes": {
-                            "tuple_keys": [{
-                                "user": user,
-                                "relation": relation,
-                                "object": object_id
-                            }]
-                        }
-                    }
-                )
-                return {"status": "revoked"}
-            elif action == "check":
-                res = await client.post(
-                    f"{self.openfga_url}/stores/{self.store_id}/check",
-                    json={
-                        "tuple_key": {
-                            "user": user,
-                            "relation": relation,
-                            "object": object_id
-                        }
-                    }
-                )
-                return res.json()
+        if action == "grant":
+            await self._write(writes=[tuple_key])
+            return {"status": "granted"}
+        elif action == "revoke":
+            await self._write(deletes=[tuple_key])
+            return {"status": "revoked"}
+        elif action == "write":
+            await self._write(writes=params.get("writes", []), deletes=params.get("deletes", []))
+            return {"status": "written"}
+        elif action == "check":
+            result = await self._check(tuple_key)
+            self._audit("check", tuple_key, allowed=result.get("allowed", False))
+            return result
+        elif action == "batch_check":
+            result = await self._batch_check(params.get("checks", []))
+            for check in result["results"]:
+                self._audit("check", check["tuple_key"], allowed=check.get("allowed", False))
+            return result
         
         return {"status": "unknown_action"}
+    
+    def _audit(self, kind: str, tuple_key: Dict[str, str], **fields):
+        if self.audit is None:
+            return
+        user, object_id = tuple_key.get("user") or "", tuple_key.get("object") or ""
+        self.audit.record(
+            kind,
+            agent_id=user[len("agent:"):] if user.startswith("agent:") else None,
+            user_id=object_id[len("gmail_account:"):] if object_id.startswith("gmail_account:") else None,
+            subject=user,
+            relation=tuple_key.get("relation"),
+            object=object_id,
+            **fields
+        )
+    
+    async def _send_write(self, writes: List[Dict[str, str]], deletes: List[Dict[str, str]]) -> httpx.Response:
+        body = {}
+        if writes:
+            body["writes"] = {"tuple_keys": writes}
+        if deletes:
+            body["deletes"] = {"tuple_keys": deletes}
+        if self.authorization_model_id:
+            body["authorization_model_id"] = self.authorization_model_id
+        return await self.pools.client("openfga").post(f"{self.openfga_url}/stores/{self.store_id}/write", json=body)
+    
+    async def _write(self, writes: List[Dict[str, str]] = [], deletes: List[Dict[str, str]] = []) -> httpx.Response:
+        """Write/delete tuples; httpx.HTTPStatusError if OpenFGA rejected this caller's write"""
+        # Invalidate on both sides of the write: before, so checks already in
+        # flight cannot cache a pre-write answer; after, for anything cached meanwhile
+        if self.check_cache is not None:
+            self.check_cache.invalidate(writes + deletes)
+        
+        if self.write_batcher is not None:
+            res = await self.write_batcher.submit(writes, deletes)
+        else:
+            res = await self._send_write(writes, deletes)
+        
+        if self.check_cache is not None:
+            self.check_cache.invalidate(writes + deletes)
+        for kind, tuple_keys in (("grant", writes), ("revoke", deletes)):
+            for tuple_key in tuple_keys:
+                self._audit(kind, tuple_key, status=res.status_code)
+        if res.is_success and self.evaluator is not None:
+            self.evaluator.apply_write(writes, deletes)
+        # The batcher hands each caller its own result; a rejected write must not read as granted
+        res.raise_for_status()
+        if writes:
+            for listener in self.write_listeners:
+                listener(writes)
+        return res
+    
+    async def read_tuples(self, tuple_key: Optional[Dict[str, str]] = None, page_size: int = 100) -> AsyncIterator[Dict[str, str]]:
+        """Page through /read, yielding tuple keys (the whole store when no filter is given)"""
+        body: Dict[str, Any] = {"page_size": page_size}
+        if tuple_key:
+            body["tuple_key"] = tuple_key
+        while True:
+            res = await self.pools.client("openfga").post(f"{self.openfga_url}/stores/{self.store_id}/read", json=body)
+            res.raise_for_status()
+            page = res.json()
+            for item in page.get("tuples", []):
+                yield item["key"]
+            if not page.get("continuation_token"):
+                return
+            body["continuation_token"] = page["continuation_token"]
+    
+    def invalidate(self, tuple_keys: List[Dict[str, str]]):
+        """Drop cached decisions for tuples that changed outside of OpenFGA (contextual delegations)"""
+        if self.check_cache is not None:
+            self.check_cache.invalidate(tuple_keys)
+        for listener in self.write_listeners:
+            listener(tuple_keys)
+    
+    def _contextual_for(self, tuple_key: Dict[str, str]) -> List[Dict[str, str]]:
+        return self.contextual_tuples(tuple_key) if self.contextual_tuples is not None else []
+    
+    def _check_body(self, tuple_key: Dict[str, str]) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"tuple_key": tuple_key}
+        contextual = self._contextual_for(tuple_key)
+        if contextual:
+            body["contextual_tuples"] = {"tuple_keys": contextual}
+        if self.authorization_model_id:
+            body["authorization_model_id"] = self.authorization_model_id
+        return body
+    
+    def _local_check(self, tuple_key: Dict[str, str]) -> bool:
+        return self.evaluator.check(
+            tuple_key["user"], tuple_key["relation"], tuple_key["object"],
+            contextual_tuples=self._contextual_for(tuple_key)
+        )
+    
+    async def _remote_check(self, tuple_key: Dict[str, str]) -> Dict[str, Any]:
+        res = await self.pools.client("openfga").post(
+            f"{self.openfga_url}/stores/{self.store_id}/check",
+            json=self._check_body(tuple_key)
+        )
+        return res.json()
+    
+    async def _cached_remote_check(self, tuple_key: Dict[str, str]) -> Dict[str, Any]:
+        if self.check_cache is None:
+            return await self._remote_check(tuple_key)
+        
+        key = CheckCache.key(tuple_key)
+        cached = self.check_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        generation = self.check_cache.generation(tuple_key["object"])
+        result = await self._remote_check(tuple_key)
+        if "allowed" in result:
+            self.check_cache.set(key, result, generation)
+        return result
+    
+    async def _check(self, tuple_key: Dict[str, str]) -> Dict[str, Any]:
+        """Route a check to the local evaluator or OpenFGA depending on check_mode"""
+        if (self.check_mode == CHECK_MODE_REMOTE
+                or self.evaluator is None
+                or not self.evaluator.is_fresh()):
+            return await self._cached_remote_check(tuple_key)
+        
+        allowed = self._local_check(tuple_key)
+        
+        if self.check_mode == CHECK_MODE_VERIFY:
+            remote = await self._remote_check(tuple_key)
+            if remote.get("allowed", False) != allowed:
+                logger.warning(f"Local check disagrees with OpenFGA for {tuple_key}: local={allowed} remote={remote}")
+            return remote
+        
+        return {"allowed": allowed, "resolution": "local"}
+    
+    async def _batch_check(self, tuple_keys: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Check many tuples at once; results are returned in request order"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tuple_keys)
+        
+        if (self.check_mode == CHECK_MODE_LOCAL
+                and self.evaluator is not None
+                and self.evaluator.is_fresh()):
+            for i, tuple_key in enumerate(tuple_keys):
+                results[i] = {"allowed": self._local_check(tuple_key), "resolution": "local"}
+            return {"results": [{"tuple_key": k, **r} for k, r in zip(tuple_keys, results)]}
+        
+        # Verify mode answers batches remotely; OpenFGA stays authoritative there
+        pending: List[int] = []
+        generations: Dict[int, int] = {}
+        for i, tuple_key in enumerate(tuple_keys):
+            cached = self.check_cache.get(CheckCache.key(tuple_key)) if self.check_cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+                if self.check_cache is not None:
+                    generations[i] = self.check_cache.generation(tuple_key["object"])
+        
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        chunk_results = await asyncio.gather(*[
+            self._remote_batch_check([tuple_keys[i] for i in chunk], semaphore) for chunk in chunks
+        ])
+        
+        for chunk, answers in zip(chunks, chunk_results):
+            for i, result in zip(chunk, answers):
+                results[i] = result
+                if self.check_cache is not None and "allowed" in result and "error" not in result:
+                    self.check_cache.set(CheckCache.key(tuple_keys[i]), result, generations[i])
+        
+        return {"results": [{"tuple_key": k, **r} for k, r in zip(tuple_keys, results)]}
+    
+    async def _remote_batch_check(self, tuple_keys: List[Dict[str, str]], semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """Use OpenFGA /batch-check when the server has it, else bounded concurrent /check calls"""
+        if self.batch_endpoint_available:
+            body: Dict[str, Any] = {"checks": []}
+            for i, tuple_key in enumerate(tuple_keys):
+                check = self._check_body(tuple_key)
+                check.pop("authorization_model_id", None)  # set once for the whole batch
+                check["correlation_id"] = str(i)
+                body["checks"].append(check)
+            if self.authorization_model_id:
+                body["authorization_model_id"] = self.authorization_model_id
+            
+            async with semaphore:
+                res = await self.pools.client("openfga").post(
+                    f"{self.openfga_url}/stores/{self.store_id}/batch-check",
+                    json=body
+                )
+            if res.status_code in (404, 405, 501):
+                logger.info("OpenFGA has no /batch-check endpoint, falling back to concurrent /check calls")
+                self.batch_endpoint_available = False
+            else:
+                res.raise_for_status()
+                answers = res.json().get("result", {})
+                results = []
+                for i in range(len(tuple_keys)):
+                    answer = answers.get(str(i), {})
+                    result = {"allowed": answer.get("allowed", False)}
+                    if answer.get("error"):
+                        result["error"] = answer["error"]
+                    results.append(result)
+                return results
+        
+        async def check_one(tuple_key: Dict[str, str]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._remote_check(tuple_key)
+        
+        return list(await asyncio.gather(*[check_one(tuple_key) for tuple_key in tuple_keys]))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "store_id": self.store_id,
+            "authorization_model_id": self.authorization_model_id,
+            "check_mode": self.check_mode,
+            "check_cache": self.check_cache.get_stats() if self.check_cache is not None else None,
+            "local_evaluator": self.evaluator.get_stats() if self.evaluator is not None else None,
+            "write_batcher": self.write_batcher.get_stats() if self.write_batcher is not None else None,
+        }
+
+class AgentSubsystems:
+    """Everything both Personal Agent entry points (main.py and the A2A agent) share,
+    built once from the environment and started/stopped together"""
+    
+    def __init__(self, agent_urls: Optional[Dict[str, str]] = None):
+        # One pooled client per upstream, opened and closed with the server
+        self.pools = HTTPPools.from_env()
+        # Users' OAuth tokens, encrypted in memory and refreshed before they expire
+        self.token_storage = TokenVault.from_env(lambda: self.pools.client("oauth"))
+        # Gmail calls wait for per-user/global quota instead of drawing 429s
+        self.gmail_scheduler = GmailQuotaScheduler.from_env(resolve_user=self.token_storage.owner)
+        self.pools.set_admission("gmail", self.gmail_scheduler)
+        # Per-user listings patched from the Gmail history API between full reads
+        self.gmail_cache = GmailSyncCache(
+            int(os.environ.get("GMAIL_CACHE_SIZE", "1000")),
+            float(os.environ.get("GMAIL_CACHE_TTL", "300"))
+        )
+        # Owns the Gmail single-flight group and the MIME normalizer workers
+        self.gmail_tool = GmailReadTool(
+            self.token_storage,
+            self.pools,
+            self.gmail_cache,
+            detail_concurrency=int(os.environ.get("GMAIL_DETAIL_CONCURRENCY", "10")),
+            normalizer=MessageNormalizer.from_env()
+        )
+        self.openfga_tool = OpenFGATool.from_env(self.pools)
+        
+        # Overlapping delegations for the same (user, agent) share one grant and token
+        self.delegations = DelegationRegistry(
+            self.openfga_tool,
+            self.token_storage,
+            os.environ.get("FGA_DELEGATION_MODE", "persisted"),
+            ledger_path=os.environ.get("FGA_DELEGATION_LEDGER")
+        )
+        
+        # "report" logs temporary_reader grants with no delegation here; "revoke" also deletes
+        # the ones FGA_DELEGATION_LEDGER shows this process left behind in a crash; "off" skips
+        self.reconcile_mode = os.environ.get("FGA_RECONCILE_ON_STARTUP", "report")
+        
+        # Signs per-delegation capability tokens so proxied reads skip OpenFGA
+        self.capabilities = CapabilityTokenSigner.from_env()
+        
+        # Opt-in: start the delegated agent's inbox read as soon as access is granted;
+        # parked results are dropped when the grant is revoked
+        self.prefetch = None
+        if os.environ.get("GMAIL_PREFETCH", "false").lower() in ("1", "true", "yes"):
+            self.prefetch = PrefetchSlots(float(os.environ.get("GMAIL_PREFETCH_TTL", "30")))
+            self.delegations.revoke_listeners.append(lambda user_id, agent_id: self.prefetch.discard((user_id, agent_id)))
+        
+        # Calling agents' cards, from configured URLs or the agent_url they are reached at
+        self.agent_cards = AgentCardDirectory(
+            lambda: self.pools.client("agents"),
+            agent_urls,
+            ttl=float(os.environ.get("AGENT_CARD_TTL", "300"))
+        )
+        
+        # Per-calling-agent request budgets, tiered by the card's verified / trust_level
+        self.agent_limiter = AgentRateLimiter.from_env()
+        
+        # Repeat forbidden checks are answered from memory until the TTL passes or the agent is granted access
+        self.denials = DenialCache(float(os.environ.get("FGA_DENIAL_CACHE_TTL", "5")))
+        self.openfga_tool.write_listeners.append(self.denials.clear_for_tuples)
+        
+        # ADMIN_API_TOKEN guards stats, audit and delegation listings; unset, they are refused
+        self.admin = AdminGuard.from_env()
+        
+        # Decisions, grants/revokes and proxied reads, flushed to disk in the background
+        self.audit = AuditLog.from_env()
+        self.openfga_tool.audit = self.audit
+        
+        # Fixed-memory rate/volume sketches over proxied reads; ANOMALY_AUTO_REVOKE revokes on alerts
+        self.anomalies = AccessAnomalyDetector.from_env(revoke=self.delegations.revoke, is_active=self.delegations.is_active)
+    
+    async def start(self):
+        """Open upstream pools, bootstrap OpenFGA and its mirror, then reconcile delegations"""
+        await self.pools.start()
+        await self.openfga_tool.start()
+        await self.token_storage.start()
+        if self.audit is not None:
+            await self.audit.start()
+        await self.reconcile()
+    
+    async def reconcile(self):
+        """Find temporary_reader grants with no delegation here, per reconcile_mode"""
+        if self.reconcile_mode == "off":
+            return
+        try:
+            await self.delegations.reconcile(revoke_orphans=self.reconcile_mode == "revoke")
+        except Exception as e:
+            logger.warning(f"Delegation reconcile against OpenFGA failed: {str(e)}")
+    
+    async def stop(self):
+        await self.openfga_tool.stop()
+        await self.token_storage.stop()
+        await self.pools.close()
+        self.gmail_tool.normalizer.close()
+        if self.audit is not None:
+            await self.audit.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache and authorization statistics for every subsystem"""
+        return {
+            "openfga": self.openfga_tool.get_stats(),
+            "http_pools": self.pools.get_stats(),
+            "gmail_cache": self.gmail_cache.get_stats(),
+            "gmail_single_flight": self.gmail_tool.flights.get_stats(),
+            "gmail_quota": self.gmail_scheduler.get_stats() if self.gmail_scheduler is not None else None,
+            "gmail_prefetch": self.prefetch.get_stats() if self.prefetch is not None else None,
+            "gmail_normalizer": self.gmail_tool.normalizer.get_stats(),
+            "token_vault": self.token_storage.get_stats(),
+            "agent_cards": self.agent_cards.get_stats(),
+            "agent_rate_limits": self.agent_limiter.get_stats() if self.agent_limiter is not None else None,
+            "denial_cache": self.denials.get_stats(),
+            "access_anomalies": self.anomalies.get_stats() if self.anomalies is not None else None,
+            "audit_log": self.audit.get_stats() if self.audit is not None else None,
+            "delegations": self.delegations.get_stats(),
+            "capability_tokens": self.capabilities.get_stats(),
+            "admin": self.admin.get_stats()
+        }
 
 class PersonalAgent(BaseAgent):
     """Personal Agent - user's trusted agent managing Gmail access"""
     
-    def __init__(self):
+    def __init__(self, subsystems: Optional[AgentSubsystems] = None):
         # Create agent card
         agent_card = AgentCard(
             agent_id="personal_agent",
@@ -135,13 +620,23 @@ class PersonalAgent(BaseAgent):
         
         super().__init__(agent_card)
         
-        # Initialize tools
-        self.token_storage = {}
-        self.gmail_tool = GmailReadTool(self.token_storage)
-        self.openfga_tool = OpenFGATool(
-            os.environ.get("OPENFGA_API_URL", "http://openfga:8080"),
-            os.environ.get("OPENFGA_STORE_ID", "")
-        )
+        # Pools, OpenFGA, delegations and guards; main.py builds its own from the same factory
+        self.subsystems = subsystems or AgentSubsystems()
+        self.pools = self.subsystems.pools
+        self.token_storage = self.subsystems.token_storage
+        self.gmail_scheduler = self.subsystems.gmail_scheduler
+        self.gmail_cache = self.subsystems.gmail_cache
+        self.gmail_tool = self.subsystems.gmail_tool
+        self.openfga_tool = self.subsystems.openfga_tool
+        self.delegations = self.subsystems.delegations
+        self.capabilities = self.subsystems.capabilities
+        self.prefetch = self.subsystems.prefetch
+        self.agent_cards = self.subsystems.agent_cards
+        self.agent_limiter = self.subsystems.agent_limiter
+        self.denials = self.subsystems.denials
+        self.admin = self.subsystems.admin
+        self.audit = self.subsystems.audit
+        self.anomalies = self.subsystems.anomalies
         
         # Register tools
         self.register_tool(self.gmail_tool)
@@ -149,6 +644,13 @@ class PersonalAgent(BaseAgent):
         
         # A2A client for communicating with other agents
         self.a2a_client = A2AClient("personal_agent")
+    
+    async def startup(self):
+        """Open upstream connection pools and start the OpenFGA mirror sync"""
+        await self.subsystems.start()
+    
+    async def shutdown(self):
+        await self.subsystems.stop()
         
     async def execute_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Execute tasks related to Gmail management and delegation"""
@@ -161,8 +663,21 @@ class PersonalAgent(BaseAgent):
             return await self._revoke_access(task)
         elif task_type == "check_permission":
             return await self._check_permission(task)
+        elif task_type == "check_permissions":
+            return await self._check_permissions(task)
         elif task_type == "proxy_gmail_read":
             return await self._proxy_gmail_read(task)
+        elif task_type == "proxy_gmail_read_details":
+            return await self._proxy_gmail_read_details(task)
+        elif task_type == "list_delegations":
+            self._require_admin(task)
+            return self._list_delegations(task)
+        elif task_type == "query_audit":
+            self._require_admin(task)
+            return await self._query_audit(task)
+        elif task_type == "get_stats":
+            self._require_admin(task)
+            return self._get_stats()
         else:
             raise ValueError(f"Unknown task type: {task_type}")
     
@@ -174,19 +689,22 @@ class PersonalAgent(BaseAgent):
         access_token = task.get("access_token")
         agent_url = task.get("agent_url")
         
-        # Store access token
-        self.token_storage[user_id] = access_token
-        self.memorize(f"token_{user_id}", access_token)
+        self.agent_cards.register(agent_id, agent_url)
         
-        # Grant permission in OpenFGA
-        await self.use_tool("openfga_manage", {
-            "action": "grant",
-            "user": f"agent:{agent_id}",
-            "relation": "temporary_reader",
-            "object": f"gmail_account:{user_id}"
-        })
+        # Vault the tokens and grant permission in OpenFGA (first delegation only)
+        await self.delegations.acquire(
+            user_id, agent_id, access_token,
+            refresh_token=task.get("refresh_token"),
+            expires_at=task.get("expires_at")
+        )
         
+        # Everything after acquire() runs under the finally so the grant can never leak
+        capability = None
         try:
+            capability = self.capabilities.mint(agent_id, user_id, "can_read_emails")
+            if self.prefetch is not None:
+                self.prefetch.start((user_id, agent_id), lambda: self.gmail_tool.fetch_listing(user_id))
+            
             # Execute task on delegated agent via A2A
             if agent_url:
                 result = await self.a2a_client.execute_task(
@@ -194,23 +712,18 @@ class PersonalAgent(BaseAgent):
                     recipient_id=agent_id,
                     task={
                         "type": "summarize_emails",
-                        "user_id": user_id
+                        "user_id": user_id,
+                        "capability": capability
                     }
                 )
                 return result
             else:
                 return {"status": "delegated", "agent_id": agent_id}
         finally:
-            # Always revoke permission after task
-            await self.use_tool("openfga_manage", {
-                "action": "revoke",
-                "user": f"agent:{agent_id}",
-                "relation": "temporary_reader",
-                "object": f"gmail_account:{user_id}"
-            })
-            
-            # Clear token
-            self.token_storage.pop(user_id, None)
+            # The capability dies with this delegation; the grant and the access token
+            # go once no delegation still needs them
+            self.capabilities.revoke(capability)
+            await self.delegations.release(user_id, agent_id)
     
     async def _revoke_access(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Revoke access from an agent"""
@@ -218,12 +731,7 @@ class PersonalAgent(BaseAgent):
         user_id = task.get("user_id")
         agent_id = task.get("agent_id")
         
-        result = await self.use_tool("openfga_manage", {
-            "action": "revoke",
-            "user": f"agent:{agent_id}",
-            "relation": "temporary_reader",
-            "object": f"gmail_account:{user_id}"
-        })
+        await self.delegations.revoke(user_id, agent_id)
         
         return {"status": "revoked", "agent_id": agent_id}
     
@@ -243,31 +751,184 @@ class PersonalAgent(BaseAgent):
         
         return result
     
+    async def _check_permissions(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Check one relation for many agents on a user's account in a single batch"""
+        
+        user_id = task.get("user_id")
+        agent_ids = task.get("agent_ids", [])
+        relation = task.get("relation", "can_read_emails")
+        
+        result = await self.use_tool("openfga_manage", {
+            "action": "batch_check",
+            "checks": [
+                {"user": f"agent:{agent_id}", "relation": relation, "object": f"gmail_account:{user_id}"}
+                for agent_id in agent_ids
+            ]
+        })
+        
+        return {
+            "user_id": user_id,
+            "relation": relation,
+            "permissions": {
+                agent_id: check.get("allowed", False)
+                for agent_id, check in zip(agent_ids, result["results"])
+            }
+        }
+    
+    async def _authorize_gmail_read(self, task: Dict[str, Any]):
+        """Raise RateLimited over the agent's budget, PermissionError unless it may read the user's emails"""
+        
+        user_id = task.get("user_id")
+        agent_id = task.get("agent_id")
+        
+        card = await self.agent_cards.get(agent_id)
+        if self.agent_limiter is not None:
+            self.agent_limiter.admit(agent_id, card)
+        
+        # Check permission: a capability token from a live delegation is verified
+        # locally, anything else goes to OpenFGA unless it was just denied
+        if not self._has_capability(task, "can_read_emails"):
+            async def check() -> bool:
+                perm_check = await self._check_permission({
+                    "user_id": user_id,
+                    "agent_id": agent_id,
+                    "relation": "can_read_emails"
+                })
+                return perm_check.get("allowed", False)
+            
+            allowed = await self.denials.check(
+                (agent_id, "can_read_emails", f"gmail_account:{user_id}"), check, remember=card is not None
+            )
+            if not allowed:
+                if self.audit is not None:
+                    self.audit.record("denied", agent_id=agent_id, user_id=user_id, relation="can_read_emails")
+                if self.anomalies is not None:
+                    await self.anomalies.observe_denial(agent_id, user_id)
+                raise PermissionError(f"Agent {agent_id} not allowed to read emails")
+    
     async def _proxy_gmail_read(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Proxy Gmail read request after permission check"""
         
         user_id = task.get("user_id")
         agent_id = task.get("agent_id")
         
-        # Check permission
-        perm_check = await self._check_permission({
-            "user_id": user_id,
-            "agent_id": agent_id,
-            "relation": "can_read_emails"
-        })
+        await self._authorize_gmail_read(task)
+        
+        # Never hand out more than the caller's card declares
+        projection = resolve_scopes(task.get("scopes"), await self.agent_cards.get(agent_id))
         
-        if not perm_check.get("allowed", False):
-            raise PermissionError(f"Agent {agent_id} not allowed to read emails")
+        # A listing prefetched when the delegation was granted is handed out only
+        # now, after the caller passed the same checks as any other read
+        prefetched = None
+        if self.prefetch is not None and task.get("page_size") is None and not task.get("page_token"):
+            prefetched = await self.prefetch.take((user_id, agent_id))
         
         # Read emails
-        emails = await self.use_tool("gmail_read", {"user_id": user_id})
+        emails = await self.use_tool("gmail_read", {
+            "user_id": user_id,
+            "page_size": task.get("page_size"),
+            "page_token": task.get("page_token"),
+            "projection": projection,
+            "prefetched": prefetched
+        })
         
         # Log access
+        if self.audit is not None:
+            self.audit.record("gmail_read", agent_id=agent_id, user_id=user_id,
+                              messages=len(emails.get("messages", [])), scopes=projection.scopes)
+        if self.anomalies is not None:
+            await self.anomalies.observe_read(agent_id, user_id, len(emails.get("messages", [])))
         self.session_state.add_to_history({
             "action": "gmail_read",
             "agent_id": agent_id,
             "user_id": user_id,
-            "email_count": len(emails.get("messages", []))
+            "email_count": len(emails.get("messages", [])),
+            "scopes": projection.scopes
         })
         
-        return emails
\ No newline at end of file
+        return emails
+    
+    async def iter_gmail_read_details(self, task: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Authorize once, then yield message details as each concurrent fetch completes"""
+        
+        user_id = task.get("user_id")
+        agent_id = task.get("agent_id")
+        
+        # One authorization decision covers every message in the call
+        await self._authorize_gmail_read(task)
+        projection = resolve_scopes(task.get("scopes") or ["metadata"], await self.agent_cards.get(agent_id))
+        if not projection.needs_details:
+            raise ValueError("Message details need a metadata, snippet or body scope")
+        
+        message_ids = task.get("message_ids")
+        if message_ids is not None:
+            message_ids = validate_message_ids(message_ids)
+        else:
+            listing = await self.use_tool("gmail_read", {
+                "user_id": user_id,
+                "page_size": task.get("page_size"),
+                "page_token": task.get("page_token")
+            })
+            message_ids = [m["id"] for m in listing.get("messages", [])]
+        
+        relayed = 0
+        try:
+            async for detail in self.gmail_tool.iter_details(user_id, message_ids, projection):
+                if "error" not in detail:
+                    relayed += 1
+                yield detail
+        finally:
+            # Recorded by what was handed out, once the caller stops consuming
+            if self.audit is not None:
+                self.audit.record("gmail_read_details", agent_id=agent_id, user_id=user_id,
+                                  messages=relayed, scopes=projection.scopes)
+            if self.anomalies is not None:
+                await self.anomalies.observe_read(agent_id, user_id, relayed)
+            self.session_state.add_to_history({
+                "action": "gmail_read_details",
+                "agent_id": agent_id,
+                "user_id": user_id,
+                "email_count": relayed,
+                "scopes": projection.scopes
+            })
+    
+    async def _proxy_gmail_read_details(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch details for a listing concurrently; results are in completion order"""
+        messages = [detail async for detail in self.iter_gmail_read_details(task)]
+        return {"messages": messages, "count": len(messages)}
+    
+    def _has_capability(self, task: Dict[str, Any], relation: str) -> bool:
+        """Verify the task's capability token against the caller and its delegation"""
+        user_id = task.get("user_id")
+        agent_id = task.get("agent_id")
+        return (self.capabilities.verify(task.get("capability"), agent_id, user_id, relation)
+                and self.delegations.is_active(user_id, agent_id))
+    
+    def _require_admin(self, task: Dict[str, Any]):
+        """Operator-only tasks span every user and agent, and any A2A caller can send them"""
+        if not self.admin.allows(task.get("admin_token")):
+            raise PermissionError(f"Task {task.get('type')} requires the admin token")
+    
+    async def _query_audit(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Scan the audit log by time range (epoch seconds), agent and event kinds"""
+        if self.audit is None:
+            raise ValueError("Audit log is disabled")
+        reader = AuditReader(self.audit.directory)
+        events = await asyncio.to_thread(
+            reader.query,
+            limit=int(task.get("limit", 1000)),
+            since=task.get("since"),
+            until=task.get("until"),
+            agent_id=task.get("agent_id"),
+            kinds=task.get("kinds")
+        )
+        return {"events": events, "count": len(events)}
+    
+    def _list_delegations(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """List granted delegations, filtered by user and/or agent"""
+        delegations = self.delegations.list(user_id=task.get("user_id"), agent_id=task.get("agent_id"))
+        return {"delegations": delegations, "count": len(delegations)}
+    
+    def _get_stats(self) -> Dict[str, Any]:
+        """Report cache and authorization statistics"""
+        return self.subsystems.get_stats()
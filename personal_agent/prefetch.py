@@ -0,0 +1,88 @@
+"""
+Speculative Gmail prefetch for delegations
+Starts the delegated agent's expected Gmail read when the delegation is granted
+and parks the result in a per-delegation slot until the agent asks for it
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SlotKey = Tuple[str, str]  # (user_id, agent_id)
+
+class _Slot:
+    def __init__(self, task: asyncio.Task, ttl: float):
+        self.task = task
+        self.expires_at = time.monotonic() + ttl
+
+class PrefetchSlots:
+    """One in-flight or completed prefetch per delegation, served at most once"""
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._slots: Dict[SlotKey, _Slot] = {}
+        self.started = 0
+        self.served = 0
+        self.discarded = 0
+        self.expired = 0
+        self.failed = 0
+
+    def start(self, key: SlotKey, fetch: Callable[[], Awaitable[Any]]):
+        """Begin `fetch()` in the background unless a prefetch for `key` is already parked"""
+        slot = self._slots.get(key)
+        if slot is not None and slot.expires_at > time.monotonic():
+            return
+        self.discard(key, count=False)
+        self._slots[key] = _Slot(asyncio.create_task(fetch()), self.ttl)
+        self.started += 1
+
+    async def take(self, key: SlotKey) -> Optional[Any]:
+        """The prefetched result (awaiting it if still running), or None to fetch normally"""
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return None
+        if slot.expires_at < time.monotonic():
+            slot.task.cancel()
+            slot.task.add_done_callback(self._retrieve)
+            self.expired += 1
+            return None
+        try:
+            result = await asyncio.shield(slot.task)
+        except asyncio.CancelledError:
+            if slot.task.cancelled():
+                return None
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.info(f"Prefetch for {key[1]} on {key[0]} failed, reading directly: {str(e)}")
+            return None
+        self.served += 1
+        return result
+
+    def discard(self, key: SlotKey, count: bool = True):
+        """Drop a slot (the delegation was revoked), cancelling the fetch if it is still running"""
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        slot.task.cancel()
+        slot.task.add_done_callback(self._retrieve)
+        if count:
+            self.discarded += 1
+
+    @staticmethod
+    def _retrieve(task: asyncio.Task):
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "parked": len(self._slots),
+            "started": self.started,
+            "served": self.served,
+            "discarded": self.discarded,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
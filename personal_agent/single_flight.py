@@ -0,0 +1,48 @@
+"""
+Single-flight deduplication for upstream fetches
+Concurrent callers asking for the same key share one in-flight call and its result
+"""
+
+import asyncio
+from typing import Dict, Any, Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Runs at most one call per key at a time; later callers await the same future"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()`, or the identical call already in flight for `key`"""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller giving up does not cancel the fetch for the others
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the error retrieved even if every waiter was cancelled
+        if not flight.cancelled():
+            flight.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._flights),
+        }
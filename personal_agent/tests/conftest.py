@@ -0,0 +1,12 @@
+"""
+Test setup for the Personal Agent
+Modules import each other flat (`from gmail_cache import ...`), as they do when the
+agent runs from its own directory
+"""
+
+import os
+import sys
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+sys.path.insert(1, os.path.dirname(AGENT_DIR))
@@ -0,0 +1,79 @@
+"""
+In-memory Gmail stand-in served through httpx.MockTransport
+Implements the profile, messages.list, messages.get and history.list calls the Gmail readers make,
+with a mailbox the test mutates and a history window it can expire
+"""
+
+from typing import Dict, Any, List, Tuple
+
+import httpx
+
+class GmailStub:
+    """One mailbox; every change gets a new historyId and a history record"""
+
+    def __init__(self, messages: int = 5):
+        self.history_id = 100
+        # Gmail lists newest first
+        self.messages: List[Dict[str, Any]] = [
+            {"id": f"m{i}", "threadId": f"t{i}"} for i in reversed(range(messages))
+        ]
+        self.history: List[Tuple[int, Dict[str, Any]]] = []
+        self.oldest_history_id = self.history_id
+        self.requests: List[str] = []
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    def calls(self, endpoint: str) -> int:
+        return sum(1 for path in self.requests if path == endpoint)
+
+    def _record(self, **change) -> int:
+        self.history_id += 1
+        self.history.append((self.history_id, {"id": str(self.history_id), **change}))
+        return self.history_id
+
+    def add_message(self, message_id: str, labels: Tuple[str, ...] = ("INBOX",)):
+        message = {"id": message_id, "threadId": f"t-{message_id}", "labelIds": list(labels)}
+        if not any(label in ("SPAM", "TRASH") for label in labels):
+            self.messages.insert(0, {"id": message_id, "threadId": message["threadId"]})
+        self._record(messagesAdded=[{"message": message}])
+
+    def delete_message(self, message_id: str):
+        self.messages = [m for m in self.messages if m["id"] != message_id]
+        self._record(messagesDeleted=[{"message": {"id": message_id}}])
+
+    def add_labels(self, message_id: str, *labels: str):
+        if any(label in ("SPAM", "TRASH") for label in labels):
+            self.messages = [m for m in self.messages if m["id"] != message_id]
+        self._record(labelsAdded=[{"message": {"id": message_id}, "labelIds": list(labels)}])
+
+    def expire_history(self):
+        """Forget every record so far, as Gmail does after about a week"""
+        self.history.clear()
+        self.oldest_history_id = self.history_id
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        parent, endpoint = request.url.path.rsplit("/", 2)[-2:]
+        self.requests.append(endpoint)
+        params = request.url.params
+        if parent == "messages":
+            message = next((m for m in self.messages if m["id"] == endpoint), None)
+            if message is None:
+                return httpx.Response(404, json={"error": {"code": 404, "message": "Requested entity was not found."}})
+            return httpx.Response(200, json={**message, "snippet": f"snippet {endpoint}"})
+        if endpoint == "profile":
+            return httpx.Response(200, json={"emailAddress": "user@example.com", "historyId": str(self.history_id)})
+        if endpoint == "messages":
+            max_results = int(params.get("maxResults", 100))
+            start = int(params.get("pageToken", 0))
+            body: Dict[str, Any] = {"messages": self.messages[start:start + max_results], "resultSizeEstimate": len(self.messages)}
+            if len(self.messages) > start + max_results:
+                body["nextPageToken"] = str(start + max_results)
+            return httpx.Response(200, json=body)
+        if endpoint == "history":
+            start = int(params["startHistoryId"])
+            if start < self.oldest_history_id:
+                return httpx.Response(404, json={"error": {"code": 404, "message": "Requested entity was not found."}})
+            records = [record for history_id, record in self.history if history_id > start]
+            return httpx.Response(200, json={"history": records, "historyId": str(self.history_id)})
+        return httpx.Response(404)
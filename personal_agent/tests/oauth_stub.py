@@ -0,0 +1,42 @@
+"""
+Local OAuth token endpoint stand-in served through httpx.MockTransport
+Answers refresh_token grants with numbered access tokens, or fails on demand
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+import httpx
+
+TOKEN_URL = "https://oauth.test/token"
+
+class OAuthStub:
+    """`failure`: None, "invalid_grant" (400), "server_error" (500) or "unreachable" (connection error)"""
+
+    def __init__(self, expires_in: Optional[int] = 3600, delay: float = 0.0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.failure: Optional[str] = None
+        self.requests: List[Dict[str, str]] = []
+        self.issued = 0
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        form = {k: v[0] for k, v in parse_qs(request.content.decode()).items()}
+        self.requests.append(form)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failure == "unreachable":
+            raise httpx.ConnectError("connection refused", request=request)
+        if self.failure == "invalid_grant":
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        if self.failure == "server_error":
+            return httpx.Response(500, json={"error": "internal_failure"})
+        self.issued += 1
+        body = {"access_token": f"access-{self.issued}", "token_type": "Bearer"}
+        if self.expires_in is not None:
+            body["expires_in"] = self.expires_in
+        return httpx.Response(200, json=body)
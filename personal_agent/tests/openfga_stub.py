@@ -0,0 +1,111 @@
+"""
+In-memory OpenFGA stand-in served through httpx.MockTransport
+Keeps a tuple store behind /write, /read, /check and /batch-check (direct and
+contextual tuples only), and can reject writes that touch chosen agents. Also
+serves the store and authorization-model endpoints used by the bootstrap
+"""
+
+import json
+from typing import Dict, Any, List, Set, Tuple
+
+import httpx
+
+TupleKey = Tuple[str, str, str]
+
+class OpenFGAStub:
+    """`rejected`: agent ids whose writes and deletes fail with 400;
+    `batch_check`: False to answer /batch-check like a server that predates it"""
+
+    def __init__(self, rejected=(), batch_check: bool = True):
+        self.rejected: Set[str] = {f"agent:{agent_id}" for agent_id in rejected}
+        self.batch_check = batch_check
+        self.tuples: Set[TupleKey] = set()
+        self.writes: List[List[Dict[str, str]]] = []
+        self.requests: List[str] = []
+        self.stores: Dict[str, str] = {}  # id -> name
+        self.models: Dict[str, List[Dict[str, Any]]] = {}  # store id -> models, newest first
+
+    def client(self, name: str = "openfga") -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    @staticmethod
+    def _key(tuple_key: Dict[str, str]) -> TupleKey:
+        return (tuple_key["user"], tuple_key["relation"], tuple_key["object"])
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        self.requests.append(endpoint)
+        body: Dict[str, Any] = json.loads(request.content) if request.content else {}
+        segments = request.url.path.strip("/").split("/")
+        if segments == ["stores"]:
+            return self._stores(request.method, body)
+        if len(segments) >= 3 and segments[2] == "authorization-models":
+            return self._models(request.method, segments[1], segments[3:], body)
+        if endpoint == "write":
+            return self._write(body)
+        if endpoint == "check":
+            return self._check(body)
+        if endpoint == "batch-check":
+            return self._batch_check(body)
+        if endpoint == "read":
+            return self._read(body)
+        return httpx.Response(404)
+
+    def _write(self, body: Dict[str, Any]) -> httpx.Response:
+        writes = body.get("writes", {}).get("tuple_keys", [])
+        deletes = body.get("deletes", {}).get("tuple_keys", [])
+        self.writes.append(writes + deletes)
+        if any(k["user"] in self.rejected for k in writes + deletes):
+            return httpx.Response(400, json={"code": "validation_error"})
+        # Like OpenFGA, deleting a tuple that does not exist fails the whole write
+        if any(self._key(k) not in self.tuples for k in deletes):
+            return httpx.Response(400, json={"code": "write_failed_due_to_invalid_input"})
+        self.tuples |= {self._key(k) for k in writes}
+        self.tuples -= {self._key(k) for k in deletes}
+        return httpx.Response(200, json={})
+
+    def _allowed(self, check: Dict[str, Any]) -> bool:
+        contextual = check.get("contextual_tuples", {}).get("tuple_keys", [])
+        key = self._key(check["tuple_key"])
+        return key in self.tuples or key in {self._key(k) for k in contextual}
+
+    def _check(self, body: Dict[str, Any]) -> httpx.Response:
+        return httpx.Response(200, json={"allowed": self._allowed(body)})
+
+    def _batch_check(self, body: Dict[str, Any]) -> httpx.Response:
+        if not self.batch_check:
+            return httpx.Response(404)
+        return httpx.Response(200, json={"result": {
+            check["correlation_id"]: {"allowed": self._allowed(check)} for check in body["checks"]
+        }})
+
+    def _read(self, body: Dict[str, Any]) -> httpx.Response:
+        page_size = body.get("page_size", 100)
+        start = int(body.get("continuation_token") or 0)
+        ordered = sorted(self.tuples)
+        page = [{"key": {"user": u, "relation": r, "object": o}} for u, r, o in ordered[start:start + page_size]]
+        token = str(start + page_size) if start + page_size < len(ordered) else ""
+        return httpx.Response(200, json={"tuples": page, "continuation_token": token})
+
+    def _stores(self, method: str, body: Dict[str, Any]) -> httpx.Response:
+        if method == "POST":
+            store_id = f"store-{len(self.stores) + 1}"
+            self.stores[store_id] = body["name"]
+            return httpx.Response(201, json={"id": store_id, "name": body["name"]})
+        stores = [{"id": store_id, "name": name} for store_id, name in self.stores.items()]
+        return httpx.Response(200, json={"stores": stores, "continuation_token": ""})
+
+    def _models(self, method: str, store_id: str, rest: List[str], body: Dict[str, Any]) -> httpx.Response:
+        if store_id not in self.stores:
+            return httpx.Response(404, json={"code": "store_id_not_found"})
+        models = self.models.setdefault(store_id, [])
+        if method == "POST":
+            model_id = f"model-{len(models) + 1}"
+            models.insert(0, {"id": model_id, **body})
+            return httpx.Response(201, json={"authorization_model_id": model_id})
+        if rest:
+            model = next((m for m in models if m["id"] == rest[0]), None)
+            if model is None:
+                return httpx.Response(404, json={"code": "authorization_model_not_found"})
+            return httpx.Response(200, json={"authorization_model": model})
+        return httpx.Response(200, json={"authorization_models": models[:1]})
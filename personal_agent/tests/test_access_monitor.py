@@ -0,0 +1,81 @@
+import asyncio
+
+from access_monitor import AccessAnomalyDetector, CountMinSketch
+
+def make_detector(revoked: list, active=(), **kwargs) -> AccessAnomalyDetector:
+    async def revoke(user_id, agent_id):
+        revoked.append((agent_id, user_id))
+
+    settings = {"burst_rate": 1000.0, "denial_rate": 1000.0, "max_messages": 10_000, "auto_revoke": True}
+    settings.update(kwargs)
+    return AccessAnomalyDetector(revoke=revoke, is_active=lambda user_id, agent_id: (agent_id, user_id) in active,
+                                 width=256, **settings)
+
+def kinds(alerts) -> list:
+    return [alert["kind"] for alert in alerts]
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(width=16, depth=2)
+    for i in range(100):
+        sketch.add(f"k{i}", i)
+    assert all(sketch.estimate(f"k{i}") >= i for i in range(100))
+
+def test_burst_of_reads_alerts_and_revokes():
+    revoked = []
+    detector = make_detector(revoked, burst_rate=0.5)
+
+    async def go():
+        return [await detector.observe_read("good_agent", "user:1", 1) for _ in range(20)]
+
+    raised = [kind for alerts in asyncio.run(go()) for kind in kinds(alerts)]
+    assert "burst" in raised
+    assert revoked == [("good_agent", "user:1")]
+
+def test_volume_over_the_window_budget_alerts():
+    revoked = []
+    detector = make_detector(revoked, max_messages=10)
+
+    async def go():
+        return [kinds(await detector.observe_read("good_agent", "user:1", 6)) for _ in range(2)]
+
+    assert asyncio.run(go()) == [[], ["volume"]]
+    assert revoked == [("good_agent", "user:1")]
+
+def test_alerts_are_held_back_during_the_cooldown():
+    detector = make_detector([], max_messages=1, alert_cooldown=60)
+
+    async def go():
+        return [kinds(await detector.observe_read("good_agent", "user:1", 5)) for _ in range(3)]
+
+    assert asyncio.run(go()) == [["volume"], [], []]
+    assert detector.get_stats()["alerts"]["volume"] == 1
+
+def test_alerts_repeat_without_a_cooldown():
+    detector = make_detector([], max_messages=1, alert_cooldown=0)
+
+    async def go():
+        return [kinds(await detector.observe_read("good_agent", "user:1", 5)) for _ in range(3)]
+
+    assert asyncio.run(go()) == [["volume"]] * 3
+
+def test_denial_flood_without_a_delegation_alerts_but_does_not_revoke():
+    revoked = []
+    detector = make_detector(revoked, denial_rate=0.1)
+
+    async def go():
+        return [kinds(await detector.observe_denial("malicious_agent", "user:1")) for _ in range(5)]
+
+    assert ["denials"] in asyncio.run(go())
+    assert revoked == []
+    assert detector.revocations == 0
+
+def test_denial_flood_with_a_live_delegation_revokes_it():
+    revoked = []
+    detector = make_detector(revoked, active={("good_agent", "user:1")}, denial_rate=0.1)
+
+    async def go():
+        for _ in range(5):
+            await detector.observe_denial("good_agent", "user:1")
+
+    asyncio.run(go())
+    assert revoked == [("good_agent", "user:1")]
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from agent_guard import AdminGuard, AgentRateLimiter, DenialCache, RateLimited
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+
+VERIFIED = {"metadata": {"verified": True, "trust_level": 1}}
+
+def admitted(limiter: AgentRateLimiter, agent_ids, card) -> int:
+    count = 0
+    for agent_id in agent_ids:
+        try:
+            limiter.admit(agent_id, card)
+            count += 1
+        except RateLimited:
+            pass
+    return count
+
+def test_callers_without_a_card_share_one_bucket():
+    limiter = AgentRateLimiter()
+    _, burst = limiter.tiers["unknown"]
+
+    # A new id per request buys no new budget
+    assert admitted(limiter, [f"rotating-{i}" for i in range(50)], None) == burst
+    assert limiter.get_stats()["tracked_agents"] == 1
+
+def test_agents_with_a_card_get_their_own_bucket():
+    limiter = AgentRateLimiter()
+    admitted(limiter, [f"rotating-{i}" for i in range(50)], None)
+
+    _, burst = limiter.tiers["verified"]
+    assert admitted(limiter, ["good_agent"] * 100, VERIFIED) == burst
+    assert admitted(limiter, ["other_agent"], VERIFIED) == 1
+
+def test_rate_limited_carries_retry_after():
+    limiter = AgentRateLimiter(tiers={**AgentRateLimiter().tiers, "unknown": (2.0, 1.0)})
+    limiter.admit("a", None)
+    with pytest.raises(RateLimited) as error:
+        limiter.admit("b", None)
+    assert 0 < error.value.retry_after <= 0.5
+
+def test_denials_are_remembered_until_the_agent_is_granted():
+    cache = DenialCache(ttl=60)
+    calls = []
+
+    async def check():
+        calls.append(1)
+        return False
+
+    async def go():
+        key = ("good_agent", "can_read_emails", "gmail_account:user:1")
+        for _ in range(5):
+            assert not await cache.check(key, check)
+        cache.clear_agent("good_agent")
+        assert not await cache.check(key, check)
+
+    asyncio.run(go())
+    assert len(calls) == 2
+
+def test_denials_for_unverified_ids_are_not_remembered():
+    cache = DenialCache(ttl=60, max_entries=10)
+
+    async def check():
+        return False
+
+    async def go():
+        await cache.check(("good_agent", "can_read_emails", "gmail_account:user:1"), check)
+        for i in range(50):
+            await cache.check((f"rotating-{i}", "can_read_emails", "gmail_account:user:1"), check, remember=False)
+
+    asyncio.run(go())
+    # Rotating ids neither fill the cache nor evict a real agent's entry
+    assert cache.get_stats()["entries"] == 1
+    assert cache.is_denied(("good_agent", "can_read_emails", "gmail_account:user:1"))
+
+def test_admin_guard_accepts_the_token_raw_or_as_bearer():
+    guard = AdminGuard("s3cret")
+    assert guard.allows("s3cret")
+    assert guard.allows("Bearer s3cret")
+    assert not guard.allows("Bearer wrong")
+    assert not guard.allows(None)
+    assert guard.get_stats() == {"enabled": True, "allowed": 2, "refused": 2}
+
+def test_admin_guard_without_a_token_refuses_everyone():
+    guard = AdminGuard(None)
+    assert not guard.enabled
+    assert not guard.allows("")
+    assert not guard.allows("Bearer ")
+
+def test_grant_written_through_the_tool_clears_the_agents_denials():
+    cache = DenialCache(ttl=60)
+    tool = OpenFGATool("http://openfga", "store", OpenFGAStub())
+    tool.write_listeners.append(cache.clear_for_tuples)
+    good = ("good_agent", "can_read_emails", "gmail_account:user:1")
+    other = ("other_agent", "can_read_emails", "gmail_account:user:1")
+
+    async def deny():
+        return False
+
+    async def go():
+        await cache.check(good, deny)
+        await cache.check(other, deny)
+        await tool.execute({"action": "grant", "user": "agent:good_agent", "relation": "temporary_reader",
+                            "object": "gmail_account:user:1"})
+
+    asyncio.run(go())
+    assert not cache.is_denied(good)
+    assert cache.is_denied(other)
+
+    asyncio.run(tool.execute({"action": "write", "writes": [
+        {"user": "group:readers#member", "relation": "temporary_reader", "object": "gmail_account:user:1"}
+    ]}))
+    # A userset grant can reach any agent
+    assert not cache.is_denied(other)
+
+def test_denial_from_a_check_started_before_a_clear_is_not_recorded():
+    cache = DenialCache(ttl=60)
+    key = ("good_agent", "can_read_emails", "gmail_account:user:1")
+    generation = cache.generation("good_agent")
+    cache.clear()
+    cache.record(key, generation)
+    assert not cache.is_denied(key)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+
+from audit_log import AuditLog, AuditReader, list_segments, segment_name
+
+def event(ts: float, kind: str = "check", agent_id: str = "good_agent") -> dict:
+    return {"ts": ts, "kind": kind, "agent_id": agent_id, "user_id": "user:1"}
+
+def write_segment(directory, started_at: float, sequence: int, events, tail: bytes = b""):
+    path = os.path.join(directory, segment_name(started_at, sequence))
+    with open(path, "wb") as f:
+        f.write(b"".join(json.dumps(e).encode() + b"\n" for e in events) + tail)
+
+def test_disabled_unless_a_directory_is_configured(monkeypatch, tmp_path):
+    monkeypatch.delenv("AUDIT_LOG_DIR", raising=False)
+    assert AuditLog.from_env() is None
+
+    monkeypatch.setenv("AUDIT_LOG_DIR", str(tmp_path))
+    assert AuditLog.from_env().directory == str(tmp_path)
+
+def test_segments_rotate_by_size(tmp_path):
+    log = AuditLog(str(tmp_path), segment_bytes=200)
+    for i in range(6):
+        log._write_batch([event(1000.0 + i)])
+    log._close_file()
+
+    segments = list_segments(str(tmp_path))
+    assert len(segments) > 1
+    assert log.segments_rotated == len(segments) - 1
+    assert [e["ts"] for e in AuditReader(str(tmp_path)).scan()] == [1000.0 + i for i in range(6)]
+
+def test_oldest_segments_beyond_max_segments_are_deleted(tmp_path):
+    log = AuditLog(str(tmp_path), segment_bytes=1, max_segments=2)
+    for i in range(5):
+        log._write_batch([event(1000.0 + i)])
+    log._close_file()
+
+    assert len(list_segments(str(tmp_path))) == 2
+    assert log.segments_deleted == 3
+    assert [e["ts"] for e in AuditReader(str(tmp_path)).scan()] == [1003.0, 1004.0]
+
+def test_close_flushes_everything_queued(tmp_path):
+    log = AuditLog(str(tmp_path), flush_interval=10.0)
+
+    async def go():
+        await log.start()
+        for i in range(25):
+            log.record("check", agent_id="good_agent", user_id="user:1", n=i)
+        await log.close()
+
+    asyncio.run(go())
+    assert [e["n"] for e in AuditReader(str(tmp_path)).scan()] == list(range(25))
+    assert log.get_stats()["written"] == 25
+
+def test_events_beyond_the_queue_are_dropped_and_counted(tmp_path):
+    async def go():
+        log = AuditLog(str(tmp_path), queue_size=2)
+        for _ in range(5):
+            log.record("check")
+        return log
+
+    log = asyncio.run(go())
+    assert log.recorded == 2
+    assert log.dropped == 3
+
+def test_scan_skips_segments_outside_the_range(tmp_path):
+    directory = str(tmp_path)
+    # Segment boundaries alone decide pruning: the first segment ends where the second
+    # starts (200), so its (out-of-place) event is never read for since=300
+    write_segment(directory, 100.0, 1, [event(150.0), event(500.0, kind="pruned")])
+    write_segment(directory, 200.0, 2, [event(250.0), event(350.0)])
+    write_segment(directory, 400.0, 3, [event(450.0)])
+    reader = AuditReader(directory)
+
+    assert [e["ts"] for e in reader.scan(since=300.0)] == [350.0, 450.0]
+    assert [e["ts"] for e in reader.scan(until=300.0)] == [150.0, 250.0]
+    assert [e["ts"] for e in reader.scan(since=240.0, until=360.0)] == [250.0, 350.0]
+
+def test_scan_filters_by_agent_and_kind(tmp_path):
+    write_segment(str(tmp_path), 100.0, 1, [
+        event(110.0, kind="check"), event(120.0, kind="grant"), event(130.0, agent_id="malicious_agent"),
+    ])
+    reader = AuditReader(str(tmp_path))
+
+    assert [e["ts"] for e in reader.scan(agent_id="malicious_agent")] == [130.0]
+    assert [e["ts"] for e in reader.scan(kinds=["grant"])] == [120.0]
+    assert len(reader.query(limit=2)) == 2
+
+def test_scan_skips_a_torn_final_line(tmp_path):
+    write_segment(str(tmp_path), 100.0, 1, [event(110.0), event(120.0)], tail=b'{"ts": 130.0, "kind": "ch')
+
+    assert [e["ts"] for e in AuditReader(str(tmp_path)).scan()] == [110.0, 120.0]
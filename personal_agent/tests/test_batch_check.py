@@ -0,0 +1,69 @@
+import asyncio
+
+from check_cache import CheckCache
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+
+def key(agent_id: str, relation: str = "can_read_emails", user_id: str = "user:1") -> dict:
+    return {"user": f"agent:{agent_id}", "relation": relation, "object": f"gmail_account:{user_id}"}
+
+def batch_check(tool: OpenFGATool, tuple_keys: list) -> list:
+    result = asyncio.run(tool.execute({"action": "batch_check", "checks": tuple_keys}))
+    return [(r["tuple_key"]["user"], r["allowed"]) for r in result["results"]]
+
+def make_tool(openfga: OpenFGAStub, **kwargs) -> OpenFGATool:
+    return OpenFGATool("http://openfga", "store", openfga, **kwargs)
+
+def seeded_stub(**kwargs) -> OpenFGAStub:
+    openfga = OpenFGAStub(**kwargs)
+    openfga.tuples.add(("agent:good_agent", "can_read_emails", "gmail_account:user:1"))
+    return openfga
+
+def test_results_come_back_in_request_order():
+    openfga = seeded_stub()
+    tool = make_tool(openfga)
+    keys = [key("malicious_agent"), key("good_agent"), key("good_agent", "can_send_emails")]
+
+    assert batch_check(tool, keys) == [
+        ("agent:malicious_agent", False), ("agent:good_agent", True), ("agent:good_agent", False),
+    ]
+    assert openfga.requests == ["batch-check"]
+
+def test_large_batches_are_split_into_chunks():
+    openfga = seeded_stub()
+    tool = make_tool(openfga, batch_size=2)
+    keys = [key(f"agent_{i}") for i in range(5)] + [key("good_agent")]
+
+    results = batch_check(tool, keys)
+
+    assert [allowed for _, allowed in results] == [False] * 5 + [True]
+    assert openfga.requests == ["batch-check"] * 3
+
+def test_missing_batch_endpoint_falls_back_to_single_checks():
+    openfga = seeded_stub(batch_check=False)
+    tool = make_tool(openfga)
+    keys = [key("good_agent"), key("malicious_agent")]
+
+    assert batch_check(tool, keys) == [("agent:good_agent", True), ("agent:malicious_agent", False)]
+    assert tool.batch_endpoint_available is False
+    assert openfga.requests == ["batch-check", "check", "check"]
+
+    # Once the endpoint is known to be missing it is not probed again
+    openfga.requests.clear()
+    batch_check(tool, keys)
+    assert openfga.requests == ["check", "check"]
+
+def test_cached_answers_skip_the_server():
+    openfga = seeded_stub()
+    tool = make_tool(openfga, check_cache=CheckCache())
+    batch_check(tool, [key("good_agent")])
+    openfga.requests.clear()
+
+    assert batch_check(tool, [key("good_agent"), key("malicious_agent")]) == [
+        ("agent:good_agent", True), ("agent:malicious_agent", False),
+    ]
+    assert openfga.requests == ["batch-check"]
+
+    openfga.requests.clear()
+    batch_check(tool, [key("good_agent"), key("malicious_agent")])
+    assert openfga.requests == []
@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import json
+import logging
+
+import main
+from capability_tokens import CapabilityTokenSigner, _b64decode, _b64encode
+from delegations import DelegationRegistry
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+from token_vault import TokenVault
+
+def make_signer(**kwargs) -> CapabilityTokenSigner:
+    return CapabilityTokenSigner(b"k" * 32, **kwargs)
+
+def test_valid_token_verifies_for_its_agent_user_and_relation():
+    signer = make_signer()
+    token = signer.mint("good_agent", "user:1", "can_read_emails")
+
+    assert signer.verify(token, "good_agent", "user:1", "can_read_emails")
+    assert not signer.verify(token, "malicious_agent", "user:1", "can_read_emails")
+    assert not signer.verify(token, "good_agent", "user:2", "can_read_emails")
+    assert not signer.verify(token, "good_agent", "user:1", "can_send_emails")
+    assert not signer.verify(None, "good_agent", "user:1", "can_read_emails")
+    assert signer.get_stats()["verified"] == 1
+
+def test_tampered_payload_is_rejected():
+    signer = make_signer()
+    payload, signature = signer.mint("good_agent", "user:1", "can_read_emails").split(".")
+    claims = json.loads(_b64decode(payload))
+    claims["sub"] = "malicious_agent"
+    forged = _b64encode(json.dumps(claims).encode())
+
+    assert not signer.verify(f"{forged}.{signature}", "malicious_agent", "user:1", "can_read_emails")
+
+def test_tampered_or_foreign_signature_is_rejected():
+    signer = make_signer()
+    token = signer.mint("good_agent", "user:1", "can_read_emails")
+    payload, signature = token.split(".")
+    flipped = bytearray(_b64decode(signature))
+    flipped[0] ^= 1
+
+    assert not signer.verify(f"{payload}.{_b64encode(bytes(flipped))}", "good_agent", "user:1", "can_read_emails")
+    assert not CapabilityTokenSigner(b"x" * 32).verify(token, "good_agent", "user:1", "can_read_emails")
+    for garbage in ("", "no-dot", "!!!.???", base64.b64encode(b"{}").decode()):
+        assert not signer.verify(garbage, "good_agent", "user:1", "can_read_emails")
+
+def test_expired_token_is_rejected():
+    signer = make_signer()
+    token = signer.mint("good_agent", "user:1", "can_read_emails", ttl=-1)
+    assert not signer.verify(token, "good_agent", "user:1", "can_read_emails")
+
+def test_token_for_another_audience_is_rejected():
+    token = make_signer(audience="other_service").mint("good_agent", "user:1", "can_read_emails")
+    assert not make_signer().verify(token, "good_agent", "user:1", "can_read_emails")
+
+def test_revoked_token_is_rejected_but_its_siblings_are_not():
+    signer = make_signer()
+    first = signer.mint("good_agent", "user:1", "can_read_emails")
+    second = signer.mint("good_agent", "user:1", "can_read_emails")
+
+    signer.revoke(first)
+
+    assert not signer.verify(first, "good_agent", "user:1", "can_read_emails")
+    assert signer.verify(second, "good_agent", "user:1", "can_read_emails")
+
+def test_expired_revocations_are_pruned():
+    signer = make_signer()
+    signer.revoke(signer.mint("good_agent", "user:1", "can_read_emails", ttl=0.01))
+    assert signer.get_stats()["revoked"] == 1
+
+    asyncio.run(asyncio.sleep(0.02))
+    signer.revoke(signer.mint("good_agent", "user:1", "can_read_emails"))
+    assert signer.get_stats()["revoked"] == 1
+
+def test_token_is_refused_once_its_delegation_is_revoked(monkeypatch):
+    signer = make_signer()
+    tool = OpenFGATool("http://openfga", "store", OpenFGAStub())
+    registry = DelegationRegistry(tool, TokenVault(lambda: None, client_id="c", client_secret="s", token_url="http://oauth/token"))
+    monkeypatch.setattr(main, "capabilities", signer)
+    monkeypatch.setattr(main, "delegations", registry)
+    body = {"agent_id": "good_agent", "user_id": "user:1"}
+
+    asyncio.run(registry.acquire("user:1", "good_agent", "token"))
+    body["capability"] = signer.mint("good_agent", "user:1", "can_read_emails")
+    assert main.has_capability(body, "can_read_emails")
+
+    asyncio.run(registry.revoke("user:1", "good_agent"))
+    assert not main.has_capability(body, "can_read_emails")
+
+def test_missing_secret_is_warned_about(monkeypatch, caplog):
+    monkeypatch.delenv("CAPABILITY_TOKEN_SECRET", raising=False)
+    with caplog.at_level(logging.WARNING, logger="capability_tokens"):
+        CapabilityTokenSigner.from_env()
+    assert "CAPABILITY_TOKEN_SECRET" in caplog.text
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import httpx
+
+from check_cache import CheckCache
+from personal_agent_adk import OpenFGATool
+
+TUPLE = {"user": "agent:good_agent", "relation": "can_read_emails", "object": "gmail_account:user:1"}
+ALLOWED = {"allowed": True}
+
+def test_cached_decision_is_served_until_the_ttl_passes():
+    cache = CheckCache(ttl=0.05)
+    key = CheckCache.key(TUPLE)
+    cache.set(key, ALLOWED, cache.generation(TUPLE["object"]))
+
+    assert cache.get(key) == ALLOWED
+    time.sleep(0.06)
+    assert cache.get(key) is None
+    assert cache.get_stats()["entries"] == 0
+
+def test_invalidation_bumps_the_generation_and_drops_the_object():
+    cache = CheckCache()
+    key = CheckCache.key(TUPLE)
+    before = cache.generation(TUPLE["object"])
+    cache.set(key, ALLOWED, before)
+
+    cache.invalidate([TUPLE])
+
+    assert cache.generation(TUPLE["object"]) > before
+    assert cache.get(key) is None
+
+def test_answer_from_before_an_invalidation_is_not_stored():
+    cache = CheckCache()
+    key = CheckCache.key(TUPLE)
+    generation = cache.generation(TUPLE["object"])
+    cache.invalidate([TUPLE])
+    cache.set(key, ALLOWED, generation)
+    assert cache.get(key) is None
+
+    # Other objects are unaffected
+    other = ("agent:good_agent", "can_read_emails", "gmail_account:user:2")
+    cache.set(other, ALLOWED, generation)
+    assert cache.get(other) == ALLOWED
+
+def test_answer_from_before_a_clear_is_not_stored():
+    cache = CheckCache()
+    key = CheckCache.key(TUPLE)
+    generation = cache.generation(TUPLE["object"])
+    cache.clear()
+    cache.set(key, ALLOWED, generation)
+    assert cache.get(key) is None
+
+def test_invalidation_history_is_bounded_and_stays_safe():
+    cache = CheckCache(max_entries=4)
+    generation = cache.generation(TUPLE["object"])
+    cache.invalidate([TUPLE])
+    for i in range(50):
+        cache.invalidate([{**TUPLE, "object": f"gmail_account:user:{i + 100}"}])
+
+    assert len(cache._invalidated) <= 4
+    # TUPLE's own record was forgotten, but a check that started before it still is not stored
+    cache.set(CheckCache.key(TUPLE), ALLOWED, generation)
+    assert cache.get(CheckCache.key(TUPLE)) is None
+
+def test_revoke_during_an_in_flight_check_is_not_served_stale():
+    release = asyncio.Event()
+    checks = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/check"):
+            checks.append(1)
+            if len(checks) == 1:
+                # OpenFGA evaluated this check before the revoke landed
+                await release.wait()
+                return httpx.Response(200, json={"allowed": True})
+            return httpx.Response(200, json={"allowed": False})
+        return httpx.Response(200, json={})
+
+    class Pools:
+        def client(self, name: str) -> httpx.AsyncClient:
+            return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    tool = OpenFGATool("http://openfga", "store", Pools(), check_cache=CheckCache(ttl=60))
+
+    async def go():
+        in_flight = asyncio.create_task(tool.execute({"action": "check", **TUPLE}))
+        await asyncio.sleep(0.01)
+        await tool.execute({"action": "revoke", **TUPLE})
+        release.set()
+        assert (await in_flight)["allowed"] is True
+        return await tool.execute({"action": "check", **TUPLE})
+
+    assert asyncio.run(go()) == {"allowed": False}
+    assert len(checks) == 2
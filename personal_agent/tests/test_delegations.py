@@ -0,0 +1,242 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from check_cache import CheckCache
+from delegations import DELEGATION_MODE_CONTEXTUAL, DELEGATION_MODE_PERSISTED, DelegationRegistry
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+from token_vault import TokenVault
+
+def make_registry(openfga: OpenFGAStub, mode: str = DELEGATION_MODE_PERSISTED, **kwargs):
+    tool = OpenFGATool("http://openfga", "store", openfga, write_batch_window=0.01, **kwargs)
+    vault = TokenVault(lambda: None, client_id="client", client_secret="secret", token_url="http://oauth/token")
+    return tool, DelegationRegistry(tool, vault, mode=mode)
+
+def check(tool: OpenFGATool, agent_id: str, user_id: str = "user:1") -> bool:
+    tuple_key = DelegationRegistry.tuple_key(user_id, agent_id)
+    return asyncio.run(tool.execute({"action": "check", **tuple_key}))["allowed"]
+
+def test_write_rejected_for_one_caller_only_fails_that_caller():
+    openfga = OpenFGAStub(rejected=["bad_agent"])
+    tool, registry = make_registry(openfga)
+    granted = []
+    registry.grant_listeners.append(lambda user_id, agent_id: granted.append(agent_id))
+
+    async def go():
+        return await asyncio.gather(
+            registry.acquire("user:1", "good_agent", "token"),
+            registry.acquire("user:1", "bad_agent", "token"),
+            return_exceptions=True
+        )
+
+    good, bad = asyncio.run(go())
+
+    assert good is None
+    assert isinstance(bad, httpx.HTTPStatusError) and bad.response.status_code == 400
+    # Both tuples went out in one batch, then each caller was retried on its own
+    assert tool.write_batcher.get_stats()["split_retries"] == 1
+    assert registry.is_active("user:1", "good_agent")
+    assert not registry.is_active("user:1", "bad_agent")
+    assert granted == ["good_agent"]
+    assert registry.grants_written == 1
+
+def test_rejected_write_raises_instead_of_reporting_granted():
+    openfga = OpenFGAStub(rejected=["bad_agent"])
+    tool, _ = make_registry(openfga)
+    tuple_key = DelegationRegistry.tuple_key("user:1", "bad_agent")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(tool.execute({"action": "grant", **tuple_key}))
+
+def test_failed_revoke_keeps_the_ledger_entry(tmp_path):
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga)
+    registry.ledger_path = str(tmp_path / "ledger.json")
+
+    async def go():
+        await registry.acquire("user:1", "good_agent", "token")
+        openfga.rejected.add("agent:good_agent")
+        with pytest.raises(httpx.HTTPStatusError):
+            await registry.release("user:1", "good_agent")
+
+    asyncio.run(go())
+
+    assert ("user:1", "good_agent") in registry._load_ledger()
+    assert registry.revokes_written == 0
+
+def test_failed_regrant_after_a_revoke_stays_revoked():
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga)
+
+    async def go():
+        await registry.acquire("user:1", "good_agent", "token")
+        await registry.revoke("user:1", "good_agent")
+        openfga.rejected.add("agent:good_agent")
+        with pytest.raises(httpx.HTTPStatusError):
+            await registry.acquire("user:1", "good_agent", "token")
+
+    asyncio.run(go())
+
+    assert not registry.is_active("user:1", "good_agent")
+    assert registry.active_count("user:1", "good_agent") == 1
+    assert registry.contextual_tuples(DelegationRegistry.tuple_key("user:1", "good_agent")) == []
+
+def test_contextual_delegation_writes_nothing_and_rides_on_checks():
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga, mode=DELEGATION_MODE_CONTEXTUAL)
+
+    asyncio.run(registry.acquire("user:1", "good_agent", "token"))
+
+    assert openfga.writes == [] and openfga.tuples == set()
+    assert registry.grants_written == 0
+    assert check(tool, "good_agent")
+    assert not check(tool, "malicious_agent")
+    assert not check(tool, "good_agent", user_id="user:2")
+
+def test_contextual_delegation_is_not_attached_to_other_checks():
+    tool, registry = make_registry(OpenFGAStub(), mode=DELEGATION_MODE_CONTEXTUAL)
+    asyncio.run(registry.acquire("user:1", "good_agent", "token"))
+    reader = DelegationRegistry.tuple_key("user:1", "good_agent")
+
+    assert tool._check_body(reader)["contextual_tuples"] == {"tuple_keys": [reader]}
+    assert "contextual_tuples" not in tool._check_body(DelegationRegistry.tuple_key("user:1", "malicious_agent"))
+    assert "contextual_tuples" not in tool._check_body({"user": "user:1", "relation": "owner", "object": "doc:1"})
+
+def test_contextual_release_drops_the_cached_grant():
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga, mode=DELEGATION_MODE_CONTEXTUAL, check_cache=CheckCache())
+    changed = []
+    tool.write_listeners.append(changed.extend)
+
+    asyncio.run(registry.acquire("user:1", "good_agent", "token"))
+    assert check(tool, "good_agent")
+    asyncio.run(registry.release("user:1", "good_agent"))
+
+    assert not check(tool, "good_agent")
+    assert openfga.requests == ["check", "check"]
+    assert changed == [DelegationRegistry.tuple_key("user:1", "good_agent")] * 2
+
+def test_contextual_revoke_takes_effect_while_references_remain():
+    tool, registry = make_registry(OpenFGAStub(), mode=DELEGATION_MODE_CONTEXTUAL, check_cache=CheckCache())
+
+    async def go():
+        await registry.acquire("user:1", "good_agent", "token")
+        await registry.acquire("user:1", "good_agent", "token")
+        await registry.revoke("user:1", "good_agent")
+
+    asyncio.run(go())
+
+    assert registry.active_count("user:1", "good_agent") == 2
+    assert not check(tool, "good_agent")
+
+def test_contextual_tuples_reach_batch_checks():
+    tool, registry = make_registry(OpenFGAStub(), mode=DELEGATION_MODE_CONTEXTUAL)
+    asyncio.run(registry.acquire("user:1", "good_agent", "token"))
+    keys = [DelegationRegistry.tuple_key("user:1", a) for a in ("good_agent", "malicious_agent")]
+
+    result = asyncio.run(tool.execute({"action": "batch_check", "checks": keys}))
+
+    assert [r["allowed"] for r in result["results"]] == [True, False]
+
+def test_list_uses_the_user_and_agent_indexes():
+    tool, registry = make_registry(OpenFGAStub())
+
+    async def go():
+        await registry.acquire("user:1", "good_agent", "token")
+        await registry.acquire("user:1", "other_agent", "token")
+        await registry.acquire("user:2", "good_agent", "token")
+        await registry.acquire("user:2", "good_agent", "token")
+
+    asyncio.run(go())
+
+    def pairs(entries):
+        return sorted((d["user_id"], d["agent_id"]) for d in entries)
+
+    assert pairs(registry.list()) == [("user:1", "good_agent"), ("user:1", "other_agent"), ("user:2", "good_agent")]
+    assert pairs(registry.list(user_id="user:1")) == [("user:1", "good_agent"), ("user:1", "other_agent")]
+    assert pairs(registry.list(agent_id="good_agent")) == [("user:1", "good_agent"), ("user:2", "good_agent")]
+    assert registry.list(user_id="user:2", agent_id="good_agent")[0]["references"] == 2
+    assert registry.list(user_id="user:3") == []
+
+def test_released_delegations_leave_the_indexes():
+    tool, registry = make_registry(OpenFGAStub())
+
+    async def go():
+        await registry.acquire("user:1", "good_agent", "token")
+        await registry.acquire("user:1", "other_agent", "token")
+        await registry.release("user:1", "good_agent")
+
+    asyncio.run(go())
+
+    assert [d["agent_id"] for d in registry.list(user_id="user:1")] == ["other_agent"]
+    assert registry.list(agent_id="good_agent") == []
+    assert "good_agent" not in registry._by_agent
+
+def restarted(registry: DelegationRegistry) -> DelegationRegistry:
+    """A fresh registry over the same tool and ledger, as after a crash"""
+    return DelegationRegistry(registry.openfga_tool, registry.token_storage, ledger_path=registry.ledger_path)
+
+def test_reconcile_reports_foreign_orphans_and_revokes_only_its_own(tmp_path):
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga)
+    registry.ledger_path = str(tmp_path / "ledger.json")
+    openfga.tuples |= {
+        # Written by another process sharing the store
+        ("agent:foreign_agent", "temporary_reader", "gmail_account:user:9"),
+        # Not delegation tuples at all
+        ("agent:good_agent", "manager", "gmail_account:user:1"),
+        ("user:1", "owner", "gmail_account:user:1"),
+    }
+
+    async def go():
+        await registry.acquire("user:2", "crashed_agent", "token")
+        after_crash = restarted(registry)
+        await after_crash.acquire("user:1", "good_agent", "token")
+        return after_crash, await after_crash.reconcile(revoke_orphans=True)
+
+    registry, report = asyncio.run(go())
+
+    assert report["tuples_scanned"] == 5
+    assert report["orphans_found"] == 2
+    assert report["orphans_owned"] == 1
+    assert report["orphans_revoked"] == 1
+    assert ("agent:crashed_agent", "temporary_reader", "gmail_account:user:2") not in openfga.tuples
+    assert ("agent:foreign_agent", "temporary_reader", "gmail_account:user:9") in openfga.tuples
+    assert ("agent:good_agent", "temporary_reader", "gmail_account:user:1") in openfga.tuples
+    assert registry._load_ledger() == {("user:1", "good_agent")}
+
+def test_reconcile_only_reports_unless_asked_to_revoke(tmp_path):
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga)
+    registry.ledger_path = str(tmp_path / "ledger.json")
+
+    async def go():
+        await registry.acquire("user:2", "crashed_agent", "token")
+        after_crash = restarted(registry)
+        return after_crash, await after_crash.reconcile()
+
+    registry, report = asyncio.run(go())
+
+    assert (report["orphans_owned"], report["orphans_revoked"]) == (1, 0)
+    assert ("agent:crashed_agent", "temporary_reader", "gmail_account:user:2") in openfga.tuples
+    assert registry._load_ledger() == {("user:2", "crashed_agent")}
+    assert registry.get_stats()["last_reconcile"]["orphans_found"] == 1
+
+def test_reconcile_pages_through_the_store_and_prunes_stale_ledger_entries(tmp_path):
+    openfga = OpenFGAStub()
+    tool, registry = make_registry(openfga)
+    ledger = tmp_path / "ledger.json"
+    # Left over from a crash whose tuple someone else already deleted
+    ledger.write_text(json.dumps([["user:7", "gone_agent"]]))
+    registry.ledger_path = str(ledger)
+    registry = restarted(registry)
+    openfga.tuples |= {(f"user:{i}", "owner", f"gmail_account:user:{i}") for i in range(250)}
+
+    report = asyncio.run(registry.reconcile(revoke_orphans=True))
+
+    assert report["tuples_scanned"] == 250
+    assert openfga.requests.count("read") == 3
+    assert registry._load_ledger() == set()
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import httpx
+
+from fga_bootstrap import AuthorizationModelBootstrap, model_hash
+from fga_evaluator import AuthorizationModel, default_model_path
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+
+URL = "http://openfga"
+
+def make_bootstrap(tmp_path, model_path: str = None, **kwargs) -> AuthorizationModelBootstrap:
+    return AuthorizationModelBootstrap(URL, model_path or default_model_path(),
+                                       state_path=str(tmp_path / "fga_state.json"), **kwargs)
+
+def run(bootstrap: AuthorizationModelBootstrap, openfga: OpenFGAStub):
+    return asyncio.run(bootstrap.run(openfga.client()))
+
+def test_first_run_creates_the_store_and_uploads_the_model(tmp_path):
+    openfga = OpenFGAStub()
+
+    store_id, model_id = run(make_bootstrap(tmp_path), openfga)
+
+    assert openfga.stores == {store_id: "gmail_marketplace_store"}
+    assert [m["id"] for m in openfga.models[store_id]] == [model_id]
+    state = json.loads((tmp_path / "fga_state.json").read_text())
+    assert (state["store_id"], state["model_id"]) == (store_id, model_id)
+
+def test_restart_uses_the_cached_ids_after_one_read(tmp_path):
+    openfga = OpenFGAStub()
+    first = run(make_bootstrap(tmp_path), openfga)
+    openfga.requests.clear()
+
+    assert run(make_bootstrap(tmp_path), openfga) == first
+    assert openfga.requests == [first[1]]
+
+def test_cached_ids_for_a_reset_server_are_discarded(tmp_path):
+    run(make_bootstrap(tmp_path), OpenFGAStub())
+    fresh = OpenFGAStub()
+
+    store_id, model_id = run(make_bootstrap(tmp_path), fresh)
+
+    assert store_id in fresh.stores
+    assert fresh.models[store_id][0]["id"] == model_id
+
+def test_unchanged_model_on_an_existing_store_is_pinned_not_uploaded(tmp_path):
+    openfga = OpenFGAStub()
+    openfga.stores["existing"] = "gmail_marketplace_store"
+    served = AuthorizationModel.from_file(default_model_path()).to_json()
+    # The server fills in fields the local rendering leaves out
+    openfga.models["existing"] = [{"id": "model-current", "conditions": {}, **served}]
+
+    assert run(make_bootstrap(tmp_path), openfga) == ("existing", "model-current")
+    assert len(openfga.models["existing"]) == 1
+
+def test_changed_model_is_uploaded_to_the_configured_store(tmp_path):
+    openfga = OpenFGAStub()
+    openfga.stores["configured"] = "another_name"
+    run(make_bootstrap(tmp_path, store_id="configured"), openfga)
+    changed = tmp_path / "changed.fga"
+    changed.write_text(open(default_model_path()).read() + "\n    define can_archive: manager\n")
+
+    store_id, model_id = run(make_bootstrap(tmp_path, model_path=str(changed), store_id="configured"), openfga)
+
+    assert store_id == "configured"
+    assert [m["id"] for m in openfga.models["configured"]] == [model_id, "model-1"]
+    assert list(openfga.stores) == ["configured"]
+
+def test_model_hash_ignores_empty_server_fields():
+    model = AuthorizationModel.from_file(default_model_path()).to_json()
+    served = {"id": "m", "conditions": {}, **model}
+    served["type_definitions"] = [{"metadata": None, **d} for d in model["type_definitions"]]
+
+    assert model_hash(served) == model_hash(model)
+    assert model_hash({**model, "schema_version": "1.2"}) != model_hash(model)
+
+def test_tool_start_pins_the_bootstrapped_model(tmp_path):
+    openfga = OpenFGAStub()
+    tool = OpenFGATool(URL, "", openfga, bootstrap=make_bootstrap(tmp_path))
+
+    asyncio.run(tool.start())
+    body = tool._check_body({"user": "agent:good_agent", "relation": "manager", "object": "gmail_account:user:1"})
+
+    assert tool.store_id in openfga.stores
+    assert body["authorization_model_id"] == openfga.models[tool.store_id][0]["id"]
+
+def test_tool_starts_without_a_pinned_model_when_bootstrap_fails(tmp_path):
+    class Unreachable(OpenFGAStub):
+        def handler(self, request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+    tool = OpenFGATool(URL, "store", Unreachable(), bootstrap=make_bootstrap(tmp_path))
+
+    asyncio.run(tool.start())
+
+    assert tool.store_id == "store"
+    assert tool.authorization_model_id is None
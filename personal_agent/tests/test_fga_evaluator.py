@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+
+from fga_evaluator import AuthorizationModel, LocalCheckEvaluator, default_model_path
+
+ACCOUNT = "gmail_account:user:1"
+ROLES = {
+    "$owner": "user:1",
+    "$manager": "agent:good_agent",
+    "$reader": "agent:reader_agent",
+    "$stranger": "agent:malicious_agent",
+}
+
+def load_assertions() -> list:
+    path = os.path.join(os.path.dirname(default_model_path()), "gmail_authz.assertions.json")
+    with open(path, "r") as f:
+        return json.load(f)["assertions"]
+
+def make_evaluator(model: AuthorizationModel = None) -> LocalCheckEvaluator:
+    return LocalCheckEvaluator(model or AuthorizationModel.from_file(default_model_path()), "", "")
+
+@pytest.fixture(scope="module")
+def gmail_evaluator() -> LocalCheckEvaluator:
+    evaluator = make_evaluator()
+    evaluator.mirror.write(ROLES["$owner"], "owner", ACCOUNT)
+    evaluator.mirror.write(ROLES["$manager"], "manager", ACCOUNT)
+    evaluator.mirror.write(ROLES["$reader"], "temporary_reader", ACCOUNT)
+    return evaluator
+
+@pytest.mark.parametrize("assertion", load_assertions(), ids=lambda a: a["name"])
+def test_model_assertions_hold(gmail_evaluator, assertion):
+    user = ROLES[assertion["user"]]
+    assert gmail_evaluator.check(user, assertion["relation"], ACCOUNT) is assertion["expected"]
+
+def test_contextual_tuple_grants_only_for_the_request():
+    evaluator = make_evaluator()
+    reader = {"user": "agent:good_agent", "relation": "temporary_reader", "object": ACCOUNT}
+
+    assert evaluator.check("agent:good_agent", "can_read_emails", ACCOUNT, [reader])
+    assert not evaluator.check("agent:good_agent", "can_send_emails", ACCOUNT, [reader])
+    assert not evaluator.check("agent:good_agent", "can_read_emails", ACCOUNT)
+
+def test_gmail_model_renders_as_openfga_json():
+    relations = next(
+        d for d in AuthorizationModel.from_file(default_model_path()).to_json()["type_definitions"]
+        if d["type"] == "gmail_account"
+    )
+    assert relations["relations"]["manager"] == {"union": {"child": [
+        {"this": {}}, {"computedUserset": {"relation": "owner"}},
+    ]}}
+    assert relations["relations"]["can_send_emails"] == {"computedUserset": {"relation": "manager"}}
+    assert relations["metadata"]["relations"]["manager"] == {"directly_related_user_types": [{"type": "agent"}]}
+    assert relations["metadata"]["relations"]["owner"] == {"directly_related_user_types": [{"type": "user"}]}
+
+DOCS_MODEL = """
+model
+  schema 1.1
+
+type user
+type folder
+  relations
+    define viewer: [user, user:*]
+type document
+  relations
+    define parent: [folder]
+    define blocked: [user]
+    define editor: [user]
+    define approver: [user]
+    define viewer: [user] or editor or viewer from parent
+    define can_view: viewer but not blocked
+    define can_publish: editor and approver
+"""
+
+def docs_evaluator() -> LocalCheckEvaluator:
+    evaluator = make_evaluator(AuthorizationModel.from_dsl(DOCS_MODEL))
+    evaluator.mirror.write("folder:f", "parent", "document:d")
+    return evaluator
+
+def test_tuple_to_userset_follows_the_parent_object():
+    evaluator = docs_evaluator()
+    evaluator.mirror.write("user:alice", "viewer", "folder:f")
+
+    assert evaluator.check("user:alice", "viewer", "document:d")
+    assert not evaluator.check("user:bob", "viewer", "document:d")
+
+def test_wildcard_matches_every_user_of_its_type():
+    evaluator = docs_evaluator()
+    evaluator.mirror.write("user:*", "viewer", "folder:f")
+
+    assert evaluator.check("user:anyone", "viewer", "document:d")
+    assert not evaluator.check("folder:x", "viewer", "document:d")
+
+def test_exclusion_and_intersection():
+    evaluator = docs_evaluator()
+    evaluator.mirror.write("user:alice", "editor", "document:d")
+    evaluator.mirror.write("user:alice", "blocked", "document:d")
+    evaluator.mirror.write("user:bob", "editor", "document:d")
+    evaluator.mirror.write("user:bob", "approver", "document:d")
+
+    assert not evaluator.check("user:alice", "can_view", "document:d")
+    assert evaluator.check("user:bob", "can_view", "document:d")
+    assert evaluator.check("user:bob", "can_publish", "document:d")
+    assert not evaluator.check("user:alice", "can_publish", "document:d")
+
+def test_unknown_relation_is_denied():
+    assert not docs_evaluator().check("user:alice", "owner", "document:d")
+
+def test_exclusion_renders_as_difference():
+    document = AuthorizationModel.from_dsl(DOCS_MODEL).to_json()["type_definitions"][2]
+    assert document["relations"]["can_view"] == {"difference": {
+        "base": {"computedUserset": {"relation": "viewer"}},
+        "subtract": {"computedUserset": {"relation": "blocked"}},
+    }}
+    assert document["relations"]["viewer"]["union"]["child"][2] == {"tupleToUserset": {
+        "tupleset": {"relation": "parent"},
+        "computedUserset": {"relation": "viewer"},
+    }}
+    assert document["metadata"]["relations"]["parent"] == {"directly_related_user_types": [{"type": "folder"}]}
+
+def test_unsupported_syntax_is_refused():
+    with pytest.raises(ValueError):
+        AuthorizationModel.from_dsl("type doc\n  relations\n    define a: (b or c) and d")
+    with pytest.raises(ValueError):
+        AuthorizationModel.from_dsl("define a: b")
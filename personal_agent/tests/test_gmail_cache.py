@@ -0,0 +1,90 @@
+import asyncio
+
+from gmail_cache import GmailSyncCache
+from gmail_stub import GmailStub
+
+def read(cache: GmailSyncCache, gmail: GmailStub, max_results: int = 3):
+    async def go():
+        async with gmail.client() as client:
+            return await cache.read(client, "user:1", "token", max_results=max_results)
+    return asyncio.run(go())
+
+def ids(listing):
+    return [m["id"] for m in listing["messages"]]
+
+def test_unchanged_history_serves_the_cached_listing():
+    gmail, cache = GmailStub(), GmailSyncCache()
+    first = read(cache, gmail)
+    second = read(cache, gmail)
+
+    assert ids(second) == ids(first) == ["m4", "m3", "m2"]
+    assert gmail.calls("messages") == 1
+    assert gmail.calls("history") == 1
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+def test_new_message_is_patched_in_from_history():
+    gmail, cache = GmailStub(), GmailSyncCache()
+    read(cache, gmail)
+    gmail.add_message("m5")
+
+    assert ids(read(cache, gmail)) == ["m5", "m4", "m3"]
+    assert gmail.calls("messages") == 1
+    assert cache.get_stats()["resyncs"] == 0
+
+def test_message_added_to_spam_is_not_listed():
+    gmail, cache = GmailStub(), GmailSyncCache()
+    read(cache, gmail)
+    gmail.add_message("junk", labels=("SPAM",))
+
+    assert ids(read(cache, gmail)) == ["m4", "m3", "m2"]
+    assert gmail.calls("messages") == 1
+
+def test_message_moved_to_trash_leaves_the_window():
+    gmail, cache = GmailStub(messages=3), GmailSyncCache()
+    read(cache, gmail)
+    gmail.add_labels("m1", "TRASH")
+
+    assert ids(read(cache, gmail)) == ["m2", "m0"]
+    assert gmail.calls("messages") == 1
+
+def test_deletion_in_a_full_window_relists():
+    gmail, cache = GmailStub(), GmailSyncCache()
+    read(cache, gmail)
+    gmail.delete_message("m3")
+
+    # The gap can only be filled from a new listing
+    assert ids(read(cache, gmail)) == ["m4", "m2", "m1"]
+    assert gmail.calls("messages") == 2
+    assert cache.get_stats()["resyncs"] == 1
+
+def test_deletion_when_the_window_holds_everything_is_patched():
+    gmail, cache = GmailStub(messages=2), GmailSyncCache()
+    read(cache, gmail)
+    gmail.delete_message("m1")
+
+    assert ids(read(cache, gmail)) == ["m0"]
+    assert gmail.calls("messages") == 1
+
+def test_expired_history_id_relists():
+    gmail, cache = GmailStub(), GmailSyncCache()
+    read(cache, gmail)
+    gmail.add_message("m5")
+    gmail.expire_history()
+
+    assert ids(read(cache, gmail)) == ["m5", "m4", "m3"]
+    assert gmail.calls("messages") == 2
+    assert cache.get_stats()["resyncs"] == 1
+
+    # The new listing carries a fresh historyId, so the next read is a delta again
+    read(cache, gmail)
+    assert gmail.calls("messages") == 2
+
+def test_entry_older_than_ttl_relists_without_history():
+    gmail, cache = GmailStub(), GmailSyncCache(ttl=0)
+    read(cache, gmail)
+    read(cache, gmail)
+
+    assert gmail.calls("messages") == 2
+    assert gmail.calls("history") == 0
+    assert cache.get_stats()["misses"] == 2
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from gmail_scheduler import GmailQuotaScheduler, QuotaExceeded, TokenBucket, quota_cost, retry_after_seconds
+from oauth_stub import OAuthStub, TOKEN_URL
+from token_vault import TokenVault
+
+GMAIL = "https://gmail.googleapis.com/gmail/v1/users/me"
+
+def request(path: str, token: str = "access-0", method: str = "GET") -> httpx.Request:
+    return httpx.Request(method, f"{GMAIL}{path}", headers={"Authorization": f"Bearer {token}"})
+
+def test_quota_cost_follows_the_gmail_unit_table():
+    assert quota_cost(request("/messages/send", method="POST")) == 100
+    assert quota_cost(request("/messages")) == 5
+    assert quota_cost(request("/messages/abc")) == 5
+    assert quota_cost(request("/history")) == 2
+    assert quota_cost(request("/profile")) == 1
+
+def test_retry_after_accepts_seconds_and_falls_back():
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "3"})) == 3.0
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "soon"}), default=2.0) == 2.0
+    assert retry_after_seconds(httpx.Response(429)) == 1.0
+
+def test_bucket_waits_for_refill_and_pauses_on_retry_after():
+    bucket = TokenBucket(rate=10.0, capacity=10.0)
+    now = time.monotonic()
+    assert bucket.wait_time(10, now) == 0.0
+    bucket.take(10)
+    assert bucket.wait_time(5, now) == pytest.approx(0.5)
+
+    bucket.pause(30)
+    assert bucket.wait_time(1, time.monotonic()) > 29
+
+def test_bucket_follows_the_user_across_token_refreshes():
+    stub = OAuthStub()
+    client = stub.client()
+    vault = TokenVault(lambda: client, client_id="client", client_secret="secret", token_url=TOKEN_URL)
+    scheduler = GmailQuotaScheduler(resolve_user=vault.owner)
+    vault.store("user:1", "access-0", "refresh", time.time() + 60)
+
+    before = scheduler.user_key(request("/messages", "access-0"))
+    asyncio.run(vault.refresh("user:1"))
+    after = scheduler.user_key(request("/messages", "access-1"))
+
+    assert before == after == "user:1"
+    # A request still carrying the replaced token is charged to the same user
+    assert scheduler.user_key(request("/messages", "access-0")) == "user:1"
+    # Tokens the vault never saw fall back to their own bucket
+    assert scheduler.user_key(request("/messages", "stranger")).startswith("token:")
+
+def test_refreshed_token_does_not_get_a_fresh_budget():
+    vault = TokenVault(lambda: None)
+    scheduler = GmailQuotaScheduler(user_rate=1.0, user_burst=10.0, max_wait=0.05, resolve_user=vault.owner)
+    vault.store("user:1", "access-0", expires_at=time.time() + 60)
+
+    async def send(request):
+        return httpx.Response(200)
+
+    async def go():
+        await scheduler.handle(request("/messages", "access-0"), send)
+        await scheduler.handle(request("/messages", "access-0"), send)
+        vault.store("user:1", "access-1", expires_at=time.time() + 3600)
+        await scheduler.handle(request("/messages", "access-1"), send)
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(go())
+    assert scheduler.get_stats()["tracked_users"] == 1
+
+def test_users_are_served_in_rotation():
+    scheduler = GmailQuotaScheduler(user_rate=1000.0, user_burst=1000.0, global_rate=200.0, global_burst=5.0)
+    order = []
+
+    async def go():
+        # Drain the global burst so everything below queues
+        await scheduler.acquire("warmup", 5)
+
+        async def one(user_key):
+            await scheduler.acquire(user_key, 5)
+            order.append(user_key)
+
+        await asyncio.gather(*[one("heavy") for _ in range(4)], one("light"))
+
+    asyncio.run(go())
+    # The light user is not stuck behind the heavy user's backlog
+    assert order.index("light") <= 1
+
+def test_throttled_get_is_retried_after_retry_after():
+    scheduler = GmailQuotaScheduler()
+    responses = [httpx.Response(429, headers={"Retry-After": "0.01"}), httpx.Response(200)]
+
+    async def send(request):
+        return responses.pop(0)
+
+    res = asyncio.run(scheduler.handle(request("/messages"), send))
+    assert res.status_code == 200
+    assert scheduler.get_stats()["retried"] == 1
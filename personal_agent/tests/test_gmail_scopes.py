@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from gmail_scopes import validate_message_ids
+from gmail_stub import GmailStub
+
+CARD = {"metadata": {"data_scopes": ["ids", "metadata"]}}
+
+class StubPools:
+    def __init__(self, gmail: GmailStub):
+        self.gmail = gmail
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        return self.gmail.client()
+
+@pytest.fixture
+def observed(monkeypatch) -> list:
+    reads = []
+
+    async def observe_read(body, messages, kind="gmail_read"):
+        reads.append((kind, messages))
+
+    monkeypatch.setattr(main, "observe_read", observe_read)
+    return reads
+
+@pytest.fixture
+def gmail(monkeypatch) -> GmailStub:
+    gmail = GmailStub()
+
+    async def authorize(body):
+        return "token"
+
+    async def card(agent_id):
+        return CARD
+
+    monkeypatch.setattr(main, "authorize_gmail_read", authorize)
+    monkeypatch.setattr(main.agent_cards, "get", card)
+    monkeypatch.setattr(main, "pools", StubPools(gmail))
+    return gmail
+
+def post(path: str, body: dict) -> httpx.Response:
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+            return await client.post(path, json={"agent_id": "good_agent", "user_id": "1", **body})
+    return asyncio.run(go())
+
+def read_details(body: dict) -> httpx.Response:
+    return post("/proxy/gmail/read/details", body)
+
+def test_validate_message_ids_accepts_gmail_ids():
+    assert validate_message_ids(["18c2f0a1b2", "m1"]) == ["18c2f0a1b2", "m1"]
+
+@pytest.mark.parametrize("message_ids", [
+    ["../profile"],
+    ["m1", "../../../../oauth2/v3/userinfo"],
+    ["m1?format=raw"],
+    [["x"]],
+    [42],
+    "m1",
+    {"id": "m1"},
+    [],
+])
+def test_validate_message_ids_rejects_malformed_input(message_ids):
+    with pytest.raises(ValueError):
+        validate_message_ids(message_ids)
+
+def test_validate_message_ids_caps_the_list():
+    validate_message_ids(["m1"] * 3, max_ids=3)
+    with pytest.raises(ValueError):
+        validate_message_ids(["m1"] * 4, max_ids=3)
+
+@pytest.mark.parametrize("message_ids", [
+    ["../profile", "../../../../oauth2/v3/userinfo"],
+    [["x"]],
+    "m1",
+])
+def test_details_endpoint_rejects_bad_ids_before_any_fetch(gmail, message_ids):
+    res = read_details({"message_ids": message_ids})
+
+    assert res.status_code == 400
+    assert gmail.requests == []
+
+def test_page_read_is_recorded_by_messages_returned(gmail, observed):
+    res = post("/proxy/gmail/read", {"scopes": ["ids"], "page_size": 10, "page_token": "3"})
+
+    assert len(res.json()["messages"]) == 2
+    assert observed == [("gmail_read", 2)]
+
+def test_details_read_is_recorded_by_messages_returned(gmail, observed):
+    res = read_details({"message_ids": ["m1", "gone", "m3"]})
+
+    assert res.status_code == 200
+    assert len(res.text.splitlines()) == 3
+    assert observed == [("gmail_read_details", 2)]
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import httpx
+
+from gmail_stream import PageTokenScanner, StreamTally, iter_message_pages
+from gmail_stub import GmailStub
+
+def stream(gmail: GmailStub, page_size: int, max_pages: int, tally: StreamTally):
+    async def go():
+        async with gmail.client() as client:
+            return b"".join([chunk async for chunk in iter_message_pages(
+                client, "token", page_size, max_pages=max_pages, tally=tally
+            )])
+    return asyncio.run(go())
+
+def test_scanner_counts_messages_split_across_chunks():
+    body = json.dumps({"messages": [{"id": f"m{i}", "threadId": f"t{i}"} for i in range(7)],
+                       "nextPageToken": "42"}).encode()
+    scanner = PageTokenScanner(overlap=16)
+    for i in range(0, len(body), 5):
+        scanner.feed(body[i:i + 5])
+
+    assert scanner.messages == 7
+    assert scanner.token == "42"
+
+def test_tally_counts_what_was_streamed_not_what_was_asked_for():
+    gmail = GmailStub(messages=25)
+    tally = StreamTally()
+    lines = stream(gmail, page_size=10, max_pages=20, tally=tally).splitlines()
+
+    assert [len(json.loads(line)["messages"]) for line in lines] == [10, 10, 5]
+    assert tally.pages == 3
+    assert tally.messages == 25
+
+def test_tally_stops_at_max_pages():
+    gmail = GmailStub(messages=25)
+    tally = StreamTally()
+    stream(gmail, page_size=10, max_pages=1, tally=tally)
+
+    assert tally.pages == 1
+    assert tally.messages == 10
+
+def test_transport_failure_on_a_later_page_ends_with_an_error_line():
+    gmail = GmailStub(messages=25)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.params.get("pageToken"):
+            raise httpx.ReadError("connection reset", request=request)
+        return gmail.handler(request)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return b"".join([chunk async for chunk in iter_message_pages(client, "token", 10, max_pages=3)])
+
+    lines = [json.loads(line) for line in asyncio.run(go()).splitlines()]
+
+    assert len(lines[0]["messages"]) == 10
+    assert lines[1]["error"]["status"] == 502
+    assert len(lines) == 2
+
+def test_page_cut_off_mid_body_still_gets_its_own_error_line():
+    class Truncated(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"messages": [{"id": "m1"'
+            raise httpx.ReadTimeout("timed out")
+
+    async def go():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=Truncated()))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return b"".join([chunk async for chunk in iter_message_pages(client, "token", 10, max_pages=2)])
+
+    lines = asyncio.run(go()).splitlines()
+
+    assert lines[0] == b'{"messages": [{"id": "m1"'
+    assert json.loads(lines[1])["error"]["status"] == 502
@@ -0,0 +1,7 @@
+import http_pools
+from http_pools import UpstreamConfig, UpstreamPool
+
+def test_http2_falls_back_to_http11_without_h2(monkeypatch):
+    monkeypatch.setattr(http_pools.importlib.util, "find_spec", lambda name: None)
+    assert UpstreamPool("gmail", UpstreamConfig(http2=True)).http2 is False
+    assert UpstreamPool("gmail", UpstreamConfig(http2=False)).http2 is False
@@ -0,0 +1,18 @@
+import base64
+
+from mime_normalizer import normalize_batch
+
+def full_message(message_id: str, data: str) -> dict:
+    return {"id": message_id, "threadId": f"t-{message_id}",
+            "payload": {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": "Hi"}], "body": {"data": data}}}
+
+def test_malformed_body_fails_only_that_message():
+    good = full_message("m1", base64.urlsafe_b64encode(b"hello  there").decode())
+    messages = [good, full_message("m2", "a"), {"id": "m3", "raw": "a"}]
+
+    first, second, third = normalize_batch(messages, max_bytes=1_000_000, max_chars=20_000)
+
+    assert first["body"] == "hello there"
+    assert first["headers"] == {"Subject": "Hi"}
+    assert second["id"] == "m2" and second["error"]["status"] == 502
+    assert third["id"] == "m3" and "error" in third
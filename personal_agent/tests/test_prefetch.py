@@ -0,0 +1,89 @@
+import asyncio
+
+from delegations import DelegationRegistry
+from openfga_stub import OpenFGAStub
+from personal_agent_adk import OpenFGATool
+from prefetch import PrefetchSlots
+from token_vault import TokenVault
+
+KEY = ("user:1", "good_agent")
+
+def listing(n: int = 0):
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return {"messages": [{"id": str(n)}]}
+    return fetch
+
+def test_prefetched_listing_is_served_once():
+    slots = PrefetchSlots()
+
+    async def go():
+        slots.start(KEY, listing())
+        return await slots.take(KEY), await slots.take(KEY)
+
+    first, second = asyncio.run(go())
+
+    assert first == {"messages": [{"id": "0"}]}
+    assert second is None
+    assert slots.get_stats()["served"] == 1
+
+def test_parked_prefetch_is_not_restarted():
+    slots = PrefetchSlots()
+
+    async def go():
+        slots.start(KEY, listing(0))
+        slots.start(KEY, listing(1))
+        return await slots.take(KEY)
+
+    assert asyncio.run(go()) == {"messages": [{"id": "0"}]}
+    assert slots.started == 1
+
+def test_expired_prefetch_is_not_served():
+    slots = PrefetchSlots(ttl=0.01)
+
+    async def go():
+        slots.start(KEY, listing())
+        await asyncio.sleep(0.02)
+        return await slots.take(KEY)
+
+    assert asyncio.run(go()) is None
+    assert slots.get_stats()["expired"] == 1
+
+def test_failed_prefetch_falls_back_to_a_direct_read():
+    slots = PrefetchSlots()
+
+    async def fetch():
+        raise ConnectionError("gmail down")
+
+    async def go():
+        slots.start(KEY, fetch)
+        return await slots.take(KEY)
+
+    assert asyncio.run(go()) is None
+    assert slots.get_stats()["failed"] == 1
+
+def test_revoking_the_delegation_discards_the_running_prefetch():
+    slots = PrefetchSlots()
+    tool = OpenFGATool("http://openfga", "store", OpenFGAStub())
+    registry = DelegationRegistry(tool, TokenVault(lambda: None, client_id="c", client_secret="s", token_url="http://oauth/token"))
+    registry.revoke_listeners.append(lambda user_id, agent_id: slots.discard((user_id, agent_id)))
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def go():
+        await registry.acquire(*KEY, "token")
+        slots.start(KEY, fetch)
+        await asyncio.sleep(0)
+        await registry.revoke(*KEY)
+        await asyncio.sleep(0)
+        return await slots.take(KEY)
+
+    assert asyncio.run(go()) is None
+    assert cancelled == [True]
+    assert slots.get_stats() == {"parked": 0, "started": 1, "served": 0, "discarded": 1, "expired": 0, "failed": 0}
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    started = []
+
+    async def fetch():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return {"messages": []}
+
+    async def go():
+        return await asyncio.gather(*[flights.do("user:1", fetch) for _ in range(5)])
+
+    results = asyncio.run(go())
+
+    assert started == [1]
+    assert all(r is results[0] for r in results)
+    assert flights.get_stats() == {
+        "calls": 5, "executions": 1, "coalesced": 4, "coalesced_ratio": 0.8, "in_flight": 0,
+    }
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+
+    async def go():
+        return await asyncio.gather(flights.do("a", lambda: asyncio.sleep(0.01, "a")),
+                                    flights.do("b", lambda: asyncio.sleep(0.01, "b")))
+
+    assert asyncio.run(go()) == ["a", "b"]
+    assert flights.executions == 2
+
+def test_finished_flight_is_not_reused():
+    flights = SingleFlight()
+    counter = iter(range(10))
+
+    async def fetch():
+        return next(counter)
+
+    async def go():
+        return [await flights.do("user:1", fetch) for _ in range(2)]
+
+    assert asyncio.run(go()) == [0, 1]
+
+def test_error_reaches_every_waiter_and_the_next_call_retries():
+    flights = SingleFlight()
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise ConnectionError("upstream down")
+        return "ok"
+
+    async def go():
+        results = await asyncio.gather(*[flights.do("k", fetch) for _ in range(3)], return_exceptions=True)
+        return results, await flights.do("k", fetch)
+
+    results, retried = asyncio.run(go())
+
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert retried == "ok"
+    assert len(attempts) == 2
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def go():
+        impatient = asyncio.ensure_future(flights.do("k", fetch))
+        patient = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0.005)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(go()) == "done"
+    assert flights.executions == 1
@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+
+import main
+from personal_agent_adk import AgentSubsystems, PersonalAgent
+
+class StubPools:
+    def client(self, name: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+def test_personal_agent_uses_the_subsystems_it_is_given():
+    subsystems = AgentSubsystems()
+    agent = PersonalAgent(subsystems)
+
+    assert agent.delegations is subsystems.delegations
+    assert agent.openfga_tool is subsystems.openfga_tool
+    assert agent.tools["openfga_manage"] is subsystems.openfga_tool
+    assert agent._get_stats().keys() == subsystems.get_stats().keys()
+
+def test_subsystems_are_wired_to_each_other(monkeypatch):
+    monkeypatch.setenv("GMAIL_PREFETCH", "true")
+    subsystems = AgentSubsystems({"good_agent": "http://good_agent:8003"})
+
+    assert subsystems.openfga_tool.audit is subsystems.audit
+    assert subsystems.denials.clear_for_tuples in subsystems.openfga_tool.write_listeners
+    assert subsystems.agent_cards.agent_urls == {"good_agent": "http://good_agent:8003"}
+    assert subsystems.gmail_scheduler.resolve_user == subsystems.token_storage.owner
+
+    async def go():
+        subsystems.prefetch.start(("user:1", "good_agent"), lambda: asyncio.sleep(1))
+        await subsystems.delegations.revoke("user:1", "good_agent")
+
+    subsystems.openfga_tool.pools = StubPools()
+    asyncio.run(go())
+    assert subsystems.prefetch.get_stats()["discarded"] == 1
+
+def test_main_serves_stats_from_the_shared_subsystems(monkeypatch):
+    monkeypatch.setattr(main.admin, "allows", lambda authorization: True)
+
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+            return await client.get("/stats")
+
+    res = asyncio.run(go())
+
+    assert res.status_code == 200
+    assert res.json().keys() == main.subsystems.get_stats().keys()
+    assert main.delegations is main.subsystems.delegations
@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+from oauth_stub import OAuthStub, TOKEN_URL
+from token_vault import TokenVault, TokenRefreshError
+
+def make_vault(stub: OAuthStub, **kwargs) -> TokenVault:
+    client = stub.client()
+    return TokenVault(lambda: client, client_id="client", client_secret="secret", token_url=TOKEN_URL, **kwargs)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_fresh_token_is_served_without_refreshing():
+    stub = OAuthStub()
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() + 3600)
+
+    assert run(vault.access_token("user:1")) == "access-0"
+    assert stub.requests == []
+
+def test_token_inside_the_margin_is_refreshed():
+    stub = OAuthStub()
+    vault = make_vault(stub, refresh_margin=300)
+    vault.store("user:1", "access-0", "refresh", time.time() + 60)
+
+    assert run(vault.access_token("user:1")) == "access-1"
+    assert stub.requests == [{
+        "grant_type": "refresh_token",
+        "refresh_token": "refresh",
+        "client_id": "client",
+        "client_secret": "secret",
+    }]
+    assert vault.get_stats()["refreshes"] == 1
+
+def test_concurrent_callers_share_one_refresh():
+    stub = OAuthStub(delay=0.05)
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() + 10)
+
+    async def go():
+        return await asyncio.gather(*[vault.access_token("user:1") for _ in range(10)])
+
+    assert run(go()) == ["access-1"] * 10
+    assert len(stub.requests) == 1
+
+def test_invalid_grant_drops_the_refresh_token():
+    stub = OAuthStub()
+    stub.failure = "invalid_grant"
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() - 1)
+
+    assert run(vault.access_token("user:1")) is None
+    assert run(vault.access_token("user:1")) is None
+    # Not retried once the grant is known to be dead
+    assert len(stub.requests) == 1
+    assert vault.get_stats()["refreshable"] == 0
+    with pytest.raises(TokenRefreshError):
+        run(vault.refresh("user:1"))
+
+def test_unreachable_token_endpoint_raises_the_vault_error():
+    stub = OAuthStub()
+    stub.failure = "unreachable"
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() + 60)
+
+    with pytest.raises(TokenRefreshError, match="unreachable"):
+        run(vault.refresh("user:1"))
+    # access_token() falls back to the still-valid token instead of failing the request
+    assert run(vault.access_token("user:1")) == "access-0"
+    assert vault.get_stats()["refresh_failures"] == 2
+
+def test_unreachable_token_endpoint_with_an_expired_token_gives_no_token():
+    stub = OAuthStub()
+    stub.failure = "unreachable"
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() - 1)
+
+    assert run(vault.access_token("user:1")) is None
+    assert vault.get_stats()["expired_misses"] == 1
+
+def test_server_error_keeps_the_refresh_token():
+    stub = OAuthStub()
+    stub.failure = "server_error"
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() + 60)
+
+    assert run(vault.access_token("user:1")) == "access-0"
+    stub.failure = None
+    assert run(vault.access_token("user:1")) == "access-1"
+
+def test_token_without_expiry_never_replaces_a_known_one():
+    stub = OAuthStub()
+    vault = make_vault(stub)
+    vault.store("user:1", "access-0", "refresh", time.time() + 60)
+    assert run(vault.access_token("user:1")) == "access-1"
+
+    # The marketplace pushes its (older) token again without an expiry
+    vault.store("user:1", "access-0", "refresh")
+    assert run(vault.access_token("user:1")) == "access-1"
+
+def test_older_token_is_ignored_and_newer_one_kept():
+    vault = make_vault(OAuthStub())
+    now = time.time()
+    vault.store("user:1", "new", "refresh", now + 3000)
+    vault.store("user:1", "old", "refresh", now + 1000)
+    assert run(vault.access_token("user:1")) == "new"
+
+    vault.store("user:1", "newer", None, now + 3500)
+    assert run(vault.access_token("user:1")) == "newer"
+    # The refresh token survives a store that does not carry one
+    assert vault.get_stats()["refreshable"] == 1
+
+def test_token_of_unknown_expiry_is_replaced_by_any_later_store():
+    vault = make_vault(OAuthStub())
+    vault.store("user:1", "first")
+    vault.store("user:1", "second")
+    assert run(vault.access_token("user:1")) == "second"
+
+    vault.store("user:1", "known", expires_at=time.time() + 100)
+    assert run(vault.access_token("user:1")) == "known"
+
+def test_background_loop_refreshes_before_expiry():
+    stub = OAuthStub()
+    vault = make_vault(stub, refresh_margin=300)
+
+    async def go():
+        await vault.start()
+        vault.store("user:1", "access-0", "refresh", time.time() + 60)
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if vault.background_refreshes:
+                break
+        await vault.stop()
+
+    run(go())
+    assert vault.get_stats()["background_refreshes"] == 1
+    assert run(vault.access_token("user:1")) == "access-1"
+    assert len(stub.requests) == 1
+
+def test_tokens_are_sealed_in_memory():
+    vault = make_vault(OAuthStub())
+    vault.store("user:1", "access-0", "refresh-0", time.time() + 3600)
+    entry = vault._entries["user:1"]
+
+    if vault.get_stats()["encrypted"]:
+        assert b"access-0" not in entry.access_token
+        assert b"refresh-0" not in entry.refresh_token
+    assert run(vault.access_token("user:1")) == "access-0"
@@ -0,0 +1,264 @@
+"""
+Token vault for delegated Gmail access
+Holds users' OAuth tokens encrypted in memory, tracks their expiry and refreshes
+them in the background (one refresh per user at a time) before Gmail rejects them
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import httpx
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:  # optional: pip install cryptography
+    Fernet = None
+
+class TokenRefreshError(Exception):
+    """The token endpoint did not return a new access token"""
+
+class _Sealer:
+    """Fernet with a per-process key, or a passthrough when 'cryptography' is missing"""
+
+    def __init__(self, key: Optional[bytes] = None):
+        self.encrypted = Fernet is not None
+        if self.encrypted:
+            self._fernet = Fernet(key or Fernet.generate_key())
+        else:
+            logger.warning("'cryptography' is not installed; the token vault keeps tokens unencrypted in memory")
+
+    def seal(self, value: Optional[str]) -> Optional[bytes]:
+        if value is None:
+            return None
+        return self._fernet.encrypt(value.encode()) if self.encrypted else value.encode()
+
+    def open(self, sealed: Optional[bytes]) -> Optional[str]:
+        if sealed is None:
+            return None
+        return (self._fernet.decrypt(sealed) if self.encrypted else sealed).decode()
+
+class _Entry:
+    def __init__(self, access_token: bytes, refresh_token: Optional[bytes], expires_at: float, expiry_known: bool = True):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at  # wall clock, as issued by the token endpoint
+        # False when the issuer gave no expiry and expires_at is only the default_ttl guess
+        self.expiry_known = expiry_known
+
+def _fingerprint(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+class TokenVault:
+    """Per-user access/refresh tokens with proactive, single-flight refresh"""
+
+    def __init__(self,
+                 client: Callable[[], httpx.AsyncClient],
+                 client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None,
+                 token_url: str = GOOGLE_TOKEN_URL,
+                 refresh_margin: float = 300.0,
+                 default_ttl: float = 3600.0,
+                 key: Optional[bytes] = None):
+        self.client = client
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._sealer = _Sealer(key)
+        self._entries: Dict[str, _Entry] = {}
+        # Access-token fingerprint -> (user_id, expires_at), kept until the token expires so
+        # requests still carrying a token replaced by a refresh are attributed to the same user
+        self._owners: Dict[str, Tuple[str, float]] = {}
+        self._flights = SingleFlight()
+        self._wakeup = asyncio.Event()
+        self._refresher: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.refresh_failures = 0
+        self.expired_misses = 0
+
+    @classmethod
+    def from_env(cls, client: Callable[[], httpx.AsyncClient]) -> 'TokenVault':
+        """Refresh with the marketplace's Google OAuth client; TOKEN_VAULT_KEY is a Fernet key (random if empty)"""
+        key = os.environ.get("TOKEN_VAULT_KEY")
+        return cls(
+            client,
+            client_id=os.environ.get("GOOGLE_CLIENT_ID"),
+            client_secret=os.environ.get("GOOGLE_CLIENT_SECRET"),
+            token_url=os.environ.get("GOOGLE_TOKEN_URL", GOOGLE_TOKEN_URL),
+            refresh_margin=float(os.environ.get("TOKEN_REFRESH_MARGIN", "300")),
+            default_ttl=float(os.environ.get("TOKEN_DEFAULT_TTL", "3600")),
+            key=key.encode() if key else None,
+        )
+
+    @property
+    def can_refresh(self) -> bool:
+        return bool(self.client_id and self.client_secret)
+
+    def store(self,
+              user_id: str,
+              access_token: str,
+              refresh_token: Optional[str] = None,
+              expires_at: Optional[float] = None):
+        """Keep the user's tokens; a token older than the one held (e.g. already refreshed here) is ignored"""
+        self._own(access_token, user_id, expires_at if expires_at is not None else time.time() + self.default_ttl)
+        entry = self._entries.get(user_id)
+        # A token of unknown age never replaces one whose expiry is known
+        if entry is not None and entry.expiry_known and (expires_at is None or entry.expires_at > expires_at):
+            if refresh_token is not None and entry.refresh_token is None:
+                entry.refresh_token = self._sealer.seal(refresh_token)
+            return
+        sealed_refresh = self._sealer.seal(refresh_token) if refresh_token is not None else (
+            entry.refresh_token if entry is not None else None
+        )
+        self._entries[user_id] = _Entry(
+            self._sealer.seal(access_token),
+            sealed_refresh,
+            expires_at if expires_at is not None else time.time() + self.default_ttl,
+            expiry_known=expires_at is not None,
+        )
+        self._wakeup.set()
+
+    def _own(self, access_token: str, user_id: str, expires_at: float):
+        now = time.time()
+        if len(self._owners) >= 2 * len(self._entries) + 16:
+            self._owners = {fp: owner for fp, owner in self._owners.items() if owner[1] > now}
+        self._owners[_fingerprint(access_token)] = (user_id, expires_at)
+
+    def owner(self, access_token: str) -> Optional[str]:
+        """The user an access token was issued to, across refreshes, while it is unexpired"""
+        owner = self._owners.get(_fingerprint(access_token))
+        if owner is None or owner[1] <= time.time():
+            return None
+        return owner[0]
+
+    def discard(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def _refreshable(self, entry: _Entry) -> bool:
+        return self.can_refresh and entry.refresh_token is not None
+
+    async def access_token(self, user_id: str) -> Optional[str]:
+        """A usable access token for the user, refreshing first if it is about to expire"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry.expires_at - time.time() < self.refresh_margin and self._refreshable(entry):
+            try:
+                await self.refresh(user_id)
+            except TokenRefreshError as e:
+                logger.warning(f"Token refresh for {user_id} failed: {str(e)}")
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+        if entry.expires_at <= time.time():
+            self.expired_misses += 1
+            return None
+        return self._sealer.open(entry.access_token)
+
+    async def refresh(self, user_id: str):
+        """Exchange the user's refresh token; concurrent callers share one request"""
+        await self._flights.do(("refresh", user_id), lambda: self._refresh(user_id))
+
+    async def _refresh(self, user_id: str):
+        entry = self._entries.get(user_id)
+        if entry is None or not self._refreshable(entry):
+            raise TokenRefreshError("No refresh token available for user")
+
+        try:
+            res = await self.client().post(self.token_url, data={
+                "grant_type": "refresh_token",
+                "refresh_token": self._sealer.open(entry.refresh_token),
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+            })
+        except httpx.HTTPError as e:
+            self.refresh_failures += 1
+            raise TokenRefreshError(f"Token endpoint unreachable: {str(e)}") from e
+        if res.is_error:
+            self.refresh_failures += 1
+            # invalid_grant: the user revoked access or the refresh token expired; stop retrying it
+            if res.status_code in (400, 401) and self._entries.get(user_id) is entry:
+                entry.refresh_token = None
+            raise TokenRefreshError(f"Token endpoint returned {res.status_code}")
+
+        try:
+            token = res.json()
+            access_token = token["access_token"]
+        except (ValueError, KeyError, TypeError) as e:
+            self.refresh_failures += 1
+            raise TokenRefreshError(f"Malformed token endpoint response: {str(e)}") from e
+        self.refreshes += 1
+        # Only if the delegation was not released while the request was in flight
+        if self._entries.get(user_id) is entry:
+            expires_at = time.time() + float(token.get("expires_in", self.default_ttl))
+            self._own(access_token, user_id, expires_at)
+            self._entries[user_id] = _Entry(
+                self._sealer.seal(access_token),
+                self._sealer.seal(token["refresh_token"]) if token.get("refresh_token") else entry.refresh_token,
+                expires_at,
+            )
+
+    async def start(self):
+        if self._refresher is None and self.can_refresh:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        """Refresh tokens entering the margin, then sleep until the next one does"""
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due = [user_id for user_id, entry in self._entries.items()
+                   if self._refreshable(entry) and entry.expires_at - now < self.refresh_margin]
+            for user_id, result in zip(due, await asyncio.gather(*[self.refresh(u) for u in due], return_exceptions=True)):
+                if isinstance(result, Exception):
+                    logger.warning(f"Background token refresh for {user_id} failed: {str(result)}")
+                else:
+                    self.background_refreshes += 1
+
+            now = time.time()
+            upcoming = [entry.expires_at - self.refresh_margin - now
+                        for entry in self._entries.values() if self._refreshable(entry)]
+            # Failed refreshes are retried after a short back-off rather than in a tight loop
+            sleep = max(5.0, min(upcoming, default=self.refresh_margin))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "tokens": len(self._entries),
+            "refreshable": sum(1 for entry in self._entries.values() if self._refreshable(entry)),
+            "expired": sum(1 for entry in self._entries.values() if entry.expires_at <= now),
+            "encrypted": self._sealer.encrypted,
+            "refreshes": self.refreshes,
+            "background_refreshes": self.background_refreshes,
+            "refresh_failures": self.refresh_failures,
+            "coalesced_refreshes": self._flights.coalesced,
+            "expired_misses": self.expired_misses,
+        }
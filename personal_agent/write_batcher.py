@@ -0,0 +1,141 @@
+"""
+Micro-batching writer for OpenFGA tuple writes
+Collects grants and deletes from concurrent callers for a short window and
+sends them as a single /write call, while each caller still gets its own result
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable, Awaitable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TupleKey = Tuple[str, str, str]
+SendWrite = Callable[[List[Dict[str, str]], List[Dict[str, str]]], Awaitable[httpx.Response]]
+
+class _PendingWrite:
+    """One caller's writes/deletes waiting for the next flush"""
+    def __init__(self, writes: List[Dict[str, str]], deletes: List[Dict[str, str]], future: asyncio.Future):
+        self.writes = writes
+        self.deletes = deletes
+        self.future = future
+
+class TupleWriteBatcher:
+    """Coalesces concurrent tuple writes into one OpenFGA /write per flush window"""
+
+    def __init__(self, send: SendWrite, window: float = 0.005, max_batch_size: int = 100):
+        self.send = send
+        self.window = window
+        # OpenFGA rejects writes with more than 100 tuples by default
+        self.max_batch_size = max_batch_size
+        self._pending: List[_PendingWrite] = []
+        self._pending_keys: Set[TupleKey] = set()
+        self._pending_size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Batches are flushed strictly in the order they were sealed
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.tuples = 0
+        self.split_retries = 0
+
+    @staticmethod
+    def _key(tuple_key: Dict[str, str]) -> TupleKey:
+        return (tuple_key["user"], tuple_key["relation"], tuple_key["object"])
+
+    async def submit(self, writes: List[Dict[str, str]], deletes: List[Dict[str, str]]) -> httpx.Response:
+        """Queue a write and wait for the response of the batch that carried it"""
+        keys = {self._key(k) for k in writes + deletes}
+        size = len(writes) + len(deletes)
+
+        # OpenFGA refuses a request that touches the same tuple twice, so a
+        # conflicting or overflowing write starts a new batch
+        if self._pending and (keys & self._pending_keys or self._pending_size + size > self.max_batch_size):
+            self._seal()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingWrite(writes, deletes, future))
+        self._pending_keys |= keys
+        self._pending_size += size
+        self.requests += 1
+
+        if self._pending_size >= self.max_batch_size:
+            self._seal()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._seal)
+
+        return await future
+
+    def _seal(self):
+        """Close the pending batch and schedule its flush"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_keys = set()
+        self._pending_size = 0
+
+        task = asyncio.create_task(self._flush(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: List[_PendingWrite]):
+        async with self._flush_lock:
+            writes = [k for p in batch for k in p.writes]
+            deletes = [k for p in batch for k in p.deletes]
+            self.batches += 1
+            self.tuples += len(writes) + len(deletes)
+
+            try:
+                res = await self.send(writes, deletes)
+            except Exception as e:
+                for pending in batch:
+                    self._resolve(pending, exception=e)
+                return
+
+            if res.is_success or len(batch) == 1:
+                for pending in batch:
+                    self._resolve(pending, response=res)
+                return
+
+            # One bad tuple fails the whole atomic write; retry each caller on
+            # its own so only the offending caller sees the failure
+            logger.info(f"Batched OpenFGA write of {len(batch)} requests failed ({res.status_code}), retrying individually")
+            self.split_retries += 1
+            for pending in batch:
+                try:
+                    self._resolve(pending, response=await self.send(pending.writes, pending.deletes))
+                except Exception as e:
+                    self._resolve(pending, exception=e)
+
+    @staticmethod
+    def _resolve(pending: _PendingWrite, response: Optional[httpx.Response] = None, exception: Optional[Exception] = None):
+        if pending.future.done():
+            return
+        if exception is not None:
+            pending.future.set_exception(exception)
+        else:
+            pending.future.set_result(response)
+
+    async def close(self):
+        """Flush anything still pending and wait for in-flight batches"""
+        self._seal()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "tuples": self.tuples,
+            "requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "split_retries": self.split_retries,
+            "pending": len(self._pending),
+        }